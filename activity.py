@@ -0,0 +1,103 @@
+import atexit
+import logging
+import os
+import threading
+from datetime import datetime
+
+from sqlalchemy import bindparam, update
+
+from extensions import db
+
+
+class ActivityTracker:
+    """Coalesces UserSession.last_active bumps into periodic batched updates.
+
+    touch() only records the time in memory. A background thread writes all
+    pending sessions with one executemany UPDATE every flush interval, or
+    sooner once flush_size sessions are waiting, so a crash loses at most
+    one flush window of activity timestamps.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.flushes = 0
+        self.rows_written = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.flush_interval = app.config.setdefault('ACTIVITY_FLUSH_INTERVAL', float(os.environ.get('ACTIVITY_FLUSH_INTERVAL', 5)))
+        self.flush_size = app.config.setdefault('ACTIVITY_FLUSH_SIZE', int(os.environ.get('ACTIVITY_FLUSH_SIZE', 500)))
+        app.extensions['activity_tracker'] = self
+        atexit.register(self.flush)
+
+    def touch(self, session_id, when=None):
+        """Record activity for a session; written on the next flush"""
+        self._ensure_thread()
+        with self._lock:
+            self._pending[session_id] = when or datetime.utcnow()
+            if len(self._pending) >= self.flush_size:
+                self._wake.set()
+
+    def flush(self):
+        """Write all pending activity timestamps in one batched UPDATE"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        table = db.metadata.tables['user_session']
+        statement = (
+            update(table)
+            .where(table.c.session_id == bindparam('sid'))
+            .values(last_active=bindparam('ts'))
+        )
+        rows = [{'sid': session_id, 'ts': when} for session_id, when in pending.items()]
+        with self.app.app_context():
+            try:
+                with db.engine.begin() as connection:
+                    connection.execute(statement, rows)
+                self.flushes += 1
+                self.rows_written += len(rows)
+            except Exception as e:
+                logging.error(f"Error flushing session activity: {e}")
+                # Put the timestamps back unless a newer touch replaced them
+                with self._lock:
+                    for session_id, when in pending.items():
+                        self._pending.setdefault(session_id, when)
+                return 0
+        return len(rows)
+
+    def stats(self):
+        return {
+            'pending': len(self._pending),
+            'flushes': self.flushes,
+            'rows_written': self.rows_written
+        }
+
+    def _ensure_thread(self):
+        # Started lazily, and restarted in a forked worker (threads do not survive fork)
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='activity-flush', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+
+# Global instance
+activity_tracker = ActivityTracker()
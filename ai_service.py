@@ -1,21 +1,24 @@
 import random
 import logging
-import re
-import json
-from textblob import TextBlob
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import numpy as np
-from models import Conversation
+import os
+from retrieval import retrieval_index
+from session_state import session_states
+from text_pipeline import TextPipeline, analysis_key
+from cache import LRUCache
 
 # Enhanced mental health response patterns and templates
 class LocalAIService:
     def __init__(self):
-        self.vectorizer = TfidfVectorizer(stop_words='english', max_features=1000)
         self.response_patterns = self._load_response_patterns()
         self.coping_strategies = self._load_coping_strategies()
         self.crisis_keywords = ['suicide', 'kill myself', 'end it all', 'want to die', 'hurt myself', 'self harm', 'no point living']
         self.emotion_keywords = self._load_emotion_keywords()
+        # Recurring concerns picked up by _add_context_personalization
+        self.theme_keywords = {'work': ['work'], 'sleep': ['sleep', 'tired']}
+        self.pipeline = TextPipeline(self.emotion_keywords, self.crisis_keywords, self.theme_keywords)
+        # Analysis of short messages ("I'm stressed", "hi"), which repeat across sessions
+        self.analysis_cache = LRUCache(max_size=int(os.environ.get('ANALYSIS_CACHE_SIZE', 4096)))
+        self.analysis_cache_max_chars = int(os.environ.get('ANALYSIS_CACHE_MAX_CHARS', 200))
         
     def _load_emotion_keywords(self):
         """Enhanced emotion detection keywords"""
@@ -155,55 +158,52 @@ class LocalAIService:
         }
     
     def detect_emotions(self, text):
-        """Detect multiple emotions in text using enhanced keyword matching"""
-        text_lower = text.lower()
-        detected_emotions = []
-        emotion_scores = {}
-        
-        # Check for each emotion
-        for emotion, keywords in self.emotion_keywords.items():
-            score = 0
-            for keyword in keywords:
-                if keyword in text_lower:
-                    # Give higher weight to exact matches
-                    if f" {keyword} " in f" {text_lower} ":
-                        score += 2
-                    else:
-                        score += 1
-            
-            if score > 0:
-                emotion_scores[emotion] = score
-                detected_emotions.append(emotion)
-        
-        # Sort emotions by score (highest first)
-        if emotion_scores:
-            sorted_emotions = sorted(emotion_scores.items(), key=lambda x: x[1], reverse=True)
-            return [emotion for emotion, score in sorted_emotions]
-        
-        return ['neutral']
+        """Detect multiple emotions in text using the compiled keyword matcher"""
+        return self.pipeline.emotions(self.pipeline.analyze(text)) or ['neutral']
+    
+    def detect_emotions_batch(self, texts):
+        """Detect emotions for many texts in one pass over the whole batch"""
+        _, scores = self.pipeline.score_batch(texts)
+        return [ranked or ['neutral'] for ranked in self.pipeline.rank_batch(scores)]
     
     def _analyze_text_sentiment(self, text):
-        """Analyze text using TextBlob for additional sentiment context"""
+        """Map lexicon polarity to a backup emotion for additional sentiment context"""
         try:
-            blob = TextBlob(text)
-            polarity = getattr(blob.sentiment, 'polarity', 0.0)
-            
-            if polarity > 0.3:
-                return 'happiness'
-            elif polarity < -0.3:
-                return 'sadness'
-            elif polarity < -0.1:
-                return 'depression'
-            else:
-                return 'neutral'
+            return self._polarity_emotion(self.pipeline.polarity(self.pipeline.analyze(text)))
         except Exception as e:
             logging.error(f"Error in sentiment analysis: {e}")
             return 'neutral'
     
+    def _polarity_emotion(self, polarity):
+        """Map a polarity score to the backup emotion"""
+        if polarity > 0.3:
+            return 'happiness'
+        elif polarity < -0.3:
+            return 'sadness'
+        elif polarity < -0.1:
+            return 'depression'
+        else:
+            return 'neutral'
+    
+    def _analyze_text_sentiment_batch(self, texts):
+        """Map lexicon polarity to a backup emotion for each text"""
+        import numpy as np
+        
+        try:
+            polarities = np.array(self.pipeline.polarity_batch(texts), dtype=np.float64)
+        except Exception as e:
+            logging.error(f"Error in sentiment analysis: {e}")
+            polarities = np.zeros(len(texts))
+        
+        return np.select(
+            [polarities > 0.3, polarities < -0.3, polarities < -0.1],
+            ['happiness', 'sadness', 'depression'],
+            default='neutral'
+        ).tolist()
+    
     def _check_crisis_indicators(self, text):
         """Check for crisis-related keywords"""
-        text_lower = text.lower()
-        return any(keyword in text_lower for keyword in self.crisis_keywords)
+        return self.pipeline.is_crisis(self.pipeline.analyze(text))
     
     def _get_crisis_response(self):
         """Return appropriate crisis response"""
@@ -218,18 +218,78 @@ You don't have to go through this alone. There are people who want to help you,
     def generate_response(self, user_message, session_id):
         """Generate AI response using enhanced emotion detection and memory"""
         try:
-            # Check for crisis indicators first
-            if self._check_crisis_indicators(user_message):
-                return self._get_crisis_response(), ['crisis'], 'crisis', -1.0
-            
-            # Get conversation context for better memory
-            context = self._get_conversation_context(session_id, limit=5)
+            base_response, detected_emotions, primary_emotion, sentiment_score = self.generate_base_response(user_message, session_id)
+            return base_response + self.generate_follow_up(primary_emotion, user_message), detected_emotions, primary_emotion, sentiment_score
             
+        except Exception as e:
+            logging.error(f"Error generating local AI response: {e}")
+            return self._get_fallback_response(), ['neutral'], 'neutral', 0.0
+    
+    def generate_base_response(self, user_message, session_id):
+        """First part of the response: emotion analysis plus the empathetic reply.
+        
+        generate_response appends generate_follow_up to this; streaming callers
+        can send it as soon as it is ready.
+        """
+        detected_emotions, primary_emotion, sentiment_score, is_crisis, themes = self._analyze(user_message)
+        detected_emotions = list(detected_emotions)
+        if is_crisis:
+            return self._get_crisis_response(), detected_emotions, primary_emotion, sentiment_score
+        
+        # Running emotional state of the whole session (one small row, usually cached)
+        state = session_states.get(session_id)
+        
+        # Get appropriate response pattern
+        response_emotion = primary_emotion if primary_emotion in self.response_patterns else 'neutral'
+        responses = self.response_patterns[response_emotion]
+        
+        # Of the emotion's responses, the one closest to what the user wrote
+        base_response = retrieval_index.choose(user_message, 'response', response_emotion, responses)
+        
+        # Add personalization based on conversation history
+        if state.turns >= 2:
+            personalization = self._add_context_personalization(state, themes, detected_emotions)
+            if personalization:
+                base_response += f" {personalization}"
+        
+        return base_response, detected_emotions, primary_emotion, sentiment_score
+    
+    def analyze_message(self, user_message):
+        """Crisis check, emotions and sentiment score for one message (memoized).
+        
+        Returns (emotions, primary_emotion, sentiment_score, is_crisis). The
+        memo key (text_pipeline.analysis_key) only merges messages that
+        analyze identically, so memoizing never changes a result.
+        """
+        emotions, primary_emotion, sentiment_score, is_crisis, _ = self._analyze(user_message)
+        return list(emotions), primary_emotion, sentiment_score, is_crisis
+    
+    def _analyze(self, user_message):
+        """Memoized (emotions, primary_emotion, sentiment_score, is_crisis, themes)"""
+        key = analysis_key(user_message)
+        cacheable = len(key) <= self.analysis_cache_max_chars
+        if cacheable:
+            cached = self.analysis_cache.get(key)
+            if cached is not None:
+                return cached
+        
+        # One scan of the message feeds every stage below
+        doc = self.pipeline.analyze(key)
+        themes = self.pipeline.themes(doc)
+        
+        # Check for crisis indicators first
+        if self.pipeline.is_crisis(doc):
+            analysis = (('crisis',), 'crisis', -1.0, True, themes)
+        else:
             # Detect multiple emotions
-            detected_emotions = self.detect_emotions(user_message)
+            detected_emotions = self.pipeline.emotions(doc) or ['neutral']
             
             # Get sentiment analysis as backup
-            sentiment_emotion = self._analyze_text_sentiment(user_message)
+            try:
+                sentiment_emotion = self._polarity_emotion(self.pipeline.polarity(doc))
+            except Exception as e:
+                logging.error(f"Error in sentiment analysis: {e}")
+                sentiment_emotion = 'neutral'
             
             # Combine emotion detection with sentiment
             if sentiment_emotion not in detected_emotions and sentiment_emotion != 'neutral':
@@ -238,99 +298,129 @@ You don't have to go through this alone. There are people who want to help you,
             # Choose primary emotion
             primary_emotion = detected_emotions[0] if detected_emotions else 'neutral'
             
-            # Get appropriate response pattern
-            if primary_emotion in self.response_patterns:
-                responses = self.response_patterns[primary_emotion]
-            else:
-                responses = self.response_patterns['neutral']
-            
-            base_response = random.choice(responses)
-            
-            # Add personalization based on conversation history
-            if context and len(context) > 2:
-                personalization = self._add_context_personalization(context, user_message, detected_emotions)
-                if personalization:
-                    base_response += f" {personalization}"
-            
-            # Add coping strategy if appropriate
-            if primary_emotion in ['anxiety', 'stress', 'depression', 'anger', 'fear', 'sadness']:
-                coping_category = self._get_coping_category(primary_emotion)
-                if coping_category and random.random() < 0.6:  # 60% chance
-                    coping_suggestion = random.choice(self.coping_strategies[coping_category])
-                    base_response += f"\n\n{coping_suggestion}"
-            
-            # Add encouraging follow-up for difficult emotions
-            if primary_emotion in ['depression', 'loneliness', 'anxiety', 'sadness', 'fear', 'guilt']:
-                encouragements = [
-                    "Remember, it's okay to take things one moment at a time.",
-                    "You're showing strength by reaching out and talking about this.",
-                    "Your feelings are valid, and so are you.",
-                    "It's okay to not be okay sometimes. Healing isn't linear.",
-                    "You're not alone in this journey."
-                ]
-                base_response += f"\n\n{random.choice(encouragements)}"
-            
             # Calculate overall sentiment score
             sentiment_score = self._calculate_sentiment_score(detected_emotions)
+            analysis = (tuple(detected_emotions), primary_emotion, sentiment_score, False, themes)
+        
+        if cacheable:
+            self.analysis_cache.set(key, analysis)
+        return analysis
+    
+    def generate_follow_up(self, primary_emotion, user_message=None):
+        """Coping strategy and encouragement appended after the base response"""
+        follow_up = ""
+        
+        # Add coping strategy if appropriate
+        if primary_emotion in ['anxiety', 'stress', 'depression', 'anger', 'fear', 'sadness']:
+            coping_category = self._get_coping_category(primary_emotion)
+            if coping_category and random.random() < 0.6:  # 60% chance
+                coping_suggestion = retrieval_index.choose(
+                    user_message, 'coping', coping_category, self.coping_strategies[coping_category]
+                )
+                follow_up += f"\n\n{coping_suggestion}"
+        
+        # Add encouraging follow-up for difficult emotions
+        if primary_emotion in ['depression', 'loneliness', 'anxiety', 'sadness', 'fear', 'guilt']:
+            encouragements = [
+                "Remember, it's okay to take things one moment at a time.",
+                "You're showing strength by reaching out and talking about this.",
+                "Your feelings are valid, and so are you.",
+                "It's okay to not be okay sometimes. Healing isn't linear.",
+                "You're not alone in this journey."
+            ]
+            follow_up += f"\n\n{random.choice(encouragements)}"
+        
+        return follow_up
+    
+    def _get_fallback_response(self):
+        """Response used when generation fails"""
+        return ("I want you to know that I'm here for you, even though I'm having some technical difficulties right now. "
+               "Your feelings and experiences matter. If you're in crisis, please don't hesitate to reach out to a mental health professional or call 988 for the Suicide & Crisis Lifeline.")
+    
+    def analyze_batch(self, texts):
+        """Run the emotion analysis of generate_response over many texts at once.
+        
+        Returns one dict per text with the detected emotions, primary emotion,
+        sentiment score and crisis flag; no response text is generated.
+        """
+        import numpy as np
+        
+        emotion_index = {emotion: i for i, emotion in enumerate(self.pipeline.emotion_names)}
+        crisis, emotion_scores = self.pipeline.score_batch(texts)
+        ranked = self.pipeline.rank_batch(emotion_scores)
+        sentiment_emotions = self._analyze_text_sentiment_batch(texts)
+        
+        # Emotion presence matrix, including the polarity backup emotion
+        present = emotion_scores > 0
+        for i, sentiment_emotion in enumerate(sentiment_emotions):
+            if sentiment_emotion != 'neutral':
+                present[i, emotion_index[sentiment_emotion]] = True
+        
+        positive = np.isin(self.pipeline.emotion_names, ['happiness', 'excitement', 'calm', 'gratitude'])
+        negative = np.isin(self.pipeline.emotion_names, ['depression', 'anxiety', 'anger', 'sadness', 'fear', 'loneliness', 'guilt'])
+        positive_count = present @ positive.astype(int)
+        negative_count = present @ negative.astype(int)
+        sentiment_scores = np.where(
+            positive_count > negative_count, np.minimum(0.8, positive_count * 0.3),
+            np.where(negative_count > positive_count, np.maximum(-0.8, -negative_count * 0.3), 0.0)
+        )
+        
+        results = []
+        for i, emotions in enumerate(ranked):
+            if crisis[i]:
+                results.append({'emotions': ['crisis'], 'primary_emotion': 'crisis', 'sentiment_score': -1.0, 'crisis': True})
+                continue
             
-            return base_response, detected_emotions, primary_emotion, sentiment_score
+            detected_emotions = emotions or ['neutral']
+            if sentiment_emotions[i] not in detected_emotions and sentiment_emotions[i] != 'neutral':
+                detected_emotions.append(sentiment_emotions[i])
             
-        except Exception as e:
-            logging.error(f"Error generating local AI response: {e}")
-            return ("I want you to know that I'm here for you, even though I'm having some technical difficulties right now. "
-                   "Your feelings and experiences matter. If you're in crisis, please don't hesitate to reach out to a mental health professional or call 988 for the Suicide & Crisis Lifeline."), ['neutral'], 'neutral', 0.0
+            results.append({
+                'emotions': detected_emotions,
+                'primary_emotion': detected_emotions[0],
+                'sentiment_score': float(sentiment_scores[i]),
+                'crisis': False
+            })
+        
+        return results
+    
+    def message_themes(self, user_message):
+        """Themes of a message, from the analysis memo or a keyword scan"""
+        cached = self.analysis_cache.peek(analysis_key(user_message))
+        if cached is not None:
+            return cached[4]
+        return self.pipeline.themes(self.pipeline.analyze(user_message))
     
-    def _get_conversation_context(self, session_id, limit=5):
-        """Get recent conversation history for enhanced context"""
+    def remember_turn(self, session_id, user_message, ai_response, emotions, primary_emotion):
+        """Write a just-saved turn through to the cached state of its session"""
         try:
-            recent_conversations = Conversation.query.filter_by(
-                session_id=session_id
-            ).order_by(Conversation.timestamp.desc()).limit(limit).all()
-            
-            context = []
-            for conv in reversed(recent_conversations):
-                context.append({
-                    "role": "user", 
-                    "content": conv.user_message,
-                    "emotions": json.loads(conv.emotions) if conv.emotions else [],
-                    "primary_emotion": conv.primary_emotion
-                })
-                context.append({"role": "assistant", "content": conv.ai_response})
-            
-            return context
+            session_states.remember(session_id, emotions, primary_emotion, self.message_themes(user_message))
         except Exception as e:
-            logging.error(f"Error getting conversation context: {e}")
-            return []
+            logging.error(f"Error caching session state: {e}")
+            session_states.forget(session_id)
     
-    def _add_context_personalization(self, context, current_message, current_emotions):
-        """Add personalization based on conversation history and emotion patterns"""
+    def forget_session(self, session_id):
+        """Drop any cached state for a session"""
+        session_states.forget(session_id)
+    
+    def _add_context_personalization(self, state, current_themes, current_emotions):
+        """Add personalization based on the session's running emotional state.
+        
+        state covers the whole history before this message (see
+        session_state.MoodState), so the cost is the same on every turn.
+        """
         try:
-            # Analyze emotion patterns over time
-            user_messages = [msg for msg in context if msg["role"] == "user"]
-            
-            if len(user_messages) < 2:
-                return ""
-            
-            # Check for recurring emotions
-            all_emotions = []
-            for msg in user_messages:
-                if "emotions" in msg and msg["emotions"]:
-                    all_emotions.extend(msg["emotions"])
-            
-            # Check for recurring themes
-            all_text = " ".join([msg["content"] for msg in user_messages] + [current_message])
-            
             # Pattern matching for recurring concerns
-            if 'anxiety' in all_emotions and 'anxiety' in current_emotions:
+            if state.recurring_emotion('anxiety') and 'anxiety' in current_emotions:
                 return "I notice anxiety has been a recurring theme in our conversations. You're not alone in this struggle."
             
-            if 'stress' in all_emotions and any(emotion in current_emotions for emotion in ['stress', 'overwhelmed']):
+            if state.recurring_emotion('stress') and any(emotion in current_emotions for emotion in ['stress', 'overwhelmed']):
                 return "It seems like stress has been weighing on you lately. Let's work on finding some relief."
             
-            if 'work' in all_text.lower() and 'stress' in all_emotions:
+            if ('work' in current_themes or state.recurring_theme('work')) and state.recurring_emotion('stress'):
                 return "Work stress seems to be a consistent challenge for you."
             
-            if 'sleep' in all_text.lower() or 'tired' in all_text.lower():
+            if 'sleep' in current_themes or state.recurring_theme('sleep'):
                 return "I've noticed sleep and rest have come up in our conversations. Quality rest is so important for mental health."
             
             return ""
@@ -375,3 +465,9 @@ ai_service = LocalAIService()
 def get_ai_response(user_message, session_id):
     """Main function to get AI response with enhanced features"""
     return ai_service.generate_response(user_message, session_id)
+
+def warm_up():
+    """Load the polarity lexicon, the batch scoring path and the retrieval index ahead of the first request"""
+    ai_service._analyze_text_sentiment("warm up")
+    ai_service.analyze_batch(["warm up"])
+    retrieval_index.load()
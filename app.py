@@ -2,6 +2,19 @@ import os
 import logging
 from flask import Flask
 from extensions import db
+from write_behind import write_behind
+from tts import tts_service
+from assets import asset_pipeline
+from activity import activity_tracker
+from mood_rollups import mood_rollups
+from retention import retention
+from session_state import session_states
+from retrieval import retrieval_index
+from polarity import polarity_scorer
+from suggestion_engine import suggestion_engine
+from suggestion_catalog import suggestion_catalog
+from suggestion_rotation import suggestion_rotation
+from ai_service import ai_service
 
 # Setup logging
 logging.basicConfig(level=logging.DEBUG)
@@ -17,12 +30,33 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     "pool_pre_ping": True,
 }
 
+# Conversation turns rendered on /chat and returned per /api/history page
+app.config["CHAT_PAGE_SIZE"] = int(os.environ.get("CHAT_PAGE_SIZE", 30))
+
+# Maximum number of messages accepted by POST /api/analyze
+app.config["ANALYZE_BATCH_LIMIT"] = int(os.environ.get("ANALYZE_BATCH_LIMIT", 1000))
+
 # Initialize the app with the extension
 db.init_app(app)
+write_behind.init_app(app)
+tts_service.init_app(app)
+asset_pipeline.init_app(app)
+activity_tracker.init_app(app)
+mood_rollups.init_app(app)
+retention.init_app(app)
+session_states.init_app(app, theme_detector=ai_service.message_themes)
+retrieval_index.init_app(app)
+polarity_scorer.init_app(app)
+suggestion_catalog.init_app(app, pools=suggestion_engine.suggestions_db)
+suggestion_rotation.init_app(app, pools=suggestion_engine.suggestions_db)
 
 # Import models and routes after app and db setup
 with app.app_context():
     import models  # noqa: F401
     import routes  # noqa: F401
+    import commands  # noqa: F401
     
     db.create_all()
+    # Schema migrations run once per deployment, not in every worker: see
+    # `flask migrate-db`, gunicorn.conf.py (when_ready) and main.py
+    suggestion_catalog.load()
@@ -0,0 +1,52 @@
+"""Read-only numpy artifacts shared by every worker through the page cache.
+
+An artifact is a directory of .npy arrays plus a manifest.json describing
+them. Arrays are memory-mapped read-only, so all processes mapping the
+same file share its pages instead of each holding a private copy. Writes
+go through temporary files and the manifest is written last, so a reader
+never sees a manifest that points at partially written arrays.
+"""
+import json
+import os
+
+MANIFEST_NAME = 'manifest.json'
+
+
+def _replace(directory, name, write, mode):
+    path = os.path.join(directory, name)
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, mode) as f:
+        write(f)
+    os.replace(temporary, path)
+
+
+def save_artifact(directory, arrays, manifest):
+    """Write {name: ndarray} as name.npy files, then the manifest"""
+    import numpy as np
+
+    os.makedirs(directory, exist_ok=True)
+    for name, array in arrays.items():
+        _replace(directory, f'{name}.npy', lambda f, array=array: np.save(f, array), 'wb')
+    _replace(directory, MANIFEST_NAME, lambda f: json.dump(manifest, f), 'w')
+
+
+def read_manifest(directory):
+    """The artifact's manifest, or None if it is missing or unreadable"""
+    if not directory:
+        return None
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def map_arrays(directory, names):
+    """{name: read-only ndarray} backed by the artifact's files"""
+    import numpy as np
+
+    # Plain ndarray views of the maps: slicing a np.memmap is several times slower
+    return {
+        name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r').view(np.ndarray)
+        for name in names
+    }
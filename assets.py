@@ -0,0 +1,132 @@
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import shutil
+
+from flask import abort, request, send_file, url_for
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # Optional: only gzip variants are written without it
+    brotli = None
+
+# Only text formats benefit from precompression; mp3/png/etc. are already compressed
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+MANIFEST_NAME = 'manifest.json'
+
+
+def _is_compressible(path):
+    mimetype = mimetypes.guess_type(path)[0] or ''
+    return mimetype.startswith(COMPRESSIBLE_TYPES)
+
+
+def _fingerprint(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(65536), b''):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def build_assets(static_folder, output_dir):
+    """Write fingerprinted (and precompressed) copies of every static file.
+
+    Returns the manifest mapping each logical path (as used with
+    url_for('static', ...)) to its fingerprinted path inside output_dir.
+    """
+    output_dir = os.path.abspath(output_dir)
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        # Never fingerprint our own output
+        dirs[:] = [d for d in dirs if os.path.abspath(os.path.join(root, d)) != output_dir]
+        for name in files:
+            source = os.path.join(root, name)
+            logical = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            base, ext = os.path.splitext(logical)
+            hashed = f"{base}.{_fingerprint(source)}{ext}"
+            target = os.path.join(output_dir, hashed)
+
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if not os.path.exists(target):
+                shutil.copyfile(source, target)
+                if _is_compressible(source):
+                    with open(source, 'rb') as f:
+                        data = f.read()
+                    with open(f"{target}.gz", 'wb') as f:
+                        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+                    if brotli is not None:
+                        with open(f"{target}.br", 'wb') as f:
+                            f.write(brotli.compress(data, quality=11))
+            manifest[logical] = hashed
+
+    with open(os.path.join(output_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+class AssetPipeline:
+    """Serves fingerprinted assets and exposes the asset_url() template helper"""
+
+    def __init__(self, app=None):
+        self.manifest = {}
+        self.output_dir = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.output_dir = app.config.setdefault(
+            'ASSETS_OUTPUT_DIR', os.path.join(app.static_folder or 'static', 'dist')
+        )
+        self.load_manifest()
+        app.add_url_rule('/assets/<path:filename>', 'assets', self.serve)
+        app.add_template_global(self.asset_url, 'asset_url')
+        app.extensions['assets'] = self
+
+    def load_manifest(self):
+        try:
+            with open(os.path.join(self.output_dir, MANIFEST_NAME)) as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            # Assets not built (development): asset_url falls back to /static
+            self.manifest = {}
+        except ValueError as e:
+            logging.error(f"Ignoring unreadable asset manifest: {e}")
+            self.manifest = {}
+
+    def asset_url(self, filename):
+        """URL of a static file, fingerprinted when the asset build has run"""
+        hashed = self.manifest.get(filename)
+        if hashed is None:
+            return url_for('static', filename=filename)
+        return url_for('assets', filename=hashed)
+
+    def serve(self, filename):
+        path = safe_join(self.output_dir, filename)
+        if path is None or filename == MANIFEST_NAME or not os.path.isfile(path):
+            abort(404)
+
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        encoding = None
+        # Range offsets refer to the identity encoding, so ranged requests get the original
+        if _is_compressible(path) and 'Range' not in request.headers:
+            for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+                if candidate in request.accept_encodings and os.path.isfile(path + suffix):
+                    path, encoding = path + suffix, candidate
+                    break
+
+        # send_file handles ETag / If-None-Match and Range / 206 responses
+        response = send_file(path, mimetype=mimetype, conditional=True, max_age=31536000)
+        response.cache_control.immutable = True
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if _is_compressible(filename):
+            response.vary.add('Accept-Encoding')
+        return response
+
+
+# Global instance
+asset_pipeline = AssetPipeline()
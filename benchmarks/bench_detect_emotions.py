@@ -0,0 +1,105 @@
+"""Micro-benchmark: compiled EmotionMatcher vs. the original nested keyword loop.
+
+"compiled" is the steady state, where the matcher's word memo already
+knows the words of the text; "first seen" clears the memo before every
+call, so every word is scanned by the trie regex. Run from the
+repository root:
+
+    python -m benchmarks.bench_detect_emotions
+"""
+import random
+import string
+import timeit
+
+from emotion_matcher import EmotionMatcher
+
+EMOTION_KEYWORDS = {
+    'anxiety': ['anxious', 'anxiety', 'worried', 'nervous', 'panic', 'overwhelmed', 'scared', 'fearful', 'restless', 'tense'],
+    'depression': ['depressed', 'depression', 'sad', 'hopeless', 'empty', 'worthless', 'down', 'low', 'blue', 'miserable'],
+    'stress': ['stress', 'stressed', 'pressure', 'overwhelmed', 'busy', 'exhausted', 'burned out', 'frazzled'],
+    'anger': ['angry', 'mad', 'furious', 'frustrated', 'irritated', 'annoyed', 'rage', 'livid', 'upset'],
+    'loneliness': ['lonely', 'alone', 'isolated', 'disconnected', 'abandoned', 'left out', 'solitary'],
+    'fear': ['afraid', 'scared', 'fearful', 'terrified', 'frightened', 'worried', 'apprehensive'],
+    'sadness': ['sad', 'sorrow', 'grief', 'melancholy', 'dejected', 'downhearted', 'mournful'],
+    'happiness': ['happy', 'joy', 'joyful', 'elated', 'cheerful', 'delighted', 'pleased', 'content'],
+    'excitement': ['excited', 'thrilled', 'enthusiastic', 'energetic', 'pumped', 'eager'],
+    'calm': ['calm', 'peaceful', 'serene', 'tranquil', 'relaxed', 'at ease', 'centered'],
+    'confusion': ['confused', 'lost', 'uncertain', 'unclear', 'bewildered', 'puzzled'],
+    'guilt': ['guilty', 'ashamed', 'regretful', 'remorseful', 'sorry', 'blame myself'],
+    'gratitude': ['grateful', 'thankful', 'appreciative', 'blessed', 'fortunate']
+}
+
+SHORT_TEXT = "I'm feeling so anxious and overwhelmed about work today"
+
+LONG_TEXT = "\n\n".join([
+    "So today started out okay, I woke up early and felt pretty calm, but then I checked my email "
+    "and there was this message from my manager about the deadline being moved up and I just felt "
+    "the pressure building. I was worried I wouldn't be able to finish everything and honestly a "
+    "little scared about what happens if I don't.",
+    "By lunch I was exhausted and kind of frustrated with myself for letting it get to me. I called "
+    "my sister and she was really supportive, which I'm grateful for, but after the call I felt "
+    "lonely again because she lives so far away and I don't really have anyone here.",
+    "In the evening I tried to relax and watch something but my mind kept going back to the work "
+    "stuff. I feel a bit lost about whether this job is right for me. I'm not depressed exactly, "
+    "just tired and uncertain, and I keep thinking I should be happier than I am.",
+] * 4)
+
+
+def legacy_detect_emotions(emotion_keywords, text):
+    """The original LocalAIService.detect_emotions implementation"""
+    text_lower = text.lower()
+    emotion_scores = {}
+    for emotion, keywords in emotion_keywords.items():
+        score = 0
+        for keyword in keywords:
+            if keyword in text_lower:
+                if f" {keyword} " in f" {text_lower} ":
+                    score += 2
+                else:
+                    score += 1
+        if score > 0:
+            emotion_scores[emotion] = score
+    if emotion_scores:
+        sorted_emotions = sorted(emotion_scores.items(), key=lambda x: x[1], reverse=True)
+        return [emotion for emotion, score in sorted_emotions]
+    return ['neutral']
+
+
+def compiled_detect_emotions(matcher, text):
+    emotion_scores = matcher.score(text)
+    return matcher.rank(emotion_scores) if emotion_scores else ['neutral']
+
+
+def grow_lexicon(emotion_keywords, factor, seed=7):
+    """Pad every emotion with synthetic keywords to simulate a larger lexicon"""
+    rng = random.Random(seed)
+    grown = {}
+    for emotion, keywords in emotion_keywords.items():
+        extra = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(5, 11)))
+                 for _ in range(len(keywords) * (factor - 1))]
+        grown[emotion] = list(keywords) + extra
+    return grown
+
+
+def bench(label, func, number):
+    seconds = min(timeit.repeat(func, number=number, repeat=5)) / number
+    print(f"  {label:<10} {seconds * 1e6:10.1f} us/call")
+    return seconds
+
+
+def main():
+    for factor in (1, 10):
+        lexicon = grow_lexicon(EMOTION_KEYWORDS, factor)
+        matcher = EmotionMatcher(lexicon)
+        size = sum(len(words) for words in lexicon.values())
+        for name, text, number in (('short', SHORT_TEXT, 2000), ('long', LONG_TEXT, 200)):
+            assert legacy_detect_emotions(lexicon, text) == compiled_detect_emotions(matcher, text)
+            print(f"lexicon={size} keywords, {name} input ({len(text)} chars)")
+            legacy = bench('legacy', lambda: legacy_detect_emotions(lexicon, text), number)
+            compiled = bench('compiled', lambda: compiled_detect_emotions(matcher, text), number)
+            first_seen = bench('first seen', lambda: (matcher._word_hits.clear(), compiled_detect_emotions(matcher, text)), number)
+            print(f"  speedup    {legacy / compiled:10.1f}x ({legacy / first_seen:.1f}x first seen)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Import-time benchmark for the application entry point.
+
+Runs ``python -X importtime -c "import main"`` in a fresh interpreter against a
+throwaway SQLite database and reports the slowest top-level imports. Pass
+``--max-ms`` to fail (exit status 1) when the total exceeds a budget:
+
+    python -m benchmarks.bench_import_time --max-ms 1500
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(module):
+    """Return [(cumulative_us, self_us, depth, name)] parsed from -X importtime"""
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+            cwd=ROOT, env=env, capture_output=True, text=True, check=True
+        )
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((int(cumulative_us), int(self_us), depth, name.strip()))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--module', default='main')
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--max-ms', type=float, default=None)
+    args = parser.parse_args()
+
+    rows = measure(args.module)
+    total_ms = next(cumulative for cumulative, _, depth, name in rows if name == args.module and depth <= 1) / 1000
+
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for cumulative, self_us, depth, name in sorted(rows, reverse=True)[:args.top]:
+        print(f"{cumulative / 1000:14.1f} {self_us / 1000:9.1f}  {'  ' * depth}{name}")
+    print(f"\nimport {args.module}: {total_ms:.1f} ms")
+
+    if args.max_ms is not None and total_ms > args.max_ms:
+        print(f"FAIL: import time exceeds budget of {args.max_ms:.0f} ms")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
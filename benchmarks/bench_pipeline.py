@@ -0,0 +1,46 @@
+"""Per-stage CPU breakdown of the message analysis pipeline.
+
+Every message goes through the full pipeline (the analysis memo is cleared
+before each one). Run from the repository root:
+
+    python -m benchmarks.bench_pipeline
+"""
+import time
+
+from ai_service import LocalAIService
+from benchmarks.bench_detect_emotions import LONG_TEXT, SHORT_TEXT
+
+MESSAGES = [
+    "hi",
+    "I'm stressed",
+    "feeling anxious",
+    "I can't sleep and I'm so tired of work",
+    "Thank you, I feel a bit calmer now :)",
+    SHORT_TEXT,
+    LONG_TEXT,
+]
+
+
+def main(rounds=200):
+    service = LocalAIService()
+    service._analyze("warm up")
+    service.pipeline.timings.reset()
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for message in MESSAGES:
+            service.analysis_cache.clear()
+            service._analyze(message)
+    elapsed = time.perf_counter() - started
+
+    messages = rounds * len(MESSAGES)
+    stats = service.pipeline.timings.stats()
+    staged = sum(stage['total_ms'] for stage in stats.values())
+    print(f"{messages} messages, {elapsed / messages * 1e6:.1f} us/message end to end")
+    for name, stage in sorted(stats.items(), key=lambda item: -item[1]['total_ms']):
+        share = stage['total_ms'] / staged * 100 if staged else 0.0
+        print(f"  {name:<10} {stage['mean_us']:10.1f} us/call {share:6.1f}%")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""Micro-benchmark: PolarityScorer vs. TextBlob(text).sentiment.polarity.
+
+Single messages (short and long) and a batch of generated messages.
+Run from the repository root (requires textblob):
+
+    python -m benchmarks.bench_polarity
+"""
+import timeit
+
+from benchmarks.bench_detect_emotions import LONG_TEXT, SHORT_TEXT
+from benchmarks.polarity_equivalence import generated_texts
+from polarity import PolarityScorer
+
+
+def bench(label, func, number):
+    seconds = min(timeit.repeat(func, number=number, repeat=5)) / number
+    print(f"  {label:<10} {seconds * 1e6:12.1f} us/call")
+    return seconds
+
+
+def main():
+    from textblob import TextBlob
+
+    scorer = PolarityScorer()
+    scorer.load()
+    TextBlob("warm up").sentiment
+
+    for name, text, number in (('short', SHORT_TEXT, 2000), ('long', LONG_TEXT, 50)):
+        print(f"single {name} message ({len(text)} chars)")
+        textblob = bench('textblob', lambda: TextBlob(text).sentiment.polarity, number)
+        native = bench('scorer', lambda: scorer.score(text), number)
+        print(f"  speedup    {textblob / native:12.1f}x")
+
+    texts = generated_texts(1000)
+    print(f"batch of {len(texts)} messages")
+    textblob = bench('textblob', lambda: [TextBlob(text).sentiment.polarity for text in texts], 2)
+    native = bench('scorer', lambda: scorer.score_batch(texts), 2)
+    print(f"  speedup    {textblob / native:12.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Latency of RetrievalIndex.choose over a corpus 100x the app's canned texts.
+
+Each canned text gets SCALE - 1 synthetic siblings in its group (its words
+shuffled and partly replaced by other corpus words), the index is fitted
+into a temporary directory and memory-mapped back, and every query is a new
+message, so no timing hits the per-thread score memo. Exits with status 1
+if p99 reaches P99_BUDGET_MS. Run from the repository root:
+
+    python -m benchmarks.bench_retrieval
+"""
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks.polarity_equivalence import CHAT_MESSAGES
+from retrieval import RetrievalIndex, corpus_documents
+
+SCALE = 100
+QUERIES = 5000
+P99_BUDGET_MS = 1.0
+
+
+def scaled_documents(documents, scale, seed=7):
+    rng = random.Random(seed)
+    words = sorted({word for _, _, text in documents for word in text.split()})
+    scaled = []
+    for kind, group, text in documents:
+        scaled.append((kind, group, text))
+        for _ in range(scale - 1):
+            variant = text.split()
+            rng.shuffle(variant)
+            variant = [rng.choice(words) if rng.random() < 0.3 else word for word in variant]
+            scaled.append((kind, group, ' '.join(variant)))
+    # Keep each group contiguous, in first-seen order
+    order = {}
+    for kind, group, _ in scaled:
+        order.setdefault((kind, group), len(order))
+    return sorted(scaled, key=lambda document: order[document[:2]])
+
+
+def queries(documents, count, seed=3):
+    rng = random.Random(seed)
+    words = sorted({word for _, _, text in documents for word in text.lower().split()})
+    messages = []
+    for i in range(count):
+        base = rng.choice(CHAT_MESSAGES)
+        extra = ' '.join(rng.choice(words) for _ in range(rng.randint(0, 12)))
+        messages.append(f"{base} {extra} {i}")
+    return messages
+
+
+def percentile(sorted_values, share):
+    return sorted_values[min(len(sorted_values) - 1, int(share * len(sorted_values)))]
+
+
+def main():
+    documents = scaled_documents(corpus_documents(), SCALE)
+    options = {}
+    for kind, group, text in documents:
+        options.setdefault((kind, group), []).append(text)
+    groups = sorted(options)
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        index = RetrievalIndex(index_dir=index_dir, documents=lambda: documents)
+        started = time.perf_counter()
+        index.build()
+        index.load()
+        print(f"{index.size} documents, {len(index.vocabulary)} terms, "
+              f"fitted and mapped in {time.perf_counter() - started:.1f}s "
+              f"({type(index.data).__name__} arrays)")
+
+        rng = random.Random(5)
+        messages = queries(documents, QUERIES)
+        for message in messages[:50]:
+            index.scores(message + ' warm up')
+
+        timings = []
+        for message in messages:
+            kind, group = rng.choice(groups)
+            started = time.perf_counter()
+            index.choose(message, kind, group, options[(kind, group)])
+            timings.append((time.perf_counter() - started) * 1000)
+
+    timings.sort()
+    p50, p95, p99 = (percentile(timings, share) for share in (0.50, 0.95, 0.99))
+    print(f"{QUERIES} queries: p50 {p50:.3f} ms, p95 {p95:.3f} ms, p99 {p99:.3f} ms, max {timings[-1]:.3f} ms")
+    if p99 >= P99_BUDGET_MS:
+        print(f"FAIL: p99 is over the {P99_BUDGET_MS} ms budget")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""Per-worker memory of the app under gunicorn, with and without preload_app.
+
+Starts gunicorn (gunicorn.conf.py) on a local port for each mode, sends
+analysis and voice chat requests so every model is in use, then reads
+/proc/<pid>/smaps_rollup (Linux) of each worker:
+
+* USS, the worker's private memory (Private_Clean + Private_Dirty): what
+  each additional worker costs
+* PSS, its proportional share of pages shared with the master and siblings
+* RSS, everything it maps, shared or not
+
+Run from the repository root:
+
+    python -m benchmarks.measure_worker_memory --workers 4
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+MESSAGES = ["I'm stressed about work", "feeling anxious and can't sleep", "thank you, I feel calmer"]
+
+
+def _smaps_kb(pid):
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    return {
+        'uss': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0),
+        'pss': fields.get('Pss', 0),
+        'rss': fields.get('Rss', 0)
+    }
+
+
+def _children(pid):
+    children = []
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    # The field after the parenthesized command name is the state, then the ppid
+                    if int(f.read().rsplit(')', 1)[1].split()[1]) == pid:
+                        children.append(int(entry))
+            except (OSError, ValueError, IndexError):
+                continue
+    return children
+
+
+def _wait_until_up(url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=2).read()
+            return
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError(f"gunicorn did not answer on {url} within {timeout}s")
+
+
+def _post_json(opener, url, payload):
+    request = urllib.request.Request(
+        url, data=json.dumps(payload).encode(), headers={'Content-Type': 'application/json'}
+    )
+    return opener.open(request, timeout=30).read()
+
+
+def _exercise(base_url, requests_count):
+    for i in range(requests_count):
+        # A fresh cookie jar per round, so each round is a new chat session
+        opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+        _post_json(opener, f'{base_url}/api/analyze', {'messages': MESSAGES})
+        try:
+            opener.open(f'{base_url}/chat', timeout=30).read()
+        except urllib.error.HTTPError:
+            # The session cookie is set even if the page itself fails to render
+            pass
+        _post_json(opener, f'{base_url}/voice_message', {'message': MESSAGES[i % len(MESSAGES)]})
+
+
+def measure(preload, workers, port, requests_count):
+    env = dict(
+        os.environ,
+        GUNICORN_PRELOAD='1' if preload else '0',
+        PERSISTENCE_MODE='sync'
+    )
+    env.setdefault('DATABASE_URL', f'sqlite:///{tempfile.mkdtemp()}/memory.db')
+    master = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--workers', str(workers),
+         '--bind', f'127.0.0.1:{port}', '--log-level', 'warning', 'main:app'],
+        env=env
+    )
+    try:
+        base_url = f'http://127.0.0.1:{port}'
+        _wait_until_up(f'{base_url}/api/pipeline_stats', timeout=120)
+        _exercise(base_url, requests_count)
+        time.sleep(1)
+        master_memory = _smaps_kb(master.pid)
+        return master_memory, [_smaps_kb(pid) for pid in sorted(_children(master.pid))]
+    finally:
+        master.send_signal(signal.SIGTERM)
+        master.wait(timeout=60)
+
+
+def _report(label, master_memory, workers_memory):
+    print(f"{label}:")
+    print(f"  {'process':<10}{'USS MiB':>10}{'PSS MiB':>10}{'RSS MiB':>10}")
+    rows = [('master', master_memory)] + [(f'worker {i}', memory) for i, memory in enumerate(workers_memory)]
+    for name, memory in rows:
+        print(f"  {name:<10}{memory['uss'] / 1024:10.1f}{memory['pss'] / 1024:10.1f}{memory['rss'] / 1024:10.1f}")
+    total_pss = sum(memory['pss'] for _, memory in rows) / 1024
+    mean_uss = sum(memory['uss'] for memory in workers_memory) / max(len(workers_memory), 1) / 1024
+    print(f"  mean worker USS {mean_uss:.1f} MiB, total PSS {total_pss:.1f} MiB")
+    return mean_uss
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--requests', type=int, default=12, help='Chat requests sent before measuring.')
+    args = parser.parse_args()
+
+    if not os.path.exists('/proc/self/smaps_rollup'):
+        print("This script needs Linux /proc/<pid>/smaps_rollup")
+        return 1
+
+    uss = {}
+    for preload in (False, True):
+        label = 'preload_app' if preload else 'no preload'
+        uss[preload] = _report(label, *measure(preload, args.workers, args.port, args.requests))
+    if uss[True]:
+        print(f"private memory per worker: {uss[False] / uss[True]:.1f}x smaller with preload_app")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""Equivalence check: PolarityScorer vs. TextBlob's pattern polarity.
+
+Scores a fixed corpus with both and fails (exit status 1) if they disagree
+beyond the documented tolerance:
+
+* ABS_TOLERANCE: scores count as equal when within 1e-9 (the rules are
+  applied in the same floating point order, so agreement is exact in
+  practice)
+* MIN_EXACT_SHARE: at least 99.5% of texts must be equal. The remainder
+  is reserved for tokenizer corner cases that pattern handles with regexes
+  over the whole sentence (an emoticon glued to the end of a word, as in
+  "word8 )", or sarcasm marks written "( ! )")
+* every text must map to the same backup emotion in LocalAIService
+  (the polarity buckets at 0.3 / -0.1 / -0.3), which is what the app uses
+
+The corpus is the app's own response/suggestion text, hand-written chat
+messages, and seeded random sentences built from the lexicon with
+negations, intensifiers, contractions, punctuation and emoticons, each as
+written and lowercased. Run from the
+repository root (requires textblob):
+
+    python -m benchmarks.polarity_equivalence
+"""
+import random
+import sys
+
+from polarity import EMOTICONS, PolarityScorer, load_lexicon, _lexicon_path
+
+ABS_TOLERANCE = 1e-9
+MIN_EXACT_SHARE = 0.995
+
+CHAT_MESSAGES = [
+    "hi", "I'm stressed", "feeling anxious", "I'm not okay", "not good", "not bad at all",
+    "I am so HAPPY!!!", "really not good", "I don't feel great today", "never felt better!",
+    "I'm sad :(", "had a great day :)", "ugh :'( everything is terrible", "lol xD that was funny",
+    "I can't sleep and I'm so tired of work", "Thank you, I feel a bit calmer now :)",
+    "this is terribly bad", "It's not a good time...", "very very happy", "extremely sad.",
+    "I'm fine. Really. (!)", "my boss said \"great job\" but I don't believe it",
+    "honestly? kind of lonely", "what a wonderful, beautiful morning!", "meh",
+    "I feel awful, horrible, and worthless", "not the worst day, not the best either",
+    "so proud of myself!!", "e.g. today was okay", "The U.S. trip was amazing.",
+]
+
+FILLERS = ['i', 'a', 'the', 'is', 'it', 'was', 'so', 'and', 'but', 'my', 'day', 'feel', 'today', 'me', 'at', 'all']
+PUNCTUATION = ['', '', '', '.', '!', '!!!', '?', '...', ',', ' !', ' :)']
+CONTRACTIONS = ["i'm", "don't", "can't", "it's", "isn't", "won't", "i've", "you're"]
+
+
+def app_texts():
+    from ai_service import LocalAIService
+    from suggestion_engine import SuggestionEngine
+
+    service = LocalAIService()
+    texts = [text for responses in service.response_patterns.values() for text in responses]
+    texts += [text for strategies in service.coping_strategies.values() for text in strategies]
+    for categories in SuggestionEngine().suggestions_db.values():
+        for items in categories.values():
+            for item in items:
+                texts.extend(item.values() if isinstance(item, dict) else [item])
+    return texts
+
+
+def generated_texts(count, seed=11):
+    rng = random.Random(seed)
+    lexicon = load_lexicon(_lexicon_path())
+    words = sorted(form for form in lexicon if ' ' not in form)
+    modifiers = sorted(form for form in words if lexicon[form][2])
+    emoticons = [face for _, faces in EMOTICONS for face in faces]
+    texts = []
+    for _ in range(count):
+        parts = []
+        for _ in range(rng.randint(1, 14)):
+            roll = rng.random()
+            if roll < 0.3:
+                parts.append(rng.choice(words))
+            elif roll < 0.42:
+                parts.append(rng.choice(modifiers))
+            elif roll < 0.52:
+                parts.append(rng.choice(['not', 'no', 'never']))
+            elif roll < 0.6:
+                parts.append(rng.choice(CONTRACTIONS))
+            elif roll < 0.64:
+                parts.append(rng.choice(emoticons))
+            else:
+                parts.append(rng.choice(FILLERS))
+            if rng.random() < 0.15:
+                parts[-1] += rng.choice(PUNCTUATION)
+        text = ' '.join(parts) + rng.choice(PUNCTUATION)
+        if rng.random() < 0.3:
+            text = text.capitalize()
+        if rng.random() < 0.05:
+            text = text.upper()
+        texts.append(text)
+    return texts
+
+
+def bucket(polarity):
+    if polarity > 0.3:
+        return 'happiness'
+    elif polarity < -0.3:
+        return 'sadness'
+    elif polarity < -0.1:
+        return 'depression'
+    return 'neutral'
+
+
+def main():
+    from textblob import TextBlob
+
+    corpus = app_texts() + CHAT_MESSAGES + generated_texts(5000)
+    corpus += [text.lower() for text in corpus]
+
+    scorer = PolarityScorer()
+    batch = scorer.score_batch(corpus)
+    mismatches = []
+    bucket_mismatches = []
+    worst = 0.0
+    for text, batch_score in zip(corpus, batch):
+        expected = TextBlob(text).sentiment.polarity
+        actual = scorer.score(text)
+        assert actual == batch_score, f"batch and single scores differ for {text!r}"
+        difference = abs(actual - expected)
+        worst = max(worst, difference)
+        if difference > ABS_TOLERANCE:
+            mismatches.append((text, expected, actual))
+        if bucket(actual) != bucket(expected):
+            bucket_mismatches.append((text, expected, actual))
+
+    exact_share = 1 - len(mismatches) / len(corpus)
+    print(f"{len(corpus)} texts: {exact_share:.4%} within {ABS_TOLERANCE}, "
+          f"max |difference| {worst:.3g}, {len(bucket_mismatches)} backup-emotion mismatches")
+    for text, expected, actual in (bucket_mismatches or mismatches)[:10]:
+        print(f"  textblob={expected:+.4f} scorer={actual:+.4f} {text!r}")
+
+    if exact_share < MIN_EXACT_SHARE or bucket_mismatches:
+        print("FAIL: outside the documented tolerance")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,406 @@
+"""Micro-benchmarks and load runs of the chat pipeline, compared against a baseline.
+
+Runs offline against a temporary SQLite database:
+
+* micro: detect_emotions, _analyze_text_sentiment, analyze_sentiment,
+  get_suggestions, each on fresh messages so the analysis memo never
+  answers, and SessionStates.get (which replaced
+  _get_conversation_context) for sessions with saved turns, cold (state
+  row loaded from the database) and hot (cached)
+* test_client: SESSIONS concurrent simulated sessions posting TURNS turns
+  each, alternating /send_message and /voice_message, in-process through
+  the Flask test client
+* gunicorn: the same load over HTTP against a local gunicorn
+  (gunicorn.conf.py)
+
+Each load run reports throughput plus p50/p95/p99 latency per endpoint.
+Results are written as JSON and compared against a baseline. A latency
+that grows, or a throughput that drops, by more than --threshold counts
+as a regression and makes the exit status 1. p95 and p99, which a
+handful of slow requests decide, are held to the looser --tail-threshold,
+and means (skewed by the same outliers) are reported but not compared.
+Latency changes below --noise-floor (us for micro, ms for load runs)
+never count.
+Run from the repository root:
+
+    python -m benchmarks.suite --output /tmp/bench.json
+    python -m benchmarks.suite --save-baseline   # after an intended change
+
+Latency is machine dependent: record the baseline on the machine that
+runs the comparison.
+"""
+import argparse
+import http.cookiejar
+import json
+import logging
+import os
+import platform
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.bench_detect_emotions import LONG_TEXT, SHORT_TEXT
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+MESSAGES = [
+    "hi",
+    "I'm stressed about work",
+    "feeling anxious and I can't sleep",
+    "I feel so lonely since I moved here",
+    "Thank you, I feel a bit calmer now :)",
+    "I'm angry at myself for failing the exam",
+    SHORT_TEXT,
+    LONG_TEXT,
+]
+
+# Metrics where a larger value is an improvement; every other metric is a latency
+HIGHER_IS_BETTER = ('throughput_rps',)
+
+# Latencies compared against --tail-threshold instead of --threshold
+TAIL_METRICS = ('p95', 'p99')
+
+# Reported but never compared
+UNCOMPARED_METRICS = ('count', 'workers', 'mean')
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(q / 100 * (len(sorted_values) - 1))))]
+
+
+def latency_stats(seconds, unit=1e3):
+    values = sorted(seconds)
+    return {
+        'count': len(values),
+        'mean': sum(values) / len(values) * unit if values else 0.0,
+        'p50': percentile(values, 50) * unit,
+        'p95': percentile(values, 95) * unit,
+        'p99': percentile(values, 99) * unit
+    }
+
+
+def fresh_messages(count):
+    """Distinct messages, so no memo or cache answers a timed call"""
+    return [f"{MESSAGES[i % len(MESSAGES)]} ({i})" for i in range(count)]
+
+
+def _time_calls(function, arguments, repeat, setup=None):
+    """Stats of the fastest of repeat rounds (by median), the least disturbed by other load.
+
+    setup(argument), if given, runs untimed before each call.
+    """
+    rounds = []
+    for _ in range(repeat):
+        timings = []
+        for argument in arguments:
+            if setup is not None:
+                setup(argument)
+            started = time.perf_counter()
+            function(argument)
+            timings.append(time.perf_counter() - started)
+        rounds.append(latency_stats(timings, unit=1e6))
+    return min(rounds, key=lambda stats: stats['p50'])
+
+
+def _warm_up():
+    import ai_service
+    import sentiment_analyzer
+
+    sentiment_analyzer.warm_up()
+    ai_service.warm_up()
+
+
+def run_micro(iterations, repeat):
+    """{benchmark: latency stats in microseconds}"""
+    from ai_service import ai_service
+    from app import app
+    from models import Conversation
+    from sentiment_analyzer import analyze_sentiment
+    from session_state import session_states
+    from suggestion_engine import suggestion_engine
+    from write_behind import write_behind
+
+    results = {}
+    with app.app_context():
+        _warm_up()
+
+        results['detect_emotions'] = _time_calls(ai_service.detect_emotions, fresh_messages(iterations), repeat)
+        results['_analyze_text_sentiment'] = _time_calls(ai_service._analyze_text_sentiment, fresh_messages(iterations), repeat)
+        results['analyze_sentiment'] = _time_calls(analyze_sentiment, fresh_messages(iterations), repeat)
+
+        session_id = str(uuid.uuid4())
+        emotion_sets = [['anxiety', 'stress'], ['depression'], ['loneliness', 'sadness'], ['happiness']]
+        results['get_suggestions'] = _time_calls(
+            lambda i: suggestion_engine.get_suggestions(session_id, emotion_sets[i % len(emotion_sets)], user_message=MESSAGES[i % len(MESSAGES)]),
+            range(iterations),
+            repeat
+        )
+
+        # Sessions with saved history: cold reads load the SessionState row
+        # (first turn after a restart or cache expiry), hot reads hit the cache
+        session_ids = [str(uuid.uuid4()) for _ in range(64)]
+        write_behind.save([
+            Conversation(sid, MESSAGES[(i + turn) % len(MESSAGES)], "ok", json.dumps(['anxiety', 'stress']), 'anxiety', -0.4)
+            for i, sid in enumerate(session_ids)
+            for turn in range(4)
+        ])
+        write_behind.sync()
+        lookups = [session_ids[i % len(session_ids)] for i in range(iterations)]
+        results['session_state_get_cold'] = _time_calls(session_states.get, lookups, repeat, setup=session_states.forget)
+        results['session_state_get_hot'] = _time_calls(session_states.get, lookups, repeat)
+    return results
+
+
+def _load_report(timings, elapsed):
+    report = {'throughput_rps': sum(len(values) for values in timings.values()) / elapsed if elapsed else 0.0}
+    for endpoint, values in sorted(timings.items()):
+        report[endpoint] = latency_stats(values)
+    report['all'] = latency_stats([value for values in timings.values() for value in values])
+    return report
+
+
+def _simulate(sessions, turns, post, warmup_turns=0):
+    """Run sessions concurrent sessions of turns timed turns; post(session, endpoint, message) sends one"""
+    timings = {'send_message': [], 'voice_message': []}
+    lock = threading.Lock()
+
+    def session_worker(index):
+        client = post.open_session()
+        local = {'send_message': [], 'voice_message': []}
+        for turn in range(warmup_turns + turns):
+            endpoint = 'send_message' if turn % 2 == 0 else 'voice_message'
+            message = f"{MESSAGES[(index + turn) % len(MESSAGES)]} ({index}.{turn})"
+            started = time.perf_counter()
+            post(client, endpoint, message)
+            if turn >= warmup_turns:
+                local[endpoint].append(time.perf_counter() - started)
+        with lock:
+            for endpoint, values in local.items():
+                timings[endpoint].extend(values)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        list(pool.map(session_worker, range(sessions)))
+    return _load_report(timings, time.perf_counter() - started)
+
+
+class _TestClientPoster:
+    def __init__(self, app):
+        self.app = app
+
+    def open_session(self):
+        client = self.app.test_client()
+        with client.session_transaction() as flask_session:
+            flask_session['session_id'] = str(uuid.uuid4())
+        return client
+
+    def __call__(self, client, endpoint, message):
+        if endpoint == 'send_message':
+            response = client.post('/send_message', data={'message': message})
+            expected = 302
+        else:
+            response = client.post('/voice_message', json={'message': message})
+            expected = 200
+        if response.status_code != expected:
+            raise RuntimeError(f"/{endpoint} answered {response.status_code}")
+
+
+def run_test_client(sessions, turns, warmup_turns):
+    from app import app
+
+    with app.app_context():
+        _warm_up()
+    return _simulate(sessions, turns, _TestClientPoster(app), warmup_turns)
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class _HttpPoster:
+    def __init__(self, base_url):
+        self.base_url = base_url
+
+    def open_session(self):
+        opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect
+        )
+        try:
+            opener.open(f'{self.base_url}/chat', timeout=30).read()
+        except urllib.error.HTTPError:
+            # The session cookie is set even if the page itself fails to render
+            pass
+        return opener
+
+    def __call__(self, opener, endpoint, message):
+        if endpoint == 'send_message':
+            request = urllib.request.Request(
+                f'{self.base_url}/send_message', data=urllib.parse.urlencode({'message': message}).encode()
+            )
+        else:
+            request = urllib.request.Request(
+                f'{self.base_url}/voice_message',
+                data=json.dumps({'message': message}).encode(),
+                headers={'Content-Type': 'application/json'}
+            )
+        try:
+            opener.open(request, timeout=60).read()
+        except urllib.error.HTTPError as e:
+            # /send_message answers with a redirect back to /chat
+            if e.code != 302:
+                raise
+
+
+def run_gunicorn(sessions, turns, warmup_turns, workers, port, database_url):
+    from benchmarks.measure_worker_memory import _wait_until_up
+
+    env = dict(os.environ, DATABASE_URL=database_url)
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--workers', str(workers),
+         '--threads', str(max(1, sessions // workers)), '--bind', f'127.0.0.1:{port}', '--log-level', 'warning', 'main:app'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        base_url = f'http://127.0.0.1:{port}'
+        _wait_until_up(f'{base_url}/api/pipeline_stats', timeout=120)
+        report = _simulate(sessions, turns, _HttpPoster(base_url), warmup_turns)
+        report['workers'] = workers
+        return report
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+
+
+def _metrics(results, prefix=''):
+    """Flatten nested results into {'section.name.metric': value} of comparable numbers"""
+    flat = {}
+    for key, value in results.items():
+        path = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(_metrics(value, f'{path}.'))
+        elif isinstance(value, (int, float)) and key not in UNCOMPARED_METRICS:
+            flat[path] = value
+    return flat
+
+
+def compare(results, baseline, threshold, tail_threshold, noise_floor=0.0):
+    """[(metric, baseline, current, change)] of every metric that regressed beyond its threshold"""
+    current = _metrics(results['benchmarks'])
+    regressions = []
+    for metric, reference in _metrics(baseline['benchmarks']).items():
+        value = current.get(metric)
+        if value is None or reference <= 0:
+            continue
+        name = metric.rsplit('.', 1)[-1]
+        if name in HIGHER_IS_BETTER:
+            change = reference / value - 1 if value > 0 else float('inf')
+        elif value - reference <= noise_floor:
+            continue
+        else:
+            change = value / reference - 1
+        if change > (tail_threshold if name in TAIL_METRICS else threshold):
+            regressions.append((metric, reference, value, change))
+    return regressions
+
+
+def _print_results(results):
+    benchmarks = results['benchmarks']
+    for name, stats in benchmarks.get('micro', {}).items():
+        print(f"  {name:<26}{stats['mean']:9.1f} us mean{stats['p50']:9.1f} p50{stats['p95']:9.1f} p95{stats['p99']:9.1f} p99")
+    for mode in ('test_client', 'gunicorn'):
+        report = benchmarks.get(mode)
+        if not report:
+            continue
+        print(f"  {mode}: {report['throughput_rps']:.1f} requests/sec")
+        for endpoint in ('send_message', 'voice_message', 'all'):
+            stats = report[endpoint]
+            print(f"    {endpoint:<16}{stats['p50']:9.2f} ms p50{stats['p95']:9.2f} p95{stats['p99']:9.2f} p99 ({stats['count']} requests)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--only', choices=['micro', 'test_client', 'gunicorn'], action='append',
+                        help='Run only these parts (repeatable; default: all).')
+    parser.add_argument('--iterations', type=int, default=2000, help='Calls per micro-benchmark.')
+    parser.add_argument('--repeat', type=int, default=3, help='Rounds per micro-benchmark; the fastest is kept.')
+    parser.add_argument('--sessions', type=int, default=8, help='Concurrent simulated sessions.')
+    parser.add_argument('--turns', type=int, default=50, help='Timed turns per simulated session.')
+    parser.add_argument('--warmup-turns', type=int, default=4, help='Untimed turns each session sends first.')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers.')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--output', default=None, help='Write the results JSON here.')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='Baseline results to compare against.')
+    parser.add_argument('--threshold', type=float, default=0.5, help='Allowed relative regression (0.5 = 50%%).')
+    parser.add_argument('--tail-threshold', type=float, default=1.5, help='Allowed relative regression of p95/p99 latencies.')
+    parser.add_argument('--noise-floor', type=float, default=1.0, help='Smallest latency increase that can count as a regression.')
+    parser.add_argument('--save-baseline', action='store_true', help='Store these results as the new baseline.')
+    args = parser.parse_args()
+    parts = args.only or ['micro', 'test_client', 'gunicorn']
+
+    # Everything runs against a throwaway database; set it before the app is imported
+    database_url = f'sqlite:///{tempfile.mkdtemp()}/bench.db'
+    os.environ['DATABASE_URL'] = database_url
+    from app import app  # noqa: F401
+
+    # Keep per-request log lines out of the in-process timings
+    logging.getLogger().setLevel(logging.WARNING)
+
+    benchmarks = {}
+    if 'micro' in parts:
+        benchmarks['micro'] = run_micro(args.iterations, args.repeat)
+    if 'test_client' in parts:
+        benchmarks['test_client'] = run_test_client(args.sessions, args.turns, args.warmup_turns)
+    if 'gunicorn' in parts:
+        benchmarks['gunicorn'] = run_gunicorn(args.sessions, args.turns, args.warmup_turns, args.workers, args.port, database_url)
+
+    results = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.platform(),
+        'config': {'iterations': args.iterations, 'repeat': args.repeat, 'sessions': args.sessions, 'turns': args.turns, 'warmup_turns': args.warmup_turns, 'workers': args.workers},
+        'benchmarks': benchmarks
+    }
+    _print_results(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline stored in {args.baseline}")
+        return 0
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one")
+        return 0
+
+    if baseline.get('config') != results['config']:
+        print(f"Note: baseline was recorded with {baseline.get('config')}")
+    regressions = compare(results, baseline, args.threshold, args.tail_threshold, args.noise_floor)
+    for metric, reference, value, change in regressions:
+        print(f"REGRESSION {metric}: {reference:.2f} -> {value:.2f} ({change:+.0%})")
+    if regressions:
+        return 1
+    print(f"No regression beyond {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,262 @@
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+from sqlalchemy import select, update
+
+from app import app
+from emotion_codes import encode_emotions, unknown_emotions
+from extensions import db
+from models import Conversation
+
+
+def _rescore_chunk(rows):
+    """Re-run emotion analysis for a chunk of (id, user_message) rows"""
+    from ai_service import ai_service
+
+    analyses = ai_service.analyze_batch([message for _, message in rows])
+    results = []
+    for (conversation_id, _), analysis in zip(rows, analyses):
+        # Like the backfill, leave the mask NULL rather than drop unknown emotions
+        mask, ranks = (None, None) if unknown_emotions(analysis['emotions']) else encode_emotions(analysis['emotions'])
+        results.append({
+            'id': conversation_id,
+            'emotions': json.dumps(analysis['emotions']),
+            'emotion_mask': mask,
+            'emotion_ranks': ranks,
+            'primary_emotion': analysis['primary_emotion'],
+            'sentiment_score': analysis['sentiment_score']
+        })
+    return results
+
+
+def _iter_chunks(start_id, chunk_size):
+    """Stream (id, user_message) rows in id order, one keyset page at a time"""
+    last_id = start_id
+    while True:
+        rows = db.session.execute(
+            select(Conversation.id, Conversation.user_message)
+            .where(Conversation.id > last_id)
+            .order_by(Conversation.id)
+            .limit(chunk_size)
+        ).all()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield [tuple(row) for row in rows]
+
+
+def _read_checkpoint(path):
+    try:
+        with open(path) as f:
+            return int(f.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def _write_checkpoint(path, last_id):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(str(last_id))
+    os.replace(tmp_path, path)
+
+
+@app.cli.command('rescore-conversations')
+@click.option('--chunk-size', default=2000, show_default=True, help='Rows read, scored and written per batch.')
+@click.option('--workers', default=os.cpu_count() or 1, show_default=True, help='Scoring processes; 0 scores in-process.')
+@click.option('--checkpoint', default='.rescore_checkpoint', show_default=True, help='File recording the last rewritten id.')
+@click.option('--restart', is_flag=True, help='Ignore the checkpoint and start from the first row.')
+def rescore_conversations(chunk_size, workers, checkpoint, restart):
+    """Recompute emotions, primary_emotion and sentiment_score for stored conversations."""
+    start_id = 0 if restart else _read_checkpoint(checkpoint)
+    if start_id:
+        click.echo(f"Resuming after conversation id {start_id}")
+
+    processed = 0
+    started = time.monotonic()
+
+    def write(results):
+        nonlocal processed
+        db.session.execute(update(Conversation), results)
+        db.session.commit()
+        _write_checkpoint(checkpoint, results[-1]['id'])
+        processed += len(results)
+        elapsed = max(time.monotonic() - started, 1e-9)
+        click.echo(f"{processed} rows rescored (last id {results[-1]['id']}), {processed / elapsed:.0f} rows/sec")
+
+    if workers <= 0:
+        for rows in _iter_chunks(start_id, chunk_size):
+            write(_rescore_chunk(rows))
+    else:
+        # Keep a bounded number of chunks in flight and write them back in
+        # id order so the checkpoint only ever moves forward
+        in_flight = deque()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for rows in _iter_chunks(start_id, chunk_size):
+                in_flight.append(pool.submit(_rescore_chunk, rows))
+                if len(in_flight) >= workers * 2:
+                    write(in_flight.popleft().result())
+            while in_flight:
+                write(in_flight.popleft().result())
+
+    elapsed = time.monotonic() - started
+    click.echo(f"Done: {processed} rows in {elapsed:.1f}s")
+    click.echo("Primary emotions may have changed; run `flask rebuild-mood-rollups` and `flask rebuild-session-states` to refresh them")
+    click.echo("Archived turns are not rescored; the rebuilds fold them in with the scores they were archived with")
+
+
+@app.cli.command('tts-prerender')
+@click.option('--voice', default=None, help='Voice id passed to the synthesizer.')
+@click.option('--rate', default=None, type=int, help='Speech rate (defaults to TTS_RATE).')
+def tts_prerender(voice, rate):
+    """Warm the TTS audio cache for every fixed response and coping strategy."""
+    from ai_service import ai_service
+    from tts import tts_service
+
+    texts = [ai_service._get_crisis_response(), ai_service._get_fallback_response()]
+    for patterns in (ai_service.response_patterns, ai_service.coping_strategies):
+        for responses in patterns.values():
+            texts.extend(responses)
+    texts = list(dict.fromkeys(texts))
+
+    started = time.monotonic()
+    futures = [future for _, future in (tts_service.request(text, voice, rate) for text in texts) if future is not None]
+    failed = 0
+    for future in futures:
+        try:
+            future.result()
+        except Exception:
+            failed += 1
+
+    elapsed = time.monotonic() - started
+    click.echo(f"{len(texts)} texts: {len(texts) - len(futures)} already cached, "
+               f"{len(futures) - failed} rendered, {failed} failed in {elapsed:.1f}s")
+
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Fingerprint and precompress static files for long-lived caching."""
+    from assets import asset_pipeline, build_assets
+
+    manifest = build_assets(app.static_folder, asset_pipeline.output_dir)
+    asset_pipeline.load_manifest()
+    click.echo(f"Built {len(manifest)} assets into {asset_pipeline.output_dir}")
+
+
+@app.cli.command('migrate-db')
+@click.option('--chunk-size', default=5000, show_default=True, help='Rows backfilled per transaction.')
+def migrate_db(chunk_size):
+    """Apply schema migrations and backfill derived columns on existing rows."""
+    from migrations import backfill_emotion_masks, run_migrations
+
+    run_migrations()
+    started = time.monotonic()
+    for updated in backfill_emotion_masks(chunk_size):
+        elapsed = max(time.monotonic() - started, 1e-9)
+        click.echo(f"{updated} conversations backfilled, {updated / elapsed:.0f} rows/sec")
+    click.echo("Migrations complete")
+
+
+@app.cli.command('rebuild-mood-rollups')
+@click.option('--chunk-size', default=10000, show_default=True, help='Rollup rows inserted per statement.')
+def rebuild_mood_rollups(chunk_size):
+    """Recompute the daily mood rollups from all saved conversations."""
+    from mood_rollups import mood_rollups
+
+    started = time.monotonic()
+    written = mood_rollups.rebuild(chunk_size)
+    click.echo(f"Wrote {written} mood rollup rows in {time.monotonic() - started:.1f}s")
+
+
+@app.cli.command('rebuild-session-states')
+@click.option('--chunk-size', default=10000, show_default=True, help='Conversation rows fetched (and states inserted) per batch.')
+def rebuild_session_states(chunk_size):
+    """Recompute every session's running emotional state from its saved conversations."""
+    from session_state import session_states
+
+    started = time.monotonic()
+    written = session_states.rebuild(chunk_size)
+    click.echo(f"Wrote {written} session states in {time.monotonic() - started:.1f}s")
+
+
+@app.cli.command('build-retrieval-index')
+def build_retrieval_index():
+    """Fit the TF-IDF retrieval index over the canned texts and save it for memory-mapping."""
+    from retrieval import retrieval_index
+
+    started = time.monotonic()
+    manifest = retrieval_index.build()
+    click.echo(
+        f"Indexed {manifest['documents']} documents ({len(manifest['vocabulary'])} terms) "
+        f"into {retrieval_index.index_dir} in {time.monotonic() - started:.1f}s"
+    )
+
+
+@app.cli.command('archive-expired')
+@click.option('--max-age-days', default=None, type=int, help='Override RETENTION_MAX_AGE_DAYS (0 disables the age policy).')
+@click.option('--max-rows', default=None, type=int, help='Override RETENTION_MAX_ROWS (0 disables the size policy).')
+@click.option('--vacuum', is_flag=True, help='Reclaim the freed space afterwards (SQLite only).')
+def archive_expired(max_age_days, max_rows, vacuum):
+    """Move expired conversations and suggestions into the gzip JSONL archive."""
+    from retention import RETAINED_MODELS, retention
+
+    if max_age_days is not None:
+        retention.max_age_days = max_age_days or None
+    if max_rows is not None:
+        retention.max_rows = max_rows or None
+
+    started = time.monotonic()
+    for name in RETAINED_MODELS:
+        archived = 0
+        try:
+            for archived in retention.archive(name):
+                elapsed = max(time.monotonic() - started, 1e-9)
+                click.echo(f"{archived} {name} rows archived, {archived / elapsed:.0f} rows/sec")
+        except RuntimeError as e:
+            raise click.ClickException(str(e))
+        click.echo(f"{name}: {archived} rows archived")
+    click.echo(f"Remaining rows: {retention.counts()}; archives in {retention.archive_dir}")
+
+    if vacuum and db.engine.dialect.name == 'sqlite':
+        with db.engine.connect() as connection:
+            connection.exec_driver_sql('VACUUM')
+        click.echo("Vacuumed the database")
+
+
+@app.cli.command('restore-archive')
+@click.option('--table', 'tables', multiple=True, type=click.Choice(['conversation', 'suggestion']), help='Tables to restore (default: all).')
+@click.option('--month', 'months', multiple=True, help='Archive months to restore, as YYYY-MM (default: all).')
+def restore_archive(tables, months):
+    """Insert archived conversations and suggestions back into the database."""
+    from retention import RETAINED_MODELS, retention
+
+    started = time.monotonic()
+    for name in tables or RETAINED_MODELS:
+        restored = 0
+        for restored in retention.restore(name, set(months)):
+            elapsed = max(time.monotonic() - started, 1e-9)
+            click.echo(f"{restored} {name} rows restored, {restored / elapsed:.0f} rows/sec")
+        click.echo(f"{name}: {restored} rows restored")
+    click.echo("Restored rows still match the retention policies; raise them before the next `flask archive-expired`")
+
+
+@app.cli.command('export-history')
+@click.option('--session-id', default=None, help='Export one session (default: every session).')
+@click.option('--format', 'export_format', default='ndjson', show_default=True, type=click.Choice(['ndjson', 'csv']))
+@click.option('--gzip', 'compress', is_flag=True, help='Gzip the output on the fly.')
+@click.option('--output', default='-', show_default=True, help='File to write; - writes to stdout.')
+@click.option('--chunk-size', default=1000, show_default=True, help='Rows fetched per cursor round trip.')
+def export_history(session_id, export_format, compress, output, chunk_size):
+    """Stream conversation and suggestion history as NDJSON or CSV without loading it into memory."""
+    from export import iter_export, iter_records
+
+    started = time.monotonic()
+    written = 0
+    with click.open_file(output, 'wb') as f:
+        for chunk in iter_export(iter_records(session_id, chunk_size), export_format, compress):
+            f.write(chunk)
+            written += len(chunk)
+    click.echo(f"Wrote {written} bytes in {time.monotonic() - started:.1f}s", err=True)
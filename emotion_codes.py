@@ -0,0 +1,84 @@
+"""Compact integer encoding of detected emotions.
+
+Each emotion owns one bit of ``emotion_mask`` (set membership, filterable
+with a bitwise AND in SQL) and a 4-bit code used to pack the first
+``MAX_RANKED`` emotions, in order, into ``emotion_ranks``.
+
+The vocabulary is append-only: stored masks depend on these positions.
+Rank code 0 marks an empty slot, so 4-bit codes fit 15 emotions and the
+vocabulary is full. A 16th emotion needs a wider RANK_BITS (and fewer
+MAX_RANKED slots, or a wider column) plus a migration that re-encodes
+every stored emotion_ranks value.
+"""
+
+EMOTION_VOCABULARY = (
+    'anxiety', 'depression', 'stress', 'anger', 'loneliness', 'fear', 'sadness',
+    'happiness', 'excitement', 'calm', 'confusion', 'guilt', 'gratitude',
+    'neutral', 'crisis'
+)
+
+EMOTION_INDEX = {emotion: i for i, emotion in enumerate(EMOTION_VOCABULARY)}
+
+RANK_BITS = 4
+MAX_RANKED = 7  # 7 x 4 bits stays within a signed 32-bit INTEGER column
+
+# A code past 4 bits would spill into the next rank slot and corrupt every decode
+assert len(EMOTION_VOCABULARY) < 1 << RANK_BITS, "EMOTION_VOCABULARY has outgrown the RANK_BITS rank codes"
+
+
+def emotion_mask(*emotions):
+    """Bitmask with the bit of every given (known) emotion set"""
+    mask = 0
+    for emotion in emotions:
+        index = EMOTION_INDEX.get(emotion)
+        if index is not None:
+            mask |= 1 << index
+    return mask
+
+
+def unknown_emotions(emotions):
+    """Emotions of a list that have no code, in order"""
+    return [emotion for emotion in emotions if emotion not in EMOTION_INDEX]
+
+
+def encode_emotions(emotions):
+    """Encode an ordered emotion list as (mask, ranks).
+
+    Emotions outside the vocabulary are skipped, so a list containing any
+    (see unknown_emotions) must not be stored as a mask alone.
+    """
+    mask = 0
+    ranks = 0
+    ranked = 0
+    for emotion in emotions:
+        index = EMOTION_INDEX.get(emotion)
+        if index is None or mask & (1 << index):
+            continue
+        mask |= 1 << index
+        if ranked < MAX_RANKED:
+            ranks |= (index + 1) << (ranked * RANK_BITS)
+            ranked += 1
+    return mask, ranks
+
+
+def decode_emotions(mask, ranks):
+    """Ordered emotion list from (mask, ranks).
+
+    Emotions beyond the first MAX_RANKED follow in vocabulary order.
+    """
+    emotions = []
+    seen = 0
+    while ranks:
+        index = (ranks & ((1 << RANK_BITS) - 1)) - 1
+        emotions.append(EMOTION_VOCABULARY[index])
+        seen |= 1 << index
+        ranks >>= RANK_BITS
+
+    remaining = mask & ~seen
+    index = 0
+    while remaining:
+        if remaining & 1:
+            emotions.append(EMOTION_VOCABULARY[index])
+        remaining >>= 1
+        index += 1
+    return emotions
@@ -0,0 +1,217 @@
+import re
+
+# Distinct words whose keyword hits are remembered; the memo starts over when full
+WORD_MEMO_SIZE = 65536
+
+_NO_HITS = ((), ())
+
+
+class EmotionMatcher:
+    """Keyword matcher compiled once for a whole emotion lexicon.
+
+    Keywords match anywhere in the lowercased text, inside words too, and
+    score higher when they stand as whole words (see find_keywords). The
+    text is split on spaces and every distinct word is looked up in a memo
+    of the keywords it contains, so a message costs one dict lookup per
+    word plus its hits, whatever the lexicon size. Only a word seen for the
+    first time is scanned, by a trie-shaped regex of the single-word
+    keywords; that scan does get slower as the lexicon grows. Keywords of
+    several words ("burned out") are matched across consecutive words.
+    """
+
+    def __init__(self, emotion_keywords, memo_size=WORD_MEMO_SIZE):
+        self.emotions = list(emotion_keywords.keys())
+        self._emotion_order = {emotion: i for i, emotion in enumerate(self.emotions)}
+
+        # keyword -> emotions it counts towards (some keywords are shared)
+        self.keyword_emotions = {}
+        for emotion, keywords in emotion_keywords.items():
+            for keyword in keywords:
+                self.keyword_emotions.setdefault(keyword.lower(), []).append(emotion)
+
+        keywords = list(self.keyword_emotions)
+        words = [keyword for keyword in keywords if ' ' not in keyword]
+        # (keyword, its words) of every keyword spanning several words
+        self._phrases = [(keyword, keyword.split(' ')) for keyword in keywords if ' ' in keyword]
+        # first word of a phrase -> indexes of the phrases it starts
+        self._phrase_starts = {}
+        for index, (_, parts) in enumerate(self._phrases):
+            self._phrase_starts.setdefault(parts[0], []).append(index)
+
+        # keyword -> every shorter keyword that is a prefix of it, so the
+        # longest match at a position also yields the shorter ones there
+        self._prefixes = {
+            keyword: [other for other in words if other != keyword and keyword.startswith(other)]
+            for keyword in words
+        }
+        self.pattern = self._compile(words)
+
+        # word -> (((keyword, weight), ...), ((phrase index, whole word), ...))
+        self._word_hits = {}
+        self.memo_size = memo_size
+
+        # Column index of each keyword in the batch hit matrix
+        self._keyword_index = {keyword: i for i, keyword in enumerate(keywords)}
+        self._incidence = None
+
+    @staticmethod
+    def _compile(keywords):
+        """Compile the keywords into one longest-first trie regex"""
+        if not keywords:
+            return None
+
+        trie = {}
+        for keyword in keywords:
+            node = trie
+            for char in keyword:
+                node = node.setdefault(char, {})
+            node[''] = True
+
+        def build(node):
+            terminal = '' in node
+            branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+            if not branches:
+                return ''
+            body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+            # Greedy optional tries the longer continuation first
+            if terminal:
+                return f"(?:{body})?"
+            return body
+
+        return re.compile(build(trie))
+
+    def _scan_word(self, word):
+        """Memo entry of one space-free word: its keyword hits and the phrases it can start"""
+        hits = {}
+        if self.pattern is not None:
+            search = self.pattern.search
+            match = search(word)
+            while match:
+                longest = match.group()
+                for keyword in [longest] + self._prefixes[longest]:
+                    hits[keyword] = 2 if keyword == word else hits.get(keyword, 1)
+                # Resume one character on so overlapping keywords are not skipped
+                match = search(word, match.start() + 1)
+        # A phrase can start in any suffix of the word
+        starts = tuple(
+            (index, cut == 0)
+            for cut in range(len(word))
+            for index in self._phrase_starts.get(word[cut:], ())
+        )
+        entry = (tuple(hits.items()), starts) if hits or starts else _NO_HITS
+
+        if len(self._word_hits) >= self.memo_size:
+            self._word_hits.clear()
+        self._word_hits[word] = entry
+        return entry
+
+    def _phrase_weight(self, words, position, index, whole_first):
+        """Weight of the phrase starting in words[position]: 0 if it does not continue there"""
+        _, parts = self._phrases[index]
+        last = position + len(parts) - 1
+        if last >= len(words) or not words[last].startswith(parts[-1]):
+            return 0
+        if words[position + 1:last] != parts[1:-1]:
+            return 0
+        return 2 if whole_first and words[last] == parts[-1] else 1
+
+    def find_keywords(self, text_lower):
+        """Return {keyword: weight} for every keyword found in lowercased text.
+
+        A keyword scores 2 when at least one occurrence is bounded by spaces
+        (or the ends of the text) and 1 when it only appears inside a word.
+        """
+        words = text_lower.split(' ')
+        memo = self._word_hits
+        found = {}
+        phrase_words = None
+        for word in set(words):
+            entry = memo.get(word)
+            if entry is None:
+                entry = self._scan_word(word)
+            if entry is _NO_HITS:
+                continue
+            hits, starts = entry
+            for keyword, weight in hits:
+                if found.get(keyword, 0) < weight:
+                    found[keyword] = weight
+            if starts:
+                if phrase_words is None:
+                    phrase_words = {}
+                phrase_words[word] = starts
+
+        if phrase_words:
+            for position, word in enumerate(words):
+                starts = phrase_words.get(word)
+                if starts is None:
+                    continue
+                for index, whole_first in starts:
+                    weight = self._phrase_weight(words, position, index, whole_first)
+                    keyword = self._phrases[index][0]
+                    if weight > found.get(keyword, 0):
+                        found[keyword] = weight
+        return found
+
+    def score(self, text):
+        """Return {emotion: score} summed over the keywords found in text"""
+        emotion_scores = {}
+        for keyword, weight in self.find_keywords(text.lower()).items():
+            for emotion in self.keyword_emotions[keyword]:
+                emotion_scores[emotion] = emotion_scores.get(emotion, 0) + weight
+        return emotion_scores
+
+    def rank(self, emotion_scores):
+        """Order emotions by score (highest first), ties in lexicon order"""
+        return sorted(emotion_scores, key=lambda emotion: (-emotion_scores[emotion], self._emotion_order[emotion]))
+
+    def _incidence_matrix(self):
+        """Sparse keyword x emotion incidence matrix, built on first batch"""
+        if self._incidence is None:
+            import numpy as np
+            from scipy.sparse import csr_matrix
+
+            rows, cols = [], []
+            for keyword, emotions in self.keyword_emotions.items():
+                for emotion in emotions:
+                    rows.append(self._keyword_index[keyword])
+                    cols.append(self._emotion_order[emotion])
+            self._incidence = csr_matrix(
+                (np.ones(len(rows), dtype=np.int32), (rows, cols)),
+                shape=(len(self._keyword_index), len(self.emotions))
+            )
+        return self._incidence
+
+    def score_batch(self, texts):
+        """Score many texts at once, returning an (n_texts, n_emotions) array.
+
+        The keyword weights of each text become one row of a sparse text x
+        keyword matrix, which is multiplied by the keyword x emotion
+        incidence matrix.
+        """
+        import numpy as np
+        from scipy.sparse import csr_matrix
+
+        if not texts:
+            return np.zeros((0, len(self.emotions)), dtype=np.int32)
+
+        rows, columns, weights = [], [], []
+        for row, text in enumerate(texts):
+            for keyword, weight in self.find_keywords(text.lower()).items():
+                rows.append(row)
+                columns.append(self._keyword_index[keyword])
+                weights.append(weight)
+
+        hits = csr_matrix(
+            (np.asarray(weights, dtype=np.int32), (rows, columns)),
+            shape=(len(texts), len(self._keyword_index))
+        )
+        return (hits @ self._incidence_matrix()).toarray()
+
+    def rank_batch(self, scores):
+        """Ranked emotion lists for each row of a score_batch result"""
+        import numpy as np
+
+        # Stable sort keeps lexicon order between equal scores
+        order = np.argsort(-scores, axis=1, kind='stable')
+        counts = (scores > 0).sum(axis=1)
+        return [[self.emotions[i] for i in row[:count]] for row, count in zip(order.tolist(), counts.tolist())]
@@ -0,0 +1,152 @@
+"""Streaming export of conversation and suggestion history.
+
+Rows are read through server-side cursors (``yield_per``), merged into
+one timestamp-ordered stream and serialized a batch at a time, so memory
+stays flat however long the history is. Each output line is one turn or
+one suggestion, tagged with its ``record_type``.
+"""
+import csv
+import heapq
+import io
+import json
+import zlib
+from datetime import datetime
+
+from sqlalchemy import select
+
+from emotion_codes import decode_emotions
+from extensions import db
+from models import Conversation, Suggestion
+
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+CSV_COLUMNS = (
+    'record_type', 'id', 'session_id', 'timestamp',
+    'user_message', 'ai_response', 'emotions', 'primary_emotion', 'sentiment_score',
+    'emotion', 'suggestion_type', 'content', 'title', 'url'
+)
+
+
+def _emotions(mask, ranks, emotions_json):
+    if mask is not None:
+        return decode_emotions(mask, ranks or 0)
+    # Row predates the bitmask columns
+    try:
+        return json.loads(emotions_json) if emotions_json else []
+    except ValueError:
+        return []
+
+
+# Merge key of a row; NULL timestamps sort first, as the queries order them
+def _merge_key(timestamp, kind, row_id):
+    return (timestamp or datetime.min, kind, row_id)
+
+
+def _timestamp(value):
+    return value.isoformat() if value else None
+
+
+def _conversations(session_id, chunk_size):
+    query = select(
+        Conversation.id, Conversation.session_id, Conversation.timestamp,
+        Conversation.user_message, Conversation.ai_response,
+        Conversation.emotion_mask, Conversation.emotion_ranks, Conversation.emotions,
+        Conversation.primary_emotion, Conversation.sentiment_score
+    )
+    if session_id is not None:
+        query = query.where(Conversation.session_id == session_id)
+    query = query.order_by(Conversation.timestamp.nulls_first(), Conversation.id).execution_options(yield_per=chunk_size)
+    for row in db.session.execute(query):
+        yield _merge_key(row.timestamp, 0, row.id), {
+            'record_type': 'conversation',
+            'id': row.id,
+            'session_id': row.session_id,
+            'timestamp': _timestamp(row.timestamp),
+            'user_message': row.user_message,
+            'ai_response': row.ai_response,
+            'emotions': _emotions(row.emotion_mask, row.emotion_ranks, row.emotions),
+            'primary_emotion': row.primary_emotion,
+            'sentiment_score': row.sentiment_score
+        }
+
+
+def _suggestions(session_id, chunk_size):
+    from suggestion_catalog import suggestion_catalog
+
+    query = select(Suggestion.id, Suggestion.session_id, Suggestion.timestamp, Suggestion.catalog_id)
+    if session_id is not None:
+        query = query.where(Suggestion.session_id == session_id)
+    query = query.order_by(Suggestion.timestamp.nulls_first(), Suggestion.id).execution_options(yield_per=chunk_size)
+    for row in db.session.execute(query):
+        # Texts come from the cached catalog rather than a join
+        entry = suggestion_catalog.get(row.catalog_id)
+        yield _merge_key(row.timestamp, 1, row.id), {
+            'record_type': 'suggestion',
+            'id': row.id,
+            'session_id': row.session_id,
+            'timestamp': _timestamp(row.timestamp),
+            'emotion': entry.emotion if entry else None,
+            'suggestion_type': entry.suggestion_type if entry else None,
+            'content': entry.content if entry else None,
+            'title': entry.title if entry else None,
+            'url': entry.url if entry else None
+        }
+
+
+def iter_records(session_id=None, chunk_size=1000):
+    """Conversation and suggestion records of one session (or every session) in timestamp order.
+
+    Turns still queued for write-behind (at most WRITE_BEHIND_FLUSH_INTERVAL
+    old) are not included; the request does not wait for the writer.
+    """
+    merged = heapq.merge(_conversations(session_id, chunk_size), _suggestions(session_id, chunk_size), key=lambda item: item[0])
+    for _, record in merged:
+        yield record
+
+
+def _ndjson_lines(records):
+    for record in records:
+        yield json.dumps(record) + '\n'
+
+
+def _csv_lines(records):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_COLUMNS, extrasaction='ignore')
+    writer.writeheader()
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    for record in records:
+        if 'emotions' in record:
+            record = dict(record, emotions=','.join(record['emotions']))
+        writer.writerow(record)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def iter_export(records, export_format='ndjson', compress=False, batch_size=500):
+    """Serialize records to bytes chunks of about batch_size rows, gzip-compressed on the fly if asked"""
+    lines = _csv_lines(records) if export_format == 'csv' else _ndjson_lines(records)
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31: gzip container
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= batch_size:
+            chunk = ''.join(batch).encode('utf-8')
+            batch = []
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+
+    chunk = ''.join(batch).encode('utf-8')
+    if compressor is not None:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+
+def export_filename(session_id, export_format, compress=False):
+    name = f"history-{session_id or 'all'}.{export_format}"
+    return f'{name}.gz' if compress else name
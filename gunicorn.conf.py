@@ -0,0 +1,105 @@
+import gc
+import os
+
+# Import the app (and load the NLP models, see when_ready) once in the master,
+# so workers share those pages copy-on-write instead of each building a copy.
+# GUNICORN_PRELOAD=0 goes back to importing the app in every worker.
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") != "0"
+
+# Session state and shown-suggestion caches live in each worker. With several
+# workers a session's requests can alternate between them, and a worker's
+# cached copy misses the turns another worker saved. Those entries are then
+# kept only for MULTI_WORKER_CACHE_TTL seconds, less than it takes to type the
+# next message, so each turn reads the committed state. The analysis and
+# message fragment caches hold pure results of immutable input and stay as
+# configured.
+MULTI_WORKER_CACHE_TTL = float(os.environ.get("MULTI_WORKER_CACHE_TTL", 5))
+
+
+def _warm_up_models():
+    import ai_service
+    import sentiment_analyzer
+
+    sentiment_analyzer.warm_up()
+    ai_service.warm_up()
+
+
+def _limit_session_cache_ttl(cfg, log):
+    if cfg.workers <= 1:
+        return
+
+    from session_state import session_states
+    from suggestion_rotation import suggestion_rotation
+
+    for cache in (session_states.cache, suggestion_rotation.cache):
+        if not cache.ttl or cache.ttl > MULTI_WORKER_CACHE_TTL:
+            cache.ttl = MULTI_WORKER_CACHE_TTL
+    log.info(f"Session caches expire after {MULTI_WORKER_CACHE_TTL}s ({cfg.workers} workers)")
+
+
+def when_ready(server):
+    """With preload_app, migrate the database and load the models in the master before any worker is forked.
+
+    Without preload_app nothing runs once per deployment, so run
+    `flask migrate-db` before starting the workers.
+    """
+    if not server.cfg.preload_app:
+        return
+
+    from app import app
+    from extensions import db
+    from migrations import run_migrations
+
+    _limit_session_cache_ttl(server.cfg, server.log)
+
+    if os.environ.get("RUN_MIGRATIONS", "1") != "0":
+        with app.app_context():
+            run_migrations()
+        server.log.info("Database migrations applied in the master")
+
+    if os.environ.get("WARM_UP_MODELS", "1") != "0":
+        _warm_up_models()
+        server.log.info("NLP models loaded in the master")
+
+    # Connections opened while importing the app must not be shared with workers
+    with app.app_context():
+        db.engine.dispose()
+
+    # Keep the preloaded objects out of the workers' garbage collections, which
+    # would otherwise write to (and so un-share) every page they live on
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    """Give each preloaded worker its own database connection pool"""
+    if not server.cfg.preload_app:
+        return
+
+    from app import app
+    from extensions import db
+
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+
+def post_worker_init(worker):
+    """Without preload_app, set up each worker (cache TTLs, NLP models) before it starts serving requests"""
+    if worker.cfg.preload_app:
+        return
+
+    _limit_session_cache_ttl(worker.cfg, worker.log)
+
+    if os.environ.get("WARM_UP_MODELS", "1") == "0":
+        return
+
+    _warm_up_models()
+    worker.log.info("NLP models warmed up")
+
+
+def worker_exit(server, worker):
+    """Flush queued write-behind rows and session activity before the worker goes away"""
+    from activity import activity_tracker
+    from write_behind import write_behind
+
+    write_behind.shutdown()
+    activity_tracker.flush()
@@ -76,7 +76,16 @@ function initializeChatInterface() {
     });
     
     // Initialize speak buttons
-    const speakBtns = document.querySelectorAll('.speak-btn');
+    bindSpeakButtons(document);
+    
+    // Load older messages when scrolled to the top
+    if (chatMessages) {
+        initializeHistoryLoading(chatMessages);
+    }
+}
+
+function bindSpeakButtons(root) {
+    const speakBtns = root.querySelectorAll('.speak-btn');
     speakBtns.forEach(btn => {
         btn.addEventListener('click', function() {
             const text = this.getAttribute('data-text');
@@ -89,6 +98,46 @@ function initializeChatInterface() {
     });
 }
 
+function initializeHistoryLoading(chatMessages) {
+    // The page only renders the newest turns; older ones come from /api/history.
+    // chat.html (not part of this tree) is expected to render
+    // <div id="chatMessages" data-history-has-more="{{ 'true' if history_has_more else 'false' }}">{{ conversation_html }}</div>;
+    // the cursor is the data-conversation-id of each message_bubble.html group.
+    // Without the attribute, loading stops once /api/history reports has_more: false.
+    let hasMore = chatMessages.dataset.historyHasMore !== 'false';
+    let loading = false;
+    
+    chatMessages.addEventListener('scroll', async function() {
+        if (!hasMore || loading || chatMessages.scrollTop > 100) return;
+        
+        const oldest = chatMessages.querySelector('.message-group[data-conversation-id]');
+        if (!oldest) return;
+        
+        loading = true;
+        try {
+            const response = await fetch(`/api/history?before=${oldest.dataset.conversationId}`);
+            if (!response.ok) throw new Error(`History request failed with status ${response.status}`);
+            const data = await response.json();
+            hasMore = data.has_more;
+            
+            if (data.html) {
+                // Keep the visible messages in place while content is added above them
+                const previousHeight = chatMessages.scrollHeight;
+                const holder = document.createElement('div');
+                holder.innerHTML = data.html;
+                bindSpeakButtons(holder);
+                oldest.before(...holder.children);
+                chatMessages.scrollTop += chatMessages.scrollHeight - previousHeight;
+                if (window.feather) feather.replace();
+            }
+        } catch (error) {
+            console.error('Error loading older messages:', error);
+        } finally {
+            loading = false;
+        }
+    });
+}
+
 function initializeSuggestions() {
     // Handle suggestion card interactions
     const suggestionCards = document.querySelectorAll('.suggestion-card');
@@ -259,6 +308,78 @@ function speakText(text, button) {
     button.addEventListener('click', stopHandler);
 }
 
+// Queue text on the speech synthesizer without interrupting what is already playing
+function speakQueued(text) {
+    if (!text || !('speechSynthesis' in window)) return;
+    
+    const utterance = new SpeechSynthesisUtterance(text);
+    utterance.rate = 0.9;
+    utterance.pitch = 1;
+    utterance.volume = 0.8;
+    speechSynthesis.speak(utterance);
+}
+
+// Post a voice message to the streaming endpoint and dispatch each NDJSON event
+// ({event: 'response' | 'follow_up' | 'suggestions' | 'saved' | 'error', ...})
+// to handlers[event] as soon as its line arrives
+async function streamVoiceMessage(message, handlers) {
+    const response = await fetch('/voice_message/stream', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ message: message })
+    });
+    
+    if (!response.ok || !response.body) {
+        throw new Error(`Voice message failed with status ${response.status}`);
+    }
+    
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    const dispatch = (line) => {
+        if (!line.trim()) return;
+        const data = JSON.parse(line);
+        if (handlers[data.event]) {
+            handlers[data.event](data);
+        }
+    };
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        lines.forEach(dispatch);
+    }
+    dispatch(buffer);
+}
+
+// Append a message bubble to the chat (same markup as message_bubble.html)
+function appendMessageBubble(role, text) {
+    const chatMessages = document.getElementById('chatMessages');
+    if (!chatMessages) return null;
+    
+    const group = document.createElement('div');
+    group.className = `message-group ${role === 'user' ? 'user-message' : 'ai-message mt-3'}`;
+    
+    const content = document.createElement('div');
+    content.className = 'message-content';
+    
+    const bubble = document.createElement('div');
+    bubble.className = `message-bubble ${role === 'user' ? 'user-bubble' : 'ai-bubble'}`;
+    bubble.textContent = text;
+    bubble.style.whiteSpace = 'pre-line';
+    
+    content.appendChild(bubble);
+    group.appendChild(content);
+    chatMessages.appendChild(group);
+    scrollToBottom();
+    return bubble;
+}
+
 function scrollToBottom() {
     const chatMessages = document.getElementById('chatMessages');
     if (chatMessages) {
@@ -357,5 +478,8 @@ window.MindfulChat = {
     announceToScreenReader,
     formatTimestamp,
     detectBasicEmotion,
-    speakText
+    speakText,
+    speakQueued,
+    streamVoiceMessage,
+    appendMessageBubble
 };
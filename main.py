@@ -1,4 +1,9 @@
 from app import app  # noqa: F401
 
 if __name__ == '__main__':
+    from migrations import run_migrations
+
+    # The development server is a single process, so it can migrate on start
+    with app.app_context():
+        run_migrations()
     app.run(host='0.0.0.0', port=5000, debug=True)
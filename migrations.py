@@ -0,0 +1,123 @@
+import json
+import logging
+
+from sqlalchemy import inspect, select, text, update
+
+from emotion_codes import encode_emotions, unknown_emotions
+from extensions import db
+
+
+def _ensure_columns(model):
+    """Add nullable columns declared on a model that an existing table is missing"""
+    table = model.__table__
+    existing = {column['name'] for column in inspect(db.engine).get_columns(table.name)}
+    for column in table.columns:
+        if column.name not in existing:
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            logging.info(f"Adding column {table.name}.{column.name}")
+            with db.engine.begin() as connection:
+                connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+
+
+def _ensure_indexes(model):
+    """Create indexes declared on a model that an existing table is missing"""
+    existing = {index['name'] for index in inspect(db.engine).get_indexes(model.__tablename__)}
+    for index in model.__table__.indexes:
+        if index.name not in existing:
+            logging.info(f"Creating index {index.name}")
+            index.create(db.engine)
+
+
+def run_migrations():
+    """Bring an existing database up to the current models (idempotent)"""
+    from models import Conversation, UserSession
+
+    _ensure_columns(Conversation)
+    _ensure_indexes(Conversation)
+    _ensure_columns(UserSession)
+    _normalize_suggestions()
+
+
+def _normalize_suggestions():
+    """Move suggestion texts into suggestion_catalog, leaving (session_id, catalog_id, timestamp) rows.
+
+    Older databases stored the full content/title/url on every suggestion
+    row. Each distinct (emotion, suggestion_type, content) becomes one
+    catalog entry, and the suggestion table is rebuilt pointing at it, in
+    one transaction.
+    """
+    from models import Suggestion
+
+    inspector = inspect(db.engine)
+    columns = {column['name'] for column in inspector.get_columns('suggestion')}
+    if 'content' not in columns:
+        return
+
+    logging.info("Normalizing suggestion rows into suggestion_catalog")
+    legacy_indexes = [index['name'] for index in inspector.get_indexes('suggestion')]
+    with db.engine.begin() as connection:
+        connection.execute(text(
+            'INSERT INTO suggestion_catalog (emotion, suggestion_type, content, title, url) '
+            'SELECT s.emotion, s.suggestion_type, s.content, MAX(s.title), MAX(s.url) FROM suggestion s '
+            'WHERE NOT EXISTS (SELECT 1 FROM suggestion_catalog c WHERE c.emotion = s.emotion '
+            'AND c.suggestion_type = s.suggestion_type AND c.content = s.content) '
+            'GROUP BY s.emotion, s.suggestion_type, s.content'
+        ))
+        # The rebuilt table reuses the index names
+        for name in legacy_indexes:
+            connection.execute(text(f'DROP INDEX {name}'))
+        connection.execute(text('ALTER TABLE suggestion RENAME TO suggestion_legacy'))
+        Suggestion.__table__.create(connection)
+        connection.execute(text(
+            'INSERT INTO suggestion (id, session_id, catalog_id, timestamp) '
+            'SELECT s.id, s.session_id, c.id, s.timestamp FROM suggestion_legacy s '
+            'JOIN suggestion_catalog c ON c.emotion = s.emotion '
+            'AND c.suggestion_type = s.suggestion_type AND c.content = s.content'
+        ))
+        connection.execute(text('DROP TABLE suggestion_legacy'))
+        if connection.dialect.name == 'postgresql':
+            # Copied ids bypassed the new table's sequence
+            connection.execute(text(
+                "SELECT setval(pg_get_serial_sequence('suggestion', 'id'), COALESCE(MAX(id), 1)) FROM suggestion"
+            ))
+
+
+def backfill_emotion_masks(chunk_size=5000):
+    """Fill emotion_mask/emotion_ranks from the JSON emotions column.
+
+    Walks rows without a mask in id order, one chunk per transaction, and
+    yields the running total after each chunk. Rows listing emotions
+    outside the vocabulary keep a NULL mask, so Conversation.emotion_list
+    keeps reading them from the JSON column.
+    """
+    from models import Conversation
+
+    updated = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(Conversation.id, Conversation.emotions)
+            .where(Conversation.emotion_mask.is_(None), Conversation.id > last_id)
+            .order_by(Conversation.id)
+            .limit(chunk_size)
+        ).all()
+        if not rows:
+            return
+
+        values = []
+        for conversation_id, emotions in rows:
+            try:
+                emotion_list = json.loads(emotions) if emotions else []
+            except ValueError:
+                emotion_list = []
+            if unknown_emotions(emotion_list):
+                continue
+            mask, ranks = encode_emotions(emotion_list)
+            values.append({'id': conversation_id, 'emotion_mask': mask, 'emotion_ranks': ranks})
+
+        if values:
+            db.session.execute(update(Conversation), values)
+        db.session.commit()
+        last_id = rows[-1][0]
+        updated += len(values)
+        yield updated
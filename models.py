@@ -1,8 +1,17 @@
 from extensions import db
 from datetime import datetime
 from sqlalchemy import Text
+from emotion_codes import decode_emotions, emotion_mask, encode_emotions, unknown_emotions
+import json
 
 class Conversation(db.Model):
+    __table_args__ = (
+        # Keyset pagination of a session's history in timestamp order
+        db.Index('ix_conversation_session_timestamp_id', 'session_id', 'timestamp', 'id'),
+        # Covers time-windowed emotion filters ("sessions with anxiety this week")
+        db.Index('ix_conversation_timestamp_emotion_mask', 'timestamp', 'emotion_mask', 'session_id'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     session_id = db.Column(db.String(100), nullable=False, index=True)
     user_message = db.Column(Text, nullable=False)
@@ -11,6 +20,8 @@ class Conversation(db.Model):
     primary_emotion = db.Column(db.String(50), nullable=True)
     sentiment_score = db.Column(db.Float, nullable=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    emotion_mask = db.Column(db.Integer, nullable=True)  # One bit per emotion, see emotion_codes
+    emotion_ranks = db.Column(db.Integer, nullable=True)  # Ordered top emotions, 4 bits each
     
     def __init__(self, session_id, user_message, ai_response, emotions=None, primary_emotion=None, sentiment_score=None):
         self.session_id = session_id
@@ -19,6 +30,29 @@ class Conversation(db.Model):
         self.emotions = emotions
         self.primary_emotion = primary_emotion
         self.sentiment_score = sentiment_score
+        self.timestamp = datetime.utcnow()
+        emotion_list = json.loads(emotions) if emotions else []
+        unknown = unknown_emotions(emotion_list)
+        if unknown:
+            # The mask could not represent them and emotion_list would silently drop them
+            raise ValueError(f"Emotions outside EMOTION_VOCABULARY: {unknown}")
+        self.emotion_mask, self.emotion_ranks = encode_emotions(emotion_list)
+    
+    @property
+    def emotion_list(self):
+        """Detected emotions in order, decoded without parsing the JSON column"""
+        if self.emotion_mask is not None:
+            return decode_emotions(self.emotion_mask, self.emotion_ranks or 0)
+        # Row predates the bitmask columns, or holds emotions the mask cannot represent
+        try:
+            return json.loads(self.emotions) if self.emotions else []
+        except ValueError:
+            return []
+    
+    @classmethod
+    def has_emotion(cls, *emotions):
+        """SQL filter matching turns where any of the given emotions was detected"""
+        return cls.emotion_mask.op('&')(emotion_mask(*emotions)) != 0
     
     def __repr__(self):
         return f'<Conversation {self.id}: {self.session_id}>'
@@ -28,6 +62,8 @@ class UserSession(db.Model):
     session_id = db.Column(db.String(100), unique=True, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_active = db.Column(db.DateTime, default=datetime.utcnow)
+    shown_suggestions = db.Column(db.LargeBinary, nullable=True)  # Bitset of suggestions shown this rotation, see suggestion_rotation
+    suggestion_layout = db.Column(db.String(16), nullable=True)  # Pool layout the bitset was written for
     
     def __init__(self, session_id):
         self.session_id = session_id
@@ -35,23 +71,112 @@ class UserSession(db.Model):
     def __repr__(self):
         return f'<UserSession {self.session_id}>'
 
-class Suggestion(db.Model):
+class SuggestionCatalogEntry(db.Model):
+    """One distinct suggestion text, seeded from SuggestionEngine.suggestions_db.
+    
+    Ids are stable: entries are matched on (emotion, suggestion_type,
+    content) and never renumbered, so Suggestion rows only store the id.
+    """
+    __tablename__ = 'suggestion_catalog'
+    __table_args__ = (
+        db.UniqueConstraint('emotion', 'suggestion_type', 'content', name='uq_suggestion_catalog_entry'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
-    session_id = db.Column(db.String(100), nullable=False, index=True)
     emotion = db.Column(db.String(50), nullable=False)
     suggestion_type = db.Column(db.String(50), nullable=False)  # quote, resource, article, technique
     content = db.Column(Text, nullable=False)
     title = db.Column(db.String(200), nullable=True)
     url = db.Column(db.String(500), nullable=True)
+    
+    def __repr__(self):
+        return f'<SuggestionCatalogEntry {self.id}: {self.emotion} - {self.suggestion_type}>'
+
+class Suggestion(db.Model):
+    """A catalog suggestion shown to a session; the text lives in the cached catalog"""
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(100), nullable=False, index=True)
+    catalog_id = db.Column(db.Integer, db.ForeignKey('suggestion_catalog.id'), nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     
-    def __init__(self, session_id, emotion, suggestion_type, content, title=None, url=None):
+    def __init__(self, session_id, entry):
         self.session_id = session_id
-        self.emotion = emotion
-        self.suggestion_type = suggestion_type
-        self.content = content
-        self.title = title
-        self.url = url
+        self.catalog_id = entry.id
+        self.timestamp = datetime.utcnow()
+        self._entry = entry
+    
+    @property
+    def entry(self):
+        """The catalog entry (suggestion_catalog.CatalogEntry) this row points at"""
+        entry = self.__dict__.get('_entry')
+        if entry is None:
+            from suggestion_catalog import suggestion_catalog
+            entry = suggestion_catalog.get(self.catalog_id)
+            self._entry = entry
+        return entry
+    
+    @property
+    def emotion(self):
+        return self.entry.emotion
+    
+    @property
+    def suggestion_type(self):
+        return self.entry.suggestion_type
+    
+    @property
+    def content(self):
+        return self.entry.content
+    
+    @property
+    def title(self):
+        return self.entry.title
+    
+    @property
+    def url(self):
+        return self.entry.url
+    
+    def __repr__(self):
+        return f'<Suggestion {self.id}: {self.session_id} - {self.catalog_id}>'
+
+class MoodRollup(db.Model):
+    """Daily primary-emotion counts and sentiment totals, per session and global.
+    
+    Maintained incrementally as turns are saved (see mood_rollups.py), so
+    trend queries read a few rows per day instead of scanning Conversation.
+    """
+    __tablename__ = 'mood_rollup'
+    __table_args__ = (
+        db.UniqueConstraint('session_id', 'day', 'emotion', name='uq_mood_rollup_session_day_emotion'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(100), nullable=False)  # GLOBAL_SCOPE ('*') for all sessions
+    day = db.Column(db.Date, nullable=False)
+    emotion = db.Column(db.String(50), nullable=False)
+    turns = db.Column(db.Integer, nullable=False, default=0)
+    sentiment_sum = db.Column(db.Float, nullable=False, default=0.0)
+    sentiment_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<MoodRollup {self.session_id} {self.day} {self.emotion}: {self.turns}>'
+
+class SessionState(db.Model):
+    """Running emotional state of one session, updated once per saved turn.
+    
+    Decayed emotion and theme weights are packed float32 vectors (see
+    session_state.py), so personalization reads one small row however long
+    the session's history is.
+    """
+    __tablename__ = 'session_state'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(100), unique=True, nullable=False)
+    turns = db.Column(db.Integer, nullable=False, default=0)
+    emotion_weights = db.Column(db.LargeBinary, nullable=False)  # float32 per emotion_codes.EMOTION_VOCABULARY entry
+    theme_weights = db.Column(db.LargeBinary, nullable=False)  # float32 per session_state.THEME_VOCABULARY entry
+    streak_emotion = db.Column(db.String(50), nullable=True)  # Primary emotion of the latest run of turns
+    streak_length = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     def __repr__(self):
-        return f'<Suggestion {self.id}: {self.emotion} - {self.suggestion_type}>'
+        return f'<SessionState {self.session_id}: {self.turns} turns>'
@@ -0,0 +1,232 @@
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, insert, select, update
+
+from extensions import db, upsert_insert
+from models import Conversation, MoodRollup
+
+GLOBAL_SCOPE = '*'  # session_id of the all-sessions rollup rows
+DEFAULT_EMOTION = 'neutral'
+
+
+def _rollup_key(session_id, timestamp, emotion):
+    return (session_id, timestamp.date(), emotion or DEFAULT_EMOTION)
+
+
+def _add(deltas, key, turns, sentiment_sum, sentiment_count):
+    current = deltas.get(key)
+    if current is None:
+        deltas[key] = [turns, sentiment_sum, sentiment_count]
+    else:
+        current[0] += turns
+        current[1] += sentiment_sum
+        current[2] += sentiment_count
+
+
+class MoodRollups:
+    """Keeps MoodRollup in step with saved conversation turns.
+
+    Every batch of inserted Conversation rows is folded into per-(session,
+    day, emotion) deltas, plus the matching global deltas, and applied as
+    increments in the same transaction. Trend reads then touch at most
+    days x emotions rows whatever the size of the conversation table.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from write_behind import write_behind
+
+        self.max_days = app.config.setdefault('MOOD_TRENDS_MAX_DAYS', int(os.environ.get('MOOD_TRENDS_MAX_DAYS', 365)))
+        write_behind.on_insert(Conversation, self.record)
+        app.extensions['mood_rollups'] = self
+
+    def record(self, session, rows):
+        """Apply the rollup increments for newly inserted conversation rows"""
+        deltas = {}
+        for row in rows:
+            timestamp = row.get('timestamp') or datetime.utcnow()
+            score = row.get('sentiment_score')
+            has_score = score is not None
+            for scope in (row['session_id'], GLOBAL_SCOPE):
+                key = _rollup_key(scope, timestamp, row.get('primary_emotion'))
+                _add(deltas, key, 1, score if has_score else 0.0, int(has_score))
+        self._apply(session, deltas)
+
+    def rebuild(self, chunk_size=10000):
+        """Recompute every rollup from the conversation table and its archive in one transaction.
+
+        Aggregation runs in SQL grouped by session and day; only the grouped
+        rows are streamed back and re-inserted in chunks. Turns moved to the
+        archive (see retention) are folded in, so their days keep their
+        counts. Returns the number of rollup rows written.
+        """
+        day = func.date(Conversation.timestamp)
+        emotion = func.coalesce(Conversation.primary_emotion, DEFAULT_EMOTION)
+        grouped = (
+            select(
+                Conversation.session_id,
+                day,
+                emotion,
+                func.count(),
+                func.coalesce(func.sum(Conversation.sentiment_score), 0.0),
+                func.count(Conversation.sentiment_score)
+            )
+            .where(Conversation.timestamp.is_not(None))
+            .group_by(Conversation.session_id, day, emotion)
+        )
+
+        written = 0
+        global_totals = {}
+        try:
+            archived = self._archived_deltas()
+            db.session.execute(delete(MoodRollup))
+            batch = []
+            for session_id, bucket, emotion_name, turns, sentiment_sum, sentiment_count in db.session.execute(
+                grouped.execution_options(yield_per=chunk_size)
+            ):
+                bucket = self._as_date(bucket)
+                extra = archived.pop((session_id, bucket, emotion_name), None)
+                if extra is not None:
+                    turns, sentiment_sum, sentiment_count = turns + extra[0], sentiment_sum + extra[1], sentiment_count + extra[2]
+                batch.append(self._values(session_id, bucket, emotion_name, turns, sentiment_sum, sentiment_count))
+                _add(global_totals, (GLOBAL_SCOPE, bucket, emotion_name), turns, sentiment_sum, sentiment_count)
+                if len(batch) >= chunk_size:
+                    db.session.execute(insert(MoodRollup), batch)
+                    written += len(batch)
+                    batch = []
+
+            # Session days whose turns are all archived
+            for key, totals in archived.items():
+                batch.append(self._values(*key, *totals))
+                _add(global_totals, (GLOBAL_SCOPE, key[1], key[2]), *totals)
+                if len(batch) >= chunk_size:
+                    db.session.execute(insert(MoodRollup), batch)
+                    written += len(batch)
+                    batch = []
+
+            batch.extend(
+                self._values(*key, *totals) for key, totals in global_totals.items()
+            )
+            if batch:
+                db.session.execute(insert(MoodRollup), batch)
+                written += len(batch)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return written
+
+    def _archived_deltas(self):
+        """Per-(session, day, emotion) totals of the archived conversation turns"""
+        from retention import retention
+
+        deltas = {}
+        for rows in retention.archived_rows('conversation'):
+            for row in rows:
+                timestamp = row.get('timestamp')
+                if timestamp is None:
+                    continue
+                score = row.get('sentiment_score')
+                has_score = score is not None
+                _add(deltas, _rollup_key(row['session_id'], timestamp, row.get('primary_emotion')), 1, score if has_score else 0.0, int(has_score))
+        return deltas
+
+    def trends(self, session_id=None, days=30):
+        """Daily mood summary for a session (or all sessions), oldest day first"""
+        days = max(1, min(days, self.max_days))
+        since = datetime.utcnow().date() - timedelta(days=days - 1)
+        rows = db.session.execute(
+            select(
+                MoodRollup.day,
+                MoodRollup.emotion,
+                MoodRollup.turns,
+                MoodRollup.sentiment_sum,
+                MoodRollup.sentiment_count
+            )
+            .where(MoodRollup.session_id == (session_id or GLOBAL_SCOPE), MoodRollup.day >= since)
+            .order_by(MoodRollup.day)
+        ).all()
+
+        by_day = {}
+        for bucket, emotion_name, turns, sentiment_sum, sentiment_count in rows:
+            entry = by_day.setdefault(bucket, {'counts': {}, 'turns': 0, 'sentiment_sum': 0.0, 'sentiment_count': 0})
+            entry['counts'][emotion_name] = turns
+            entry['turns'] += turns
+            entry['sentiment_sum'] += sentiment_sum
+            entry['sentiment_count'] += sentiment_count
+
+        return [
+            {
+                'date': bucket.isoformat(),
+                'counts': entry['counts'],
+                'turns': entry['turns'],
+                'average_sentiment': (
+                    round(entry['sentiment_sum'] / entry['sentiment_count'], 4)
+                    if entry['sentiment_count'] else None
+                )
+            }
+            for bucket, entry in by_day.items()
+        ]
+
+    @staticmethod
+    def _as_date(value):
+        # func.date() returns a string on SQLite and a date on PostgreSQL
+        if isinstance(value, str):
+            return datetime.strptime(value[:10], '%Y-%m-%d').date()
+        return value
+
+    @staticmethod
+    def _values(session_id, bucket, emotion_name, turns, sentiment_sum, sentiment_count):
+        return {
+            'session_id': session_id,
+            'day': bucket,
+            'emotion': emotion_name,
+            'turns': turns,
+            'sentiment_sum': sentiment_sum,
+            'sentiment_count': sentiment_count
+        }
+
+    def _apply(self, session, deltas):
+        if not deltas:
+            return
+        values = [self._values(*key, *totals) for key, totals in deltas.items()]
+
+        dialect_insert = upsert_insert(session.get_bind().dialect.name)
+        if dialect_insert is not None:
+            statement = dialect_insert(MoodRollup)
+            statement = statement.on_conflict_do_update(
+                index_elements=['session_id', 'day', 'emotion'],
+                set_={
+                    'turns': MoodRollup.turns + statement.excluded.turns,
+                    'sentiment_sum': MoodRollup.sentiment_sum + statement.excluded.sentiment_sum,
+                    'sentiment_count': MoodRollup.sentiment_count + statement.excluded.sentiment_count
+                }
+            )
+            session.execute(statement, values)
+            return
+
+        # Portable fallback: increment existing rows, insert the rest
+        for value in values:
+            result = session.execute(
+                update(MoodRollup)
+                .where(
+                    MoodRollup.session_id == value['session_id'],
+                    MoodRollup.day == value['day'],
+                    MoodRollup.emotion == value['emotion']
+                )
+                .values(
+                    turns=MoodRollup.turns + value['turns'],
+                    sentiment_sum=MoodRollup.sentiment_sum + value['sentiment_sum'],
+                    sentiment_count=MoodRollup.sentiment_count + value['sentiment_count']
+                )
+            )
+            if result.rowcount == 0:
+                session.execute(insert(MoodRollup), value)
+
+
+# Global instance
+mood_rollups = MoodRollups()
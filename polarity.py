@@ -0,0 +1,364 @@
+"""Lexicon polarity scoring compatible with TextBlob's default (pattern) analyzer.
+
+TextBlob(text).sentiment.polarity builds a blob, runs pattern's tokenizer
+and looks every word up in a dict-of-dicts lexicon. PolarityScorer loads
+the same en-sentiment.xml once into token-id indexed arrays and applies the
+same rules in one pass over the tokens:
+
+* known words are averaged; an adverb (RB) in front multiplies the next
+  word's polarity by its intensity ("very good")
+* a negation ("not", "never", ...) in front flips and halves the polarity
+  ("not good" = -0.5 * good), and survives one-letter words ("not a good")
+* "!" boosts the previous word by 1.25 and emoticons score on their own
+
+Tokenization follows pattern's find_tokens for everything that can change
+a score (apostrophes, quotes, leading/trailing punctuation, emoticons).
+"""
+import importlib.util
+import logging
+import os
+import re
+import threading
+from xml.etree import ElementTree
+
+from artifacts import map_arrays, read_manifest, save_artifact
+
+# pattern's punctuation; leading/trailing runs are split off words
+PUNCTUATION = ".,;:!?()[]{}`''\"@#$^&*+-|=~_"
+_SPLIT = frozenset(PUNCTUATION) - {'.'}
+_TRAILING = _SPLIT | {'.'}
+NEGATIONS = frozenset(('no', 'not', "n't", 'never'))
+
+# pattern's emoticons, first matching mood wins
+EMOTICONS = (
+    (+1.00, ('<3', '♥')),
+    (+1.00, ('>:D', ':-D', ':D', '=-D', '=D', 'X-D', 'x-D', 'XD', 'xD', '8-D')),
+    (+0.75, ('>:P', ':-P', ':P', ':-p', ':p', ':-b', ':b', ':c)', ':o)', ':^)')),
+    (+0.50, ('>:)', ':-)', ':)', '=)', '=]', ':]', ':}', ':>', ':3', '8)', '8-)')),
+    (+0.25, ('>;]', ';-)', ';)', ';-]', ';]', ';D', ';^)', '*-)', '*)')),
+    (+0.05, ('>:o', ':-O', ':O', ':o', ':-o', 'o_O', 'o.O', '°O°', '°o°')),
+    (-0.25, ('>:/', ':-/', ':/', ':\\', '>:\\', ':-.', ':-s', ':s', ':S', ':-S', '>.>')),
+    (-0.75, ('>:[', ':-(', ':(', '=(', ':-[', ':[', ':{', ':-<', ':c', ':-c', '=/')),
+    (-1.00, (":'(", ":'''(", ";'(")),
+)
+EMOTICON_POLARITY = {}
+for _polarity, _faces in EMOTICONS:
+    for _face in _faces:
+        EMOTICON_POLARITY.setdefault(_face.lower(), _polarity)
+# Emoticons (and the "(!)" sarcasm mark) that punctuation splitting must keep whole
+_WHOLE = frozenset(face for _, faces in EMOTICONS for face in faces) | {'(!)'}
+_WHOLE_PREFIXES = frozenset(face[:i] for face in _WHOLE for i in range(1, len(face)))
+
+# Quotes and apostrophes are always tokens of their own ("it's" -> it ' s),
+# and pattern splits the "n" off negative contractions ("don't" -> do n ' t)
+_CHUNK = re.compile(r"""[^\s"'“”‘’]+|["'“”‘’]""")
+_ABBREVIATION = re.compile(r'^(?:[A-Za-z]\.)+$')
+
+KNOWN = 1
+MODIFIER = 2
+
+COMPILED_ARRAYS = ('forms', 'polarity', 'intensity', 'flags')
+
+
+def _clamp(value):
+    return max(-1.0, min(value, 1.0))
+
+
+def _append_chunk(chunk, start, tokens):
+    """Append one chunk, splitting punctuation only when it has some"""
+    first = chunk[0]
+    last = chunk[-1]
+    if first not in _SPLIT and last not in _TRAILING:
+        tokens.append((chunk, start, start + len(chunk)))
+    elif first not in _SPLIT and len(chunk) > 1 and chunk[-2] not in _TRAILING and (
+        last != '.' or not _ABBREVIATION.match(chunk)
+    ):
+        # The common "word," / "word." case
+        end = start + len(chunk)
+        tokens.append((chunk[:-1], start, end - 1))
+        tokens.append((last, end - 1, end))
+    else:
+        _split_chunk(chunk, start, tokens)
+
+
+def _split_chunk(chunk, start, tokens):
+    """Append the tokens of one whitespace-free chunk, as pattern's find_tokens splits them"""
+    end = start + len(chunk)
+    while chunk and chunk[0] in _SPLIT:
+        tokens.append((chunk[0], start, start + 1))
+        chunk = chunk[1:]
+        start += 1
+    tail = []
+    while chunk and chunk[-1] in _TRAILING:
+        if chunk[-1] in _SPLIT:
+            tail.append((chunk[-1], end - 1, end))
+            chunk = chunk[:-1]
+            end -= 1
+        if chunk.endswith('...'):
+            stripped = chunk[:-3].rstrip('.')
+            tail.append(('...', start + len(stripped), end))
+            chunk = stripped
+            end = start + len(chunk)
+        if chunk.endswith('.'):
+            if _ABBREVIATION.match(chunk):
+                break
+            tail.append(('.', end - 1, end))
+            chunk = chunk[:-1]
+            end -= 1
+    if chunk:
+        tokens.append((chunk, start, end))
+    tokens.extend(reversed(tail))
+
+
+def _join_emoticons(tokens):
+    """Re-join emoticons that splitting broke into adjacent tokens (": ' (" -> ":'(")"""
+    joined_tokens = []
+    i = 0
+    while i < len(tokens):
+        joined = tokens[i][0]
+        match = None
+        j = i
+        # Extend only while the tokens so far can still grow into an emoticon
+        while joined in _WHOLE_PREFIXES and j + 1 < len(tokens):
+            j += 1
+            joined += tokens[j][0]
+            if joined in _WHOLE:
+                match = j
+        if match is not None:
+            joined_tokens.append((''.join(token for token, _, _ in tokens[i:match + 1]), tokens[i][1], tokens[match][2]))
+            i = match + 1
+        else:
+            joined_tokens.append(tokens[i])
+            i += 1
+    return joined_tokens
+
+
+def tokenize(text):
+    """[(token, start, end)] for text, split the way pattern's find_tokens splits it"""
+    tokens = []
+    append = tokens.append
+    for match in _CHUNK.finditer(text):
+        chunk = match.group()
+        start, end = match.span()
+        if chunk[-1] == 'n' and text.startswith("'t", end) and len(chunk) > 1:
+            # "don't" -> do n ' t
+            _append_chunk(chunk[:-1], start, tokens)
+            append(('n', end - 1, end))
+        else:
+            _append_chunk(chunk, start, tokens)
+    if _WHOLE_PREFIXES.isdisjoint([token for token, _, _ in tokens]):
+        return tokens
+    return _join_emoticons(tokens)
+
+
+def _lexicon_path():
+    path = os.environ.get('POLARITY_LEXICON')
+    if path:
+        return path
+    # Locate TextBlob's data file without importing the package
+    spec = importlib.util.find_spec('textblob')
+    if spec is None or not spec.submodule_search_locations:
+        return None
+    return os.path.join(list(spec.submodule_search_locations)[0], 'en', 'en-sentiment.xml')
+
+
+def _source_stamp(path):
+    """Identifies one version of the lexicon file (a compiled copy is reused while it matches)"""
+    try:
+        stat = os.stat(path)
+    except (OSError, TypeError):
+        return None
+    return {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _avg(values):
+    return sum(values) / float(len(values) or 1)
+
+
+def load_lexicon(path):
+    """{word: (polarity, intensity, is_modifier)} with pattern's sense averaging"""
+    words = {}
+    for node in ElementTree.parse(path).getroot().findall('word'):
+        form = node.attrib.get('form')
+        if not form:
+            continue
+        scores = (
+            float(node.attrib.get('polarity', 0.0)),
+            float(node.attrib.get('subjectivity', 0.0)),
+            float(node.attrib.get('intensity', 1.0))
+        )
+        words.setdefault(form, {}).setdefault(node.attrib.get('pos'), []).append(scores)
+
+    # Average the senses of each part of speech, then all parts of speech
+    for form, by_pos in words.items():
+        for pos, senses in by_pos.items():
+            by_pos[pos] = [_avg(column) for column in zip(*senses)]
+        by_pos[None] = [_avg(column) for column in zip(*[by_pos[pos] for pos in by_pos])]
+
+    # pattern maps adjectives to adverbs: terrible -> terribly
+    for form, by_pos in list(words.items()):
+        if 'JJ' in by_pos:
+            if form.endswith('y'):
+                form = form[:-1] + 'i'
+            if form.endswith('le'):
+                form = form[:-2]
+            adverb = words.setdefault(form + 'ly', {})
+            adverb['RB'] = adverb[None] = tuple(by_pos['JJ'])
+
+    return {
+        form: (by_pos[None][0], by_pos[None][2], 'RB' in by_pos)
+        for form, by_pos in words.items()
+    }
+
+
+class PolarityScorer:
+    """Polarity in [-1, 1] from a lexicon compiled into token-id arrays.
+
+    With a cache_dir the compiled arrays are saved once and memory-mapped by
+    every process afterwards, instead of each worker parsing the XML.
+    """
+
+    def __init__(self, path=None, cache_dir=None):
+        self.path = path
+        self.cache_dir = cache_dir
+        self.vocabulary = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.cache_dir = app.config.setdefault(
+            'POLARITY_CACHE_DIR',
+            os.environ.get('POLARITY_CACHE_DIR', os.path.join(app.instance_path, 'polarity_lexicon'))
+        )
+        app.extensions['polarity_scorer'] = self
+
+    def load(self):
+        """Map (or compile, once) the lexicon into vocabulary -> id and per-id arrays"""
+        if self.vocabulary is not None:
+            return
+        with self._lock:
+            if self.vocabulary is not None:
+                return
+            path = self.path or _lexicon_path()
+            source = _source_stamp(path)
+            manifest = read_manifest(self.cache_dir)
+            if source is not None and manifest is not None and manifest.get('source') == source:
+                arrays = map_arrays(self.cache_dir, COMPILED_ARRAYS)
+            else:
+                arrays = self.compile(path)
+                if self.cache_dir and source is not None:
+                    try:
+                        save_artifact(self.cache_dir, arrays, {'source': source, 'words': len(arrays['forms']) - 1})
+                        arrays = map_arrays(self.cache_dir, COMPILED_ARRAYS)
+                    except OSError as e:
+                        logging.error(f"Could not save compiled polarity lexicon to {self.cache_dir}: {e}")
+
+            self.polarity = arrays['polarity']
+            self.intensity = arrays['intensity']
+            self.flags = arrays['flags']
+            self._rows = list(zip(self.polarity.tolist(), self.intensity.tolist(), self.flags.tolist()))
+            self.vocabulary = {form: i for i, form in enumerate(arrays['forms'].tolist()) if i}
+
+    @staticmethod
+    def compile(path):
+        """{name: ndarray} of the lexicon at path; id 0 is the unknown word"""
+        import numpy as np
+
+        lexicon = load_lexicon(path) if path and os.path.exists(path) else {}
+        if not lexicon:
+            logging.error(f"Polarity lexicon not found at {path}; all polarities will be 0")
+
+        forms = sorted(lexicon)
+        return {
+            'forms': np.array([''] + forms),
+            'polarity': np.array([0.0] + [lexicon[form][0] for form in forms], dtype=np.float64),
+            'intensity': np.array([1.0] + [lexicon[form][1] for form in forms], dtype=np.float64),
+            'flags': np.array(
+                [0] + [KNOWN | (MODIFIER if lexicon[form][2] else 0) for form in forms],
+                dtype=np.uint8
+            )
+        }
+
+    def score(self, text):
+        """Polarity of one text"""
+        return self.score_tokens([token.lower() for token, _, _ in tokenize(text)])
+
+    def score_tokens(self, tokens):
+        """Polarity of an already tokenized, lowercased text"""
+        self.load()
+        vocabulary = self.vocabulary
+        rows = self._rows
+        return self._assess(tokens, [rows[vocabulary.get(token, 0)] for token in tokens])
+
+    def score_batch(self, texts):
+        """Polarities of many texts; lexicon lookups are one array gather for the batch"""
+        import numpy as np
+
+        self.load()
+        token_lists = [[token.lower() for token, _, _ in tokenize(text)] for text in texts]
+        vocabulary = self.vocabulary
+        ids = np.fromiter(
+            (vocabulary.get(token, 0) for tokens in token_lists for token in tokens),
+            dtype=np.int64
+        )
+        rows = list(zip(
+            self.polarity[ids].tolist(),
+            self.intensity[ids].tolist(),
+            self.flags[ids].tolist()
+        ))
+
+        scores = []
+        offset = 0
+        for tokens in token_lists:
+            scores.append(self._assess(tokens, rows[offset:offset + len(tokens)]))
+            offset += len(tokens)
+        return scores
+
+    @staticmethod
+    def _assess(tokens, rows):
+        # Each assessment is [polarity, intensity, negated]
+        assessments = []
+        modifier = None  # preceding adverb ("really good")
+        negation = None  # preceding negation ("not good")
+        for token, (polarity, intensity, flags) in zip(tokens, rows):
+            if flags:
+                if modifier is None:
+                    assessments.append([polarity, intensity, False])
+                else:
+                    last = assessments[-1]
+                    last[0] = _clamp(polarity * last[1])
+                    last[1] = intensity
+                if negation is not None:
+                    last = assessments[-1]
+                    last[1] = 1.0 / last[1]
+                    last[2] = True
+                modifier = token if flags & MODIFIER else None
+                negation = token if token in NEGATIONS else None
+                continue
+
+            if token in NEGATIONS:
+                negation = token
+            elif negation and len(token.strip("'")) > 1:
+                # Negation carries over one-letter words only
+                negation = None
+            if negation is not None and modifier is not None and modifier.endswith('ly'):
+                # "really not good"
+                assessments[-1][2] = True
+                negation = None
+            elif modifier and len(token) > 2:
+                modifier = None
+            if token == '!' and assessments:
+                assessments[-1][0] = _clamp(assessments[-1][0] * 1.25)
+            if token == '(!)':
+                assessments.append([0.0, 1.0, False])
+            if not token.isalpha() and len(token) <= 5 and token not in PUNCTUATION:
+                polarity = EMOTICON_POLARITY.get(token)
+                if polarity is not None:
+                    assessments.append([polarity, 1.0, False])
+
+        if not assessments:
+            return 0.0
+        return sum(p * -0.5 if negated else p for p, _, negated in assessments) / float(len(assessments))
+
+
+# Global instance
+polarity_scorer = PolarityScorer()
@@ -0,0 +1,264 @@
+import gzip
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, insert, or_, select
+
+from extensions import db, upsert_insert
+from models import Conversation, Suggestion
+
+# Tables the retention policy applies to, by archive name
+RETAINED_MODELS = {'conversation': Conversation, 'suggestion': Suggestion}
+
+# Columns that tell apart two rows of a table sharing an id (see Retention)
+ROW_IDENTITY = {'conversation': ('session_id', 'timestamp'), 'suggestion': ('session_id', 'timestamp', 'catalog_id')}
+
+
+def _encode(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _month(timestamp):
+    return timestamp.strftime('%Y-%m') if timestamp else 'undated'
+
+
+class Retention:
+    """Moves expired Conversation and Suggestion rows into gzip JSONL archives.
+
+    A row expires once it is older than RETENTION_MAX_AGE_DAYS, or once
+    its table holds more than RETENTION_MAX_ROWS newer rows. Expired rows
+    are read in id order one chunk at a time, appended to
+    <archive_dir>/<table>/<YYYY-MM>.jsonl.gz (one gzip member per write,
+    so archives are only ever appended to), and only then deleted, in
+    short transactions of RETENTION_DELETE_BATCH rows.
+
+    A crash between writing and deleting a chunk archives it twice on the
+    next run. A row always lands in the file of its own month, so
+    archived_rows() drops such duplicates file by file, and it also skips
+    rows that are still (or again) in the database. Rows are identified by
+    their id plus ROW_IDENTITY, not id alone: SQLite hands the ids of
+    deleted rows out again once a table's newest rows are archived, so an
+    archived row and a live one can share an id.
+
+    Mood rollups and session states are aggregates: archiving leaves them
+    alone, and their rebuild() folds archived_rows('conversation') back in
+    with the retained turns, so rebuilding does not lose archived history.
+    """
+
+    def __init__(self, app=None):
+        self.archive_dir = None
+        self.max_age_days = None
+        self.max_rows = None
+        self.chunk_size = 5000
+        self.delete_batch = 500
+        self.pause = 0.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        default_dir = os.path.join(app.instance_path, 'archive')
+        self.archive_dir = app.config.setdefault('RETENTION_ARCHIVE_DIR', os.environ.get('RETENTION_ARCHIVE_DIR', default_dir))
+        self.max_age_days = app.config.setdefault('RETENTION_MAX_AGE_DAYS', self._optional_int(os.environ.get('RETENTION_MAX_AGE_DAYS', 180)))
+        self.max_rows = app.config.setdefault('RETENTION_MAX_ROWS', self._optional_int(os.environ.get('RETENTION_MAX_ROWS', 1000000)))
+        self.chunk_size = app.config.setdefault('RETENTION_CHUNK_SIZE', int(os.environ.get('RETENTION_CHUNK_SIZE', 5000)))
+        self.delete_batch = app.config.setdefault('RETENTION_DELETE_BATCH', int(os.environ.get('RETENTION_DELETE_BATCH', 500)))
+        self.pause = app.config.setdefault('RETENTION_PAUSE', float(os.environ.get('RETENTION_PAUSE', 0.05)))
+        app.extensions['retention'] = self
+
+    @staticmethod
+    def _optional_int(value):
+        # 0 (or an empty setting) disables a policy
+        return int(value) if value not in (None, '') and int(value) > 0 else None
+
+    def expired(self, model, now=None):
+        """SQL filter matching the rows of model the policies expire, or None if nothing expires"""
+        conditions = []
+        if self.max_age_days:
+            cutoff = (now or datetime.utcnow()) - timedelta(days=self.max_age_days)
+            conditions.append(model.timestamp < cutoff)
+        if self.max_rows:
+            # Ids grow with insertion order: keep the newest max_rows ids
+            boundary = db.session.execute(
+                select(model.id).order_by(model.id.desc()).offset(self.max_rows).limit(1)
+            ).scalar()
+            if boundary is not None:
+                conditions.append(model.id <= boundary)
+        if not conditions:
+            return None
+        return or_(*conditions)
+
+    def archive(self, name, now=None):
+        """Archive and delete the expired rows of one table; yields the running count per chunk"""
+        from write_behind import write_behind
+
+        model = RETAINED_MODELS[name]
+        # Flush queued inserts so the size policy counts them
+        if not write_behind.sync():
+            raise RuntimeError("Queued write-behind rows were not written in time; not archiving from a stale row count")
+        condition = self.expired(model, now)
+        if condition is None:
+            return
+
+        columns = [column.name for column in model.__table__.columns]
+        archived = 0
+        last_id = 0
+        while True:
+            rows = db.session.execute(
+                select(*model.__table__.columns)
+                .where(condition, model.id > last_id)
+                .order_by(model.id)
+                .limit(self.chunk_size)
+            ).all()
+            db.session.commit()
+            if not rows:
+                return
+            last_id = rows[-1].id
+            self._write(name, [dict(zip(columns, row)) for row in rows])
+            self._delete(model, [row.id for row in rows])
+            archived += len(rows)
+            yield archived
+
+    def run(self, now=None):
+        """Apply the retention policies to every retained table: {table: rows archived}"""
+        archived = {}
+        for name in RETAINED_MODELS:
+            archived[name] = 0
+            for count in self.archive(name, now):
+                archived[name] = count
+        return archived
+
+    def archive_files(self, name, months=None):
+        """Archive files of a table, oldest month first"""
+        if not self.archive_dir:
+            return []
+        directory = os.path.join(self.archive_dir, name)
+        try:
+            files = sorted(entry for entry in os.listdir(directory) if entry.endswith('.jsonl.gz'))
+        except FileNotFoundError:
+            return []
+        if months:
+            files = [entry for entry in files if entry[:-len('.jsonl.gz')] in months]
+        return [os.path.join(directory, entry) for entry in files]
+
+    def archived_rows(self, name, months=None):
+        """Chunks of the archived rows of a table that are not in the database, each row once.
+
+        Rows come month by month, oldest first, and in id order within a
+        month's archiving runs. A row whose id now belongs to another row
+        comes without its 'id'.
+        """
+        model = RETAINED_MODELS[name]
+        identity = ROW_IDENTITY[name]
+        datetime_columns = {
+            column.name for column in model.__table__.columns if column.type.python_type is datetime
+        }
+        for path in self.archive_files(name, months):
+            seen = set()
+            batch = []
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    row = json.loads(line)
+                    key = (row['id'],) + tuple(row.get(column) for column in identity)
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    for column in datetime_columns:
+                        if row.get(column):
+                            row[column] = datetime.fromisoformat(row[column])
+                    batch.append(row)
+                    if len(batch) >= self.chunk_size:
+                        yield self._not_retained(model, identity, batch)
+                        batch = []
+            if batch:
+                yield self._not_retained(model, identity, batch)
+
+    def restore(self, name, months=None):
+        """Insert archived rows of a table back, skipping ids that already exist; yields the running count"""
+        model = RETAINED_MODELS[name]
+        restored = 0
+        for rows in self.archived_rows(name, months):
+            restored += self._insert(model, rows)
+            yield restored
+
+    def _write(self, name, rows):
+        by_month = {}
+        for row in rows:
+            by_month.setdefault(_month(row.get('timestamp')), []).append(
+                json.dumps({key: _encode(value) for key, value in row.items()})
+            )
+        directory = os.path.join(self.archive_dir, name)
+        os.makedirs(directory, exist_ok=True)
+        for month, lines in by_month.items():
+            with open(os.path.join(directory, f'{month}.jsonl.gz'), 'ab') as raw:
+                with gzip.GzipFile(fileobj=raw, mode='ab') as f:
+                    f.write(('\n'.join(lines) + '\n').encode('utf-8'))
+                # The rows are deleted next: make sure the archive is on disk first
+                raw.flush()
+                os.fsync(raw.fileno())
+
+    def _delete(self, model, ids):
+        # Short transactions so writers are never blocked for long
+        for start in range(0, len(ids), self.delete_batch):
+            db.session.execute(delete(model).where(model.id.in_(ids[start:start + self.delete_batch])))
+            db.session.commit()
+            if self.pause:
+                time.sleep(self.pause)
+
+    def _not_retained(self, model, identity, rows):
+        columns = [getattr(model, column) for column in identity]
+        stored = {
+            stored_row[0]: tuple(stored_row[1:])
+            for stored_row in db.session.execute(
+                select(model.id, *columns).where(model.id.in_([row['id'] for row in rows]))
+            )
+        }
+        missing = []
+        reused = []
+        for row in rows:
+            key = stored.get(row['id'])
+            if key is None:
+                missing.append(row)
+                # Another row with this id further on was archived after the id was reused
+                stored[row['id']] = tuple(row[column] for column in identity)
+            elif key != tuple(row[column] for column in identity):
+                # The id was handed out again; this is another row
+                reused.append(row)
+        if not reused:
+            return missing
+
+        # Rows restored earlier got a new id, so look them up by the other columns
+        restored = set(db.session.execute(
+            select(*columns).where(*(
+                column.in_({row[column.key] for row in reused if row[column.key] is not None})
+                for column in columns
+            ))
+        ).all())
+        return missing + [
+            {key: value for key, value in row.items() if key != 'id'}
+            for row in reused
+            if tuple(row[column] for column in identity) not in restored
+        ]
+
+    def _insert(self, model, rows):
+        with_id = [row for row in rows if 'id' in row]
+        without_id = [row for row in rows if 'id' not in row]
+        if with_id:
+            # A concurrent writer may have restored the same ids since they were checked
+            dialect_insert = upsert_insert(db.session.get_bind().dialect.name)
+            statement = insert(model) if dialect_insert is None else dialect_insert(model).on_conflict_do_nothing()
+            db.session.execute(statement, with_id)
+        if without_id:
+            # Their ids belong to other rows now: take new ones
+            db.session.execute(insert(model), without_id)
+        db.session.commit()
+        return len(rows)
+
+    def counts(self):
+        """Current row count of every retained table"""
+        return {name: db.session.execute(select(func.count()).select_from(model)).scalar() for name, model in RETAINED_MODELS.items()}
+
+
+# Global instance
+retention = Retention()
@@ -0,0 +1,228 @@
+"""TF-IDF relevance ranking of the canned responses, coping strategies and suggestions.
+
+The corpus is fitted once with scikit-learn's TfidfVectorizer and saved as
+plain .npy arrays: the l2-normalized document-term matrix in CSC layout
+(one postings list per term) plus the idf vector. Loading memory-maps the
+arrays, so a query is one sparse dot product: for each query term, add
+query weight x postings into a dense score vector over all documents.
+
+Documents are laid out in contiguous groups (the responses of one emotion,
+the strategies of one coping category, ...), and callers pick among the
+options of one group: randomly among the options within
+RETRIEVAL_TIE_MARGIN of the best score, so replies to similar messages
+still vary, and fully at random when nothing in the group matches. A manifest stores the groups and a fingerprint of the
+corpus; an index whose fingerprint no longer matches is refitted.
+"""
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+
+from artifacts import map_arrays, read_manifest, save_artifact
+
+ARRAYS = ('data', 'indices', 'indptr', 'idf')
+
+# TfidfVectorizer's default lowercase token pattern
+_TOKEN = re.compile(r'(?u)\b\w\w+\b')
+
+
+def corpus_documents():
+    """[(kind, group, text)] for every canned text the app can choose from"""
+    from ai_service import ai_service
+    from suggestion_engine import suggestion_engine
+
+    documents = []
+    for emotion, responses in ai_service.response_patterns.items():
+        documents.extend(('response', emotion, text) for text in responses)
+    for category, strategies in ai_service.coping_strategies.items():
+        documents.extend(('coping', category, text) for text in strategies)
+    for emotion, kinds in suggestion_engine.suggestions_db.items():
+        for suggestion_type, items in kinds.items():
+            for item in items:
+                text = f"{item['title']} {item['description']}" if isinstance(item, dict) else item
+                documents.append(('suggestion', f'{emotion}:{suggestion_type}', text))
+    return documents
+
+
+def _fingerprint(documents):
+    digest = hashlib.sha256()
+    for document in documents:
+        digest.update(json.dumps(document).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+class RetrievalIndex:
+    """Memory-mapped TF-IDF index over a grouped corpus of candidate texts"""
+
+    def __init__(self, app=None, index_dir=None, documents=corpus_documents):
+        self.index_dir = index_dir
+        self.documents = documents
+        self.tie_margin = 0.1
+        self.loaded = False
+        self.version = 0
+        self._lock = threading.Lock()
+        self._last = threading.local()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.index_dir = app.config.setdefault(
+            'RETRIEVAL_INDEX_DIR',
+            os.environ.get('RETRIEVAL_INDEX_DIR', os.path.join(app.instance_path, 'retrieval_index'))
+        )
+        # Options scoring at least (1 - margin) x the best count as ties
+        self.tie_margin = app.config.setdefault(
+            'RETRIEVAL_TIE_MARGIN', float(os.environ.get('RETRIEVAL_TIE_MARGIN', 0.1))
+        )
+        app.extensions['retrieval_index'] = self
+
+    def load(self):
+        """Map the saved index (once), fitting and saving it first if it is missing or stale"""
+        if self.loaded:
+            return
+        with self._lock:
+            if self.loaded:
+                return
+            try:
+                documents = self.documents()
+                manifest = read_manifest(self.index_dir)
+                if manifest is None or manifest['fingerprint'] != _fingerprint(documents):
+                    arrays, manifest = self.fit(documents)
+                    if self.index_dir:
+                        try:
+                            save_artifact(self.index_dir, arrays, manifest)
+                            arrays = map_arrays(self.index_dir, ARRAYS)
+                        except OSError as e:
+                            logging.error(f"Could not save retrieval index to {self.index_dir}: {e}")
+                else:
+                    arrays = map_arrays(self.index_dir, ARRAYS)
+            except Exception as e:
+                # Without an index every choice falls back to random
+                logging.error(f"Error loading retrieval index: {e}")
+                arrays, manifest = None, {'documents': 0, 'vocabulary': {}, 'groups': []}
+            self._use(arrays, manifest)
+
+    def build(self):
+        """Fit the current corpus and save it to index_dir; returns the manifest"""
+        arrays, manifest = self.fit(self.documents())
+        save_artifact(self.index_dir, arrays, manifest)
+        with self._lock:
+            self.loaded = False
+        return manifest
+
+    @staticmethod
+    def fit(documents):
+        """(arrays, manifest) for a [(kind, group, text)] corpus"""
+        import numpy as np
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        vectorizer = TfidfVectorizer(stop_words='english', dtype=np.float32)
+        matrix = vectorizer.fit_transform([text for _, _, text in documents]).tocsc()
+        matrix.sort_indices()
+
+        groups = []
+        for i, (kind, group, _) in enumerate(documents):
+            if groups and groups[-1][:2] == [kind, group]:
+                groups[-1][3] = i + 1
+            else:
+                groups.append([kind, group, i, i + 1])
+
+        arrays = {
+            'data': matrix.data.astype(np.float32),
+            'indices': matrix.indices.astype(np.int32),
+            'indptr': matrix.indptr.astype(np.int64),
+            'idf': vectorizer.idf_.astype(np.float32)
+        }
+        manifest = {
+            'fingerprint': _fingerprint(documents),
+            'documents': len(documents),
+            'vocabulary': {term: int(column) for term, column in vectorizer.vocabulary_.items()},
+            'groups': groups
+        }
+        return arrays, manifest
+
+    def _use(self, arrays, manifest):
+        arrays = arrays or {}
+        self.data = arrays.get('data')
+        self.indices = arrays.get('indices')
+        # Kept memory-mapped: a list copy would cost every worker its own memory
+        self.indptr = arrays.get('indptr')
+        self.idf = arrays.get('idf')
+        self.vocabulary = manifest['vocabulary']
+        self.size = manifest['documents']
+        self.groups = {(kind, group): (start, end) for kind, group, start, end in manifest['groups']}
+        self.version += 1
+        self.loaded = True
+
+    def scores(self, text):
+        """Cosine similarity of text to every document (memoized for the last text per thread)"""
+        import numpy as np
+
+        self.load()
+        if getattr(self._last, 'key', None) == (self.version, text):
+            return self._last.scores
+
+        counts = {}
+        for token in _TOKEN.findall(text.lower()):
+            column = self.vocabulary.get(token)
+            if column is not None:
+                counts[column] = counts.get(column, 0) + 1
+
+        scores = np.zeros(self.size, dtype=np.float32)
+        if counts:
+            weights = {column: count * float(self.idf[column]) for column, count in counts.items()}
+            norm = sum(weight * weight for weight in weights.values()) ** 0.5
+            indptr = self.indptr
+            for column, weight in weights.items():
+                start, end = int(indptr[column]), int(indptr[column + 1])
+                scores[self.indices[start:end]] += (weight / norm) * self.data[start:end]
+
+        self._last.key = (self.version, text)
+        self._last.scores = scores
+        return scores
+
+    def rank(self, text, kind, group):
+        """[(position in group, score)] of a group's documents, most relevant first"""
+        group_scores = self._group_scores(text, kind, group)
+        return sorted(enumerate(group_scores.tolist()), key=lambda item: -item[1])
+
+    def choose(self, text, kind, group, options):
+        """A most relevant option of a group; random among near ties (and when nothing matches)"""
+        return options[self.choose_position(text, kind, group, len(options))]
+
+    def choose_position(self, text, kind, group, size, candidates=None):
+        """Position of a most relevant document of a group of size, among candidates (default: all).
+
+        Picks at random among the candidates scoring within tie_margin of the
+        best, so the same message does not always get the same reply.
+        """
+        import numpy as np
+
+        try:
+            group_scores = self._group_scores(text, kind, group) if text else ()
+        except Exception as e:
+            logging.error(f"Error ranking {kind} candidates: {e}")
+            group_scores = ()
+        if candidates is not None:
+            candidates = list(candidates)
+        if len(group_scores) != size:
+            return random.choice(candidates if candidates is not None else range(size))
+
+        candidate_scores = group_scores if candidates is None else group_scores[candidates]
+        best = candidate_scores.max()
+        if best <= 0:
+            return random.choice(candidates if candidates is not None else range(size))
+        position = int(random.choice(np.flatnonzero(candidate_scores >= best * (1 - self.tie_margin))))
+        return position if candidates is None else candidates[position]
+
+    def _group_scores(self, text, kind, group):
+        self.load()
+        start, end = self.groups.get((kind, group), (0, 0))
+        return self.scores(text)[start:end]
+
+
+# Global instance
+retrieval_index = RetrievalIndex()
@@ -1,26 +1,74 @@
-from flask import render_template, request, session, redirect, url_for, flash, jsonify
+from flask import render_template, request, session, redirect, url_for, flash, jsonify, Response, send_file, stream_with_context
+from markupsafe import Markup
 from app import app
 from extensions import db
 from models import Conversation, UserSession, Suggestion
-from ai_service import get_ai_response
-from sentiment_analyzer import analyze_sentiment, get_emotion_emoji
+from sqlalchemy import tuple_
+from ai_service import get_ai_response, ai_service
+from sentiment_analyzer import analyze_sentiment, analyze_batch, get_emotion_emoji
 from suggestion_engine import suggestion_engine
+from cache import LRUCache
+from write_behind import write_behind
+from tts import tts_service
+from activity import activity_tracker
+from mood_rollups import mood_rollups
+from session_state import session_states
+from suggestion_rotation import suggestion_rotation
+from export import EXPORT_FORMATS, export_filename, iter_export, iter_records
+import os
+import re
 import uuid
 import json
-from datetime import datetime
 import logging
 
-import pyttsx3
+# Rendered HTML of saved conversation turns, keyed by Conversation.id (turns never change)
+message_fragment_cache = LRUCache(max_size=int(os.environ.get('FRAGMENT_CACHE_SIZE', 5000)))
 
-def speak_text(text):
-    engine = pyttsx3.init()
-    engine.setProperty('rate', 150)  # Speed
-    engine.setProperty('volume', 1)  # Volume (0.0 to 1.0)
-    voices = engine.getProperty('voices')
-    if len(voices) > 1:
-        engine.setProperty('voice', voices[1].id)  # Usually female at index 1
-    engine.say(text)
-    engine.runAndWait()
+def suggestion_to_dict(suggestion):
+    """JSON representation of a suggestion"""
+    return {
+        'type': suggestion.suggestion_type,
+        'content': suggestion.content,
+        'title': suggestion.title,
+        'url': suggestion.url,
+        'emotion': suggestion.emotion
+    }
+
+def get_history_page(session_id, before_id=None, limit=None):
+    """Newest turns of a session older than before_id, oldest first.
+    
+    Keyset pagination on (timestamp, id) served by the composite index, so
+    every page costs the same however long the session is.
+    Returns (conversations, has_more).
+    """
+    limit = limit or app.config['CHAT_PAGE_SIZE']
+    query = Conversation.query.filter(Conversation.session_id == session_id)
+    
+    if before_id is not None:
+        anchor = db.session.query(Conversation.timestamp).filter(
+            Conversation.session_id == session_id, Conversation.id == before_id
+        ).scalar()
+        if anchor is None:
+            return [], False
+        query = query.filter(tuple_(Conversation.timestamp, Conversation.id) < (anchor, before_id))
+    
+    rows = query.order_by(Conversation.timestamp.desc(), Conversation.id.desc()).limit(limit + 1).all()
+    return list(reversed(rows[:limit])), len(rows) > limit
+
+def render_conversation_html(conversations):
+    """Render the message bubbles for a conversation history, reusing cached fragments"""
+    fragments = []
+    for conversation in conversations:
+        if conversation.id is None:
+            # Still queued for write-behind: no id to cache it under yet
+            fragments.append(render_template('message_bubble.html', conversation=conversation))
+            continue
+        fragment = message_fragment_cache.get(conversation.id)
+        if fragment is None:
+            fragment = render_template('message_bubble.html', conversation=conversation)
+            message_fragment_cache.set(conversation.id, fragment)
+        fragments.append(fragment)
+    return Markup('\n'.join(fragments))
 
 
 @app.route('/')
@@ -40,21 +88,27 @@ def chat():
         db.session.add(user_session)
         db.session.commit()
     
-    # Update last active time
-    user_session = UserSession.query.filter_by(session_id=session['session_id']).first()
-    if user_session:
-        user_session.last_active = datetime.utcnow()
-        db.session.commit()
+    # Update last active time (coalesced into a periodic batched UPDATE)
+    activity_tracker.touch(session['session_id'])
     
-    # Get conversation history
-    conversations = Conversation.query.filter_by(
-        session_id=session['session_id']
-    ).order_by(Conversation.timestamp).all()
+    # Get the newest page of conversation history, plus turns still queued for write-behind
+    (conversations, has_more), queued, _ = write_behind.read_with_pending(
+        lambda: get_history_page(session['session_id']), Conversation, session['session_id']
+    )
+    saved = {(conversation.timestamp, conversation.user_message) for conversation in conversations}
+    conversations += [conversation for conversation in queued if (conversation.timestamp, conversation.user_message) not in saved]
     
     # Get recent suggestions
     recent_suggestions = suggestion_engine.get_recent_suggestions(session['session_id'], limit=3)
     
-    return render_template('chat.html', conversations=conversations, recent_suggestions=recent_suggestions)
+    # chat.html puts history_has_more on #chatMessages as data-history-has-more (read by main.js)
+    return render_template(
+        'chat.html',
+        conversations=conversations,
+        conversation_html=render_conversation_html(conversations),
+        history_has_more=has_more,
+        recent_suggestions=recent_suggestions
+    )
 
 @app.route('/send_message', methods=['POST'])
 def send_message():
@@ -76,10 +130,10 @@ def send_message():
         logging.info(f"Detected emotions: {detected_emotions}, Primary: {primary_emotion}")
         
         # Generate personalized suggestions
-        suggestions = suggestion_engine.get_suggestions(session['session_id'], detected_emotions)
+        suggestions = suggestion_engine.get_suggestions(session['session_id'], detected_emotions, user_message=user_message)
         logging.info(f"Generated {len(suggestions)} suggestions")
         
-        # Save conversation with enhanced emotion data
+        # Save conversation with enhanced emotion data, together with its suggestions
         conversation = Conversation(
             session_id=session['session_id'],
             user_message=user_message,
@@ -88,10 +142,10 @@ def send_message():
             primary_emotion=primary_emotion,
             sentiment_score=sentiment_score
         )
-        db.session.add(conversation)
-        db.session.commit()
+        write_behind.save(suggestions + [conversation])
+        ai_service.remember_turn(session['session_id'], user_message, ai_response, detected_emotions, primary_emotion)
         
-        logging.info(f"Conversation saved successfully: ID {conversation.id}")
+        logging.info(f"Conversation saved successfully ({write_behind.mode} mode)")
         flash('Message sent successfully!', 'success')
         
     except Exception as e:
@@ -121,9 +175,9 @@ def voice_message():
         ai_response, detected_emotions, primary_emotion, sentiment_score = get_ai_response(user_message, session['session_id'])
         
         # Generate suggestions
-        suggestions = suggestion_engine.get_suggestions(session['session_id'], detected_emotions)
+        suggestions = suggestion_engine.get_suggestions(session['session_id'], detected_emotions, user_message=user_message)
         
-        # Save conversation
+        # Save conversation together with its suggestions
         conversation = Conversation(
             session_id=session['session_id'],
             user_message=user_message,
@@ -132,8 +186,8 @@ def voice_message():
             primary_emotion=primary_emotion,
             sentiment_score=sentiment_score
         )
-        db.session.add(conversation)
-        db.session.commit()
+        write_behind.save(suggestions + [conversation])
+        ai_service.remember_turn(session['session_id'], user_message, ai_response, detected_emotions, primary_emotion)
         
         # Format response for JSON
         response_data = {
@@ -141,15 +195,7 @@ def voice_message():
             'emotions': detected_emotions,
             'primary_emotion': primary_emotion,
             'emotion_emoji': get_emotion_emoji(primary_emotion),
-            'suggestions': [
-                {
-                    'type': s.suggestion_type,
-                    'content': s.content,
-                    'title': s.title,
-                    'url': s.url,
-                    'emotion': s.emotion
-                } for s in suggestions
-            ],
+            'suggestions': [suggestion_to_dict(s) for s in suggestions],
             'timestamp': conversation.timestamp.strftime('%I:%M %p')
         }
         
@@ -159,6 +205,241 @@ def voice_message():
         logging.error(f"Error processing voice message: {str(e)}")
         return jsonify({'error': 'Failed to process voice message'}), 500
 
+@app.route('/voice_message/stream', methods=['POST'])
+def voice_message_stream():
+    """Streamed variant of /voice_message as newline-delimited JSON events.
+    
+    Events arrive in order: "response" (base reply and emotions), "follow_up"
+    (coping strategy and encouragement), "suggestions", then "saved" with the
+    persisted timestamp, so the client can start speaking after the first line.
+    """
+    if 'session_id' not in session:
+        return jsonify({'error': 'No session found'}), 400
+    
+    data = request.get_json(silent=True)
+    user_message = data.get('message', '') if isinstance(data, dict) else ''
+    if not isinstance(user_message, str):
+        return jsonify({'error': 'Message must be a string'}), 400
+    user_message = user_message.strip()
+    
+    if not user_message:
+        return jsonify({'error': 'No message provided'}), 400
+    
+    session_id = session['session_id']
+    
+    def event(name, **payload):
+        return json.dumps({'event': name, **payload}) + '\n'
+    
+    def generate():
+        try:
+            logging.info(f"Streaming voice message: {user_message[:50]}... for session: {session_id}")
+            
+            try:
+                ai_response, detected_emotions, primary_emotion, sentiment_score = ai_service.generate_base_response(user_message, session_id)
+            except Exception as e:
+                logging.error(f"Error generating local AI response: {e}")
+                ai_response, detected_emotions, primary_emotion, sentiment_score = ai_service._get_fallback_response(), ['neutral'], 'neutral', 0.0
+            yield event(
+                'response',
+                ai_response=ai_response,
+                emotions=detected_emotions,
+                primary_emotion=primary_emotion,
+                emotion_emoji=get_emotion_emoji(primary_emotion)
+            )
+            
+            follow_up = ai_service.generate_follow_up(primary_emotion, user_message)
+            if follow_up:
+                ai_response += follow_up
+                yield event('follow_up', text=follow_up.strip())
+            
+            suggestions = suggestion_engine.get_suggestions(session_id, detected_emotions, user_message=user_message)
+            yield event('suggestions', suggestions=[suggestion_to_dict(s) for s in suggestions])
+            
+            conversation = Conversation(
+                session_id=session_id,
+                user_message=user_message,
+                ai_response=ai_response,
+                emotions=json.dumps(detected_emotions),
+                primary_emotion=primary_emotion,
+                sentiment_score=sentiment_score
+            )
+            write_behind.save(suggestions + [conversation])
+            ai_service.remember_turn(session_id, user_message, ai_response, detected_emotions, primary_emotion)
+            
+            yield event('saved', timestamp=conversation.timestamp.strftime('%I:%M %p'))
+            
+        except Exception as e:
+            logging.error(f"Error streaming voice message: {str(e)}")
+            yield event('error', error='Failed to process voice message')
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/analyze', methods=['POST'])
+def api_analyze():
+    """Batch emotion and sentiment analysis for a list of messages"""
+    data = request.get_json(silent=True) or {}
+    messages = data.get('messages')
+    
+    if not isinstance(messages, list) or not all(isinstance(m, str) for m in messages):
+        return jsonify({'error': 'Expected a JSON body with a "messages" list of strings'}), 400
+    
+    limit = app.config.get('ANALYZE_BATCH_LIMIT', 1000)
+    if len(messages) > limit:
+        return jsonify({'error': f'At most {limit} messages can be analyzed per request'}), 413
+    
+    try:
+        analyses = ai_service.analyze_batch(messages)
+        sentiments = analyze_batch(messages)
+        
+        results = []
+        for analysis, (compound_score, label) in zip(analyses, sentiments):
+            analysis['emotion_emoji'] = get_emotion_emoji(analysis['primary_emotion'])
+            analysis['sentiment'] = {'compound': compound_score, 'label': label}
+            results.append(analysis)
+        
+        return jsonify({'results': results})
+        
+    except Exception as e:
+        logging.error(f"Error analyzing message batch: {str(e)}")
+        return jsonify({'error': 'Failed to analyze messages'}), 500
+
+@app.route('/api/tts', methods=['POST'])
+def api_tts():
+    """Queue speech synthesis for a text and return the URL of its cached audio"""
+    data = request.get_json(silent=True) or {}
+    text = data.get('text', '')
+    
+    if not isinstance(text, str) or not text.strip():
+        return jsonify({'error': 'No text provided'}), 400
+    
+    max_chars = app.config.get('TTS_MAX_CHARS', 2000)
+    if len(text) > max_chars:
+        return jsonify({'error': f'Text is limited to {max_chars} characters'}), 413
+    
+    rate = data.get('rate')
+    if rate is not None and (isinstance(rate, bool) or not isinstance(rate, int) or not 50 <= rate <= 400):
+        return jsonify({'error': 'rate must be an integer between 50 and 400'}), 400
+    
+    voice = data.get('voice')
+    try:
+        if voice is not None and not tts_service.is_known_voice(voice):
+            return jsonify({'error': 'Unknown voice'}), 400
+        key, future = tts_service.request(text.strip(), voice=voice, rate=rate)
+    except Exception as e:
+        logging.error(f"Error queueing speech synthesis: {str(e)}")
+        return jsonify({'error': 'Failed to synthesize speech'}), 500
+    
+    body = {'key': key, 'url': url_for('tts_audio', key=key), 'ready': future is None}
+    return jsonify(body), 200 if future is None else 202
+
+@app.route('/tts/<key>')
+def tts_audio(key):
+    """Serve synthesized audio from the content-addressed cache"""
+    if not re.fullmatch(r'[0-9a-f]{64}', key):
+        return jsonify({'error': 'Unknown audio'}), 404
+    
+    if tts_service.is_cached(key):
+        # Content-addressed, so the file at this URL never changes
+        return send_file(
+            tts_service.path_for(key),
+            mimetype=tts_service.synthesizer.mimetype,
+            conditional=True,
+            max_age=31536000
+        )
+    
+    if tts_service.is_pending(key):
+        return jsonify({'key': key, 'ready': False}), 202
+    
+    return jsonify({'error': 'Unknown audio'}), 404
+
+@app.route('/api/history')
+def api_history():
+    """Older conversation turns for the current session (keyset paginated)"""
+    if 'session_id' not in session:
+        return jsonify({'error': 'No session found'}), 400
+    
+    before_id = request.args.get('before', type=int)
+    limit = request.args.get('limit', app.config['CHAT_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, 100))
+    
+    conversations, has_more = get_history_page(session['session_id'], before_id, limit)
+    return jsonify({
+        'conversations': [
+            {
+                'id': c.id,
+                'user_message': c.user_message,
+                'ai_response': c.ai_response,
+                'emotions': c.emotion_list,
+                'primary_emotion': c.primary_emotion,
+                'sentiment_score': c.sentiment_score,
+                'timestamp': c.timestamp.isoformat() if c.timestamp else None
+            } for c in conversations
+        ],
+        'html': render_conversation_html(conversations),
+        'has_more': has_more,
+        'next_before': conversations[0].id if conversations else None
+    })
+
+@app.route('/api/export')
+def api_export():
+    """Full history of the current session, streamed as NDJSON or CSV (optionally gzipped)"""
+    if 'session_id' not in session:
+        return jsonify({'error': 'No session found'}), 400
+    
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"Unknown format, expected one of: {', '.join(EXPORT_FORMATS)}"}), 400
+    compress = request.args.get('gzip', '0').lower() in ('1', 'true', 'yes')
+    
+    session_id = session['session_id']
+    chunks = iter_export(iter_records(session_id), export_format, compress)
+    filename = export_filename(session_id, export_format, compress)
+    return Response(
+        stream_with_context(chunks),
+        mimetype='application/gzip' if compress else EXPORT_FORMATS[export_format],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/mood_trends')
+def api_mood_trends():
+    """Daily emotion counts and average sentiment, read from the mood rollups"""
+    scope = request.args.get('scope', 'session')
+    if scope not in ('session', 'global'):
+        return jsonify({'error': "scope must be 'session' or 'global'"}), 400
+    
+    session_id = None
+    if scope == 'session':
+        if 'session_id' not in session:
+            return jsonify({'error': 'No session found'}), 400
+        session_id = session['session_id']
+    
+    # Turns still queued for write-behind (at most WRITE_BEHIND_FLUSH_INTERVAL old) count from the next call
+    days = request.args.get('days', 30, type=int)
+    return jsonify({
+        'scope': scope,
+        'days': mood_rollups.trends(session_id, days)
+    })
+
+@app.route('/api/cache_stats')
+def api_cache_stats():
+    """Hit/miss counters for the in-process caches"""
+    return jsonify({
+        'session_state': session_states.cache.stats(),
+        'message_analysis': ai_service.analysis_cache.stats(),
+        'message_fragments': message_fragment_cache.stats(),
+        'write_behind': write_behind.stats(),
+        'session_activity': activity_tracker.stats()
+    })
+
+@app.route('/api/pipeline_stats')
+def api_pipeline_stats():
+    """Per-stage CPU time of the message analysis pipeline"""
+    return jsonify(ai_service.pipeline.timings.stats())
+
 @app.route('/resources')
 def resources():
     """Crisis resources and mental health information"""
@@ -167,7 +448,10 @@ def resources():
 @app.route('/new_session')
 def new_session():
     """Start a new chat session"""
-    session.pop('session_id', None)
+    old_session_id = session.pop('session_id', None)
+    if old_session_id:
+        ai_service.forget_session(old_session_id)
+        suggestion_rotation.forget(old_session_id)
     return redirect(url_for('chat'))
 
 @app.route('/play_audio')
@@ -1,16 +1,31 @@
-import nltk
-from nltk.sentiment import SentimentIntensityAnalyzer
 import logging
+import threading
 
-# Download required NLTK data
-try:
-    nltk.data.find('vader_lexicon')
-except LookupError:
-    logging.info("Downloading NLTK vader_lexicon...")
-    nltk.download('vader_lexicon', quiet=True)
+_sia = None
+_sia_lock = threading.Lock()
 
-# Initialize sentiment analyzer
-sia = SentimentIntensityAnalyzer()
+def get_analyzer():
+    """Return the shared VADER analyzer, loading NLTK and the lexicon on first use"""
+    global _sia
+    if _sia is None:
+        with _sia_lock:
+            if _sia is None:
+                import nltk
+                from nltk.sentiment import SentimentIntensityAnalyzer
+                
+                # Download required NLTK data
+                try:
+                    nltk.data.find('sentiment/vader_lexicon.zip')
+                except LookupError:
+                    logging.info("Downloading NLTK vader_lexicon...")
+                    nltk.download('vader_lexicon', quiet=True)
+                
+                _sia = SentimentIntensityAnalyzer()
+    return _sia
+
+def warm_up():
+    """Load the VADER analyzer ahead of the first request"""
+    get_analyzer()
 
 def analyze_sentiment(text):
     """
@@ -18,7 +33,7 @@ def analyze_sentiment(text):
     Returns: (sentiment_score, sentiment_label)
     """
     try:
-        scores = sia.polarity_scores(text)
+        scores = get_analyzer().polarity_scores(text)
         compound_score = scores['compound']
         
         # Determine sentiment label based on compound score
@@ -35,6 +50,27 @@ def analyze_sentiment(text):
         logging.error(f"Error analyzing sentiment: {e}")
         return 0.0, 'neutral'
 
+def analyze_batch(texts):
+    """
+    Analyze sentiment of many texts with VADER
+    Returns: list of (sentiment_score, sentiment_label) in input order
+    """
+    import numpy as np
+    
+    compound_scores = np.zeros(len(texts))
+    for i, text in enumerate(texts):
+        try:
+            compound_scores[i] = get_analyzer().polarity_scores(text)['compound']
+        except Exception as e:
+            logging.error(f"Error analyzing sentiment: {e}")
+    
+    labels = np.select(
+        [compound_scores >= 0.05, compound_scores <= -0.05],
+        ['positive', 'negative'],
+        default='neutral'
+    )
+    return list(zip(compound_scores.tolist(), labels.tolist()))
+
 def get_sentiment_emoji(sentiment_label):
     """Get emoji representation of sentiment"""
     emoji_map = {
@@ -0,0 +1,335 @@
+import json
+import logging
+import os
+from array import array
+from datetime import datetime
+
+from sqlalchemy import delete, insert, select, update
+
+from cache import LRUCache
+from emotion_codes import EMOTION_INDEX, EMOTION_VOCABULARY, emotion_mask
+from extensions import db, upsert_insert
+from models import Conversation, SessionState
+
+# Themes tracked per session; append-only, stored weights depend on these positions
+THEME_VOCABULARY = ('work', 'sleep')
+THEME_INDEX = {theme: i for i, theme in enumerate(THEME_VOCABULARY)}
+
+_STATE_COLUMNS = (
+    SessionState.session_id,
+    SessionState.turns,
+    SessionState.emotion_weights,
+    SessionState.theme_weights,
+    SessionState.streak_emotion,
+    SessionState.streak_length
+)
+
+# With the default decay a single mention stays above RECURRING_WEIGHT for
+# five turns (0.85 ** 4 = 0.52), the window personalization used to read;
+# repeated mentions keep a concern recurring for much longer.
+DEFAULT_DECAY = 0.85
+RECURRING_WEIGHT = 0.5
+
+
+def _pack(weights):
+    return array('f', weights).tobytes()
+
+
+def _unpack(blob, size):
+    weights = array('f')
+    weights.frombytes(blob or b'')
+    weights = weights.tolist()[:size]
+    # Vectors written before the vocabulary grew are zero-padded
+    return weights + [0.0] * (size - len(weights))
+
+
+class MoodState:
+    """Decayed emotion/theme weights and the current primary-emotion streak of a session"""
+
+    __slots__ = ('turns', 'emotion_weights', 'theme_weights', 'streak_emotion', 'streak_length')
+
+    def __init__(self, turns=0, emotion_weights=None, theme_weights=None, streak_emotion=None, streak_length=0):
+        self.turns = turns
+        self.emotion_weights = emotion_weights or [0.0] * len(EMOTION_VOCABULARY)
+        self.theme_weights = theme_weights or [0.0] * len(THEME_VOCABULARY)
+        self.streak_emotion = streak_emotion
+        self.streak_length = streak_length
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(
+            row.turns,
+            _unpack(row.emotion_weights, len(EMOTION_VOCABULARY)),
+            _unpack(row.theme_weights, len(THEME_VOCABULARY)),
+            row.streak_emotion,
+            row.streak_length
+        )
+
+    def advanced(self, mask, primary_emotion, themes, decay):
+        """New state after one more turn; constant work whatever the history length"""
+        emotion_weights = [weight * decay for weight in self.emotion_weights]
+        index = 0
+        while mask:
+            if mask & 1:
+                emotion_weights[index] += 1.0
+            mask >>= 1
+            index += 1
+
+        theme_weights = [weight * decay for weight in self.theme_weights]
+        for theme in themes:
+            index = THEME_INDEX.get(theme)
+            if index is not None:
+                theme_weights[index] += 1.0
+
+        if primary_emotion == self.streak_emotion:
+            streak_length = self.streak_length + 1
+        else:
+            streak_length = 1
+        return MoodState(self.turns + 1, emotion_weights, theme_weights, primary_emotion, streak_length)
+
+    def emotion_weight(self, emotion):
+        index = EMOTION_INDEX.get(emotion)
+        return self.emotion_weights[index] if index is not None else 0.0
+
+    def theme_weight(self, theme):
+        index = THEME_INDEX.get(theme)
+        return self.theme_weights[index] if index is not None else 0.0
+
+    def recurring_emotion(self, emotion):
+        return self.emotion_weight(emotion) >= RECURRING_WEIGHT
+
+    def recurring_theme(self, theme):
+        return self.theme_weight(theme) >= RECURRING_WEIGHT
+
+    def values(self, session_id):
+        return {
+            'session_id': session_id,
+            'turns': self.turns,
+            'emotion_weights': _pack(self.emotion_weights),
+            'theme_weights': _pack(self.theme_weights),
+            'streak_emotion': self.streak_emotion,
+            'streak_length': self.streak_length,
+            'updated_at': datetime.utcnow()
+        }
+
+
+class SessionStates:
+    """Keeps one SessionState row per session in step with saved turns.
+
+    Each batch of inserted Conversation rows advances the affected sessions'
+    states in the same transaction (one read and one upsert per session),
+    and request threads write the turn through to an LRU cache of states,
+    so reading the state for personalization is usually a dict lookup.
+
+    This cache replaces the per-session conversation context cache
+    (ai_service.context_cache): its CONTEXT_CACHE_SIZE/CONTEXT_CACHE_TTL
+    settings still apply when the SESSION_STATE_ ones are unset, and its
+    counters are reported as session_state by /api/cache_stats.
+    """
+
+    def __init__(self, app=None, theme_detector=None):
+        self.theme_detector = theme_detector
+        self.decay = DEFAULT_DECAY
+        self.cache = LRUCache(
+            max_size=int(os.environ.get('SESSION_STATE_CACHE_SIZE', os.environ.get('CONTEXT_CACHE_SIZE', 1024))),
+            ttl=float(os.environ.get('SESSION_STATE_CACHE_TTL', os.environ.get('CONTEXT_CACHE_TTL', 900)))
+        )
+        if app is not None:
+            self.init_app(app, theme_detector)
+
+    def init_app(self, app, theme_detector=None):
+        from write_behind import write_behind
+
+        if theme_detector is not None:
+            self.theme_detector = theme_detector
+        self.decay = app.config.setdefault(
+            'SESSION_STATE_DECAY', float(os.environ.get('SESSION_STATE_DECAY', DEFAULT_DECAY))
+        )
+        write_behind.on_insert(Conversation, self.record)
+        app.extensions['session_states'] = self
+
+    def get(self, session_id):
+        """Current MoodState of a session (empty if it has no saved turns)"""
+        cached = self.cache.get(session_id)
+        if cached is not None:
+            return cached
+
+        from write_behind import write_behind
+
+        try:
+            # Turns still queued for write-behind are folded in, without waiting for the writer
+            row, queued, exact = write_behind.read_with_pending(
+                lambda: db.session.execute(
+                    select(*_STATE_COLUMNS).where(SessionState.session_id == session_id)
+                ).first(),
+                Conversation,
+                session_id
+            )
+            state = MoodState.from_row(row) if row is not None else MoodState()
+            for turn in queued:
+                state = self._fold(state, turn.user_message, turn.emotion_mask, turn.emotions, turn.primary_emotion)
+        except Exception as e:
+            logging.error(f"Error loading session state: {e}")
+            return MoodState()
+        if exact:
+            # Otherwise a turn committed during the read may be counted twice
+            self.cache.set(session_id, state)
+        return state
+
+    def remember(self, session_id, emotions, primary_emotion, themes):
+        """Write a just-saved turn through to the cached state of its session"""
+        cached = self.cache.peek(session_id)
+        if cached is None:
+            # Nothing cached; the next read loads the committed state
+            return
+        self.cache.set(session_id, cached.advanced(emotion_mask(*emotions), primary_emotion, themes, self.decay))
+
+    def forget(self, session_id):
+        self.cache.delete(session_id)
+
+    def _themes(self, user_message):
+        return self.theme_detector(user_message) if self.theme_detector and user_message else ()
+
+    def _advance_row(self, state, row):
+        return state.advanced(
+            row.get('emotion_mask') or 0,
+            row.get('primary_emotion'),
+            self._themes(row.get('user_message')),
+            self.decay
+        )
+
+    def record(self, session, rows):
+        """Advance the states of the sessions of newly inserted conversation rows"""
+        rows_by_session = {}
+        for row in rows:
+            rows_by_session.setdefault(row['session_id'], []).append(row)
+
+        states = {
+            stored.session_id: MoodState.from_row(stored)
+            for stored in session.execute(
+                select(*_STATE_COLUMNS).where(SessionState.session_id.in_(list(rows_by_session)))
+            )
+        }
+        values = []
+        for session_id, session_rows in rows_by_session.items():
+            state = states.get(session_id) or MoodState()
+            for row in session_rows:
+                state = self._advance_row(state, row)
+            values.append(state.values(session_id))
+        self._apply(session, values)
+
+    def _fold(self, state, user_message, mask, emotions, primary_emotion):
+        if mask is None:
+            # Row predates the bitmask columns (or lists emotions it cannot hold)
+            mask = emotion_mask(*json.loads(emotions)) if emotions else 0
+        return self._advance_row(state, {
+            'user_message': user_message,
+            'emotion_mask': mask,
+            'primary_emotion': primary_emotion
+        })
+
+    def _archived_states(self):
+        """{session_id: MoodState} over the archived conversation turns (see retention)"""
+        from retention import retention
+
+        states = {}
+        for rows in retention.archived_rows('conversation'):
+            for row in rows:
+                states[row['session_id']] = self._fold(
+                    states.get(row['session_id']) or MoodState(),
+                    row.get('user_message'),
+                    row.get('emotion_mask'),
+                    row.get('emotions'),
+                    row.get('primary_emotion')
+                )
+        return states
+
+    def rebuild(self, chunk_size=10000):
+        """Recompute every session state from the conversation table and its archive in one transaction.
+
+        Archived turns are older than a session's retained ones, so each
+        session starts from the state of its archived turns, then streams
+        its retained turns in (session, timestamp) order; only that one
+        session's retained history is held at a time. Returns the number of
+        states written.
+        """
+        turns = (
+            select(
+                Conversation.session_id,
+                Conversation.user_message,
+                Conversation.emotion_mask,
+                Conversation.emotions,
+                Conversation.primary_emotion
+            )
+            .order_by(Conversation.session_id, Conversation.timestamp, Conversation.id)
+            .execution_options(yield_per=chunk_size)
+        )
+
+        written = 0
+        try:
+            archived = self._archived_states()
+            db.session.execute(delete(SessionState))
+            batch = []
+            current_id = None
+            state = None
+            for session_id, user_message, mask, emotions, primary_emotion in db.session.execute(turns):
+                if session_id != current_id:
+                    if current_id is not None:
+                        batch.append(state.values(current_id))
+                    current_id = session_id
+                    state = archived.pop(session_id, None) or MoodState()
+                state = self._fold(state, user_message, mask, emotions, primary_emotion)
+                if len(batch) >= chunk_size:
+                    db.session.execute(insert(SessionState), batch)
+                    written += len(batch)
+                    batch = []
+
+            if current_id is not None:
+                batch.append(state.values(current_id))
+            # Sessions whose turns are all archived
+            for session_id, archived_state in archived.items():
+                batch.append(archived_state.values(session_id))
+                if len(batch) >= chunk_size:
+                    db.session.execute(insert(SessionState), batch)
+                    written += len(batch)
+                    batch = []
+            if batch:
+                db.session.execute(insert(SessionState), batch)
+                written += len(batch)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        self.cache.clear()
+        return written
+
+    def _apply(self, session, values):
+        if not values:
+            return
+
+        dialect_insert = upsert_insert(session.get_bind().dialect.name)
+        if dialect_insert is not None:
+            statement = dialect_insert(SessionState)
+            statement = statement.on_conflict_do_update(
+                index_elements=['session_id'],
+                set_={
+                    column: statement.excluded[column]
+                    for column in values[0] if column != 'session_id'
+                }
+            )
+            session.execute(statement, values)
+            return
+
+        # Portable fallback: overwrite existing rows, insert the rest
+        for value in values:
+            result = session.execute(
+                update(SessionState)
+                .where(SessionState.session_id == value['session_id'])
+                .values(**{column: value[column] for column in value if column != 'session_id'})
+            )
+            if result.rowcount == 0:
+                session.execute(insert(SessionState), value)
+
+
+# Global instance
+session_states = SessionStates()
@@ -0,0 +1,125 @@
+import logging
+import threading
+from collections import namedtuple
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import SuggestionCatalogEntry
+
+CatalogEntry = namedtuple('CatalogEntry', ['id', 'emotion', 'suggestion_type', 'content', 'title', 'url'])
+
+# suggestions_db pool name -> suggestion_type of its items
+SUGGESTION_TYPES = {'quotes': 'quote', 'techniques': 'technique', 'resources': 'resource'}
+
+# Titles shown with items that are plain strings in suggestions_db
+DEFAULT_TITLES = {'quote': 'Inspirational Quote', 'technique': 'Coping Technique'}
+
+
+def catalog_items(suggestions_db):
+    """(emotion, suggestion_type, content, title, url) of every suggestions_db item, in order"""
+    for emotion, kinds in suggestions_db.items():
+        for pool, items in kinds.items():
+            suggestion_type = SUGGESTION_TYPES.get(pool, pool)
+            for item in items:
+                if isinstance(item, dict):
+                    # Resources are saved with their description as the content
+                    yield emotion, suggestion_type, item['description'], item.get('title'), item.get('url')
+                else:
+                    yield emotion, suggestion_type, item, DEFAULT_TITLES.get(suggestion_type), None
+
+
+class SuggestionCatalog:
+    """In-process copy of the suggestion_catalog table.
+
+    load() inserts the suggestions_db items the table does not have yet
+    (existing entries keep their ids) and caches every entry, so resolving
+    a Suggestion row's catalog_id is a dict lookup.
+    """
+
+    def __init__(self, app=None, pools=None):
+        self.pools = pools
+        self._by_id = {}
+        self._by_key = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, pools)
+
+    def init_app(self, app, pools=None):
+        if pools is not None:
+            self.pools = pools
+        app.extensions['suggestion_catalog'] = self
+
+    def load(self):
+        """Seed missing entries and (re)read the whole catalog"""
+        with self._lock:
+            self._seed()
+            self._read()
+
+    def get(self, catalog_id):
+        """CatalogEntry for an id"""
+        entry = self._by_id.get(catalog_id)
+        if entry is None:
+            # Added by another process since this one read the catalog
+            with self._lock:
+                self._read()
+            entry = self._by_id.get(catalog_id)
+        return entry
+
+    def entry_for(self, emotion, suggestion_type, content):
+        """CatalogEntry of a suggestions_db item"""
+        key = (emotion, suggestion_type, content)
+        entry = self._by_key.get(key)
+        if entry is None:
+            self.load()
+            entry = self._by_key.get(key)
+        return entry
+
+    def entries(self):
+        return list(self._by_id.values())
+
+    def _seed(self):
+        existing = set(db.session.execute(
+            select(SuggestionCatalogEntry.emotion, SuggestionCatalogEntry.suggestion_type, SuggestionCatalogEntry.content)
+        ).tuples())
+        missing = []
+        for emotion, suggestion_type, content, title, url in catalog_items(self.pools or {}):
+            if (emotion, suggestion_type, content) not in existing:
+                existing.add((emotion, suggestion_type, content))
+                missing.append({
+                    'emotion': emotion,
+                    'suggestion_type': suggestion_type,
+                    'content': content,
+                    'title': title,
+                    'url': url
+                })
+        if not missing:
+            return
+        try:
+            db.session.execute(insert(SuggestionCatalogEntry), missing)
+            db.session.commit()
+            logging.info(f"Added {len(missing)} suggestion catalog entries")
+        except IntegrityError:
+            # Another worker seeded the same entries first
+            db.session.rollback()
+
+    def _read(self):
+        entries = [
+            CatalogEntry(*row) for row in db.session.execute(
+                select(
+                    SuggestionCatalogEntry.id,
+                    SuggestionCatalogEntry.emotion,
+                    SuggestionCatalogEntry.suggestion_type,
+                    SuggestionCatalogEntry.content,
+                    SuggestionCatalogEntry.title,
+                    SuggestionCatalogEntry.url
+                )
+            )
+        ]
+        self._by_key = {(entry.emotion, entry.suggestion_type, entry.content): entry for entry in entries}
+        self._by_id = {entry.id: entry for entry in entries}
+
+
+# Global instance
+suggestion_catalog = SuggestionCatalog()
@@ -1,6 +1,9 @@
 import random
 import logging
-from models import Suggestion, db
+from models import Suggestion
+from suggestion_catalog import suggestion_catalog
+from suggestion_rotation import suggestion_rotation
+from write_behind import write_behind
 
 class SuggestionEngine:
     def __init__(self):
@@ -173,8 +176,8 @@ class SuggestionEngine:
             }
         }
     
-    def get_suggestions(self, session_id, emotions, limit=3):
-        """Get personalized suggestions based on detected emotions"""
+    def get_suggestions(self, session_id, emotions, limit=3, user_message=None):
+        """Get personalized suggestions based on detected emotions (most relevant to user_message first)"""
         try:
             suggestions = []
             
@@ -184,59 +187,54 @@ class SuggestionEngine:
                     
                     # Add a quote
                     if 'quotes' in emotion_suggestions:
-                        quote = random.choice(emotion_suggestions['quotes'])
-                        suggestions.append(self._create_suggestion(
-                            session_id, emotion, 'quote', quote, 'Inspirational Quote'
-                        ))
+                        quote = self._next_item(session_id, emotion, 'quotes', user_message)
+                        suggestions.append(self._create_suggestion(session_id, emotion, 'quote', quote))
                     
                     # Add a technique
                     if 'techniques' in emotion_suggestions:
-                        technique = random.choice(emotion_suggestions['techniques'])
-                        suggestions.append(self._create_suggestion(
-                            session_id, emotion, 'technique', technique, 'Coping Technique'
-                        ))
+                        technique = self._next_item(session_id, emotion, 'techniques', user_message)
+                        suggestions.append(self._create_suggestion(session_id, emotion, 'technique', technique))
                     
                     # Add a resource
                     if 'resources' in emotion_suggestions and random.random() < 0.5:
-                        resource = random.choice(emotion_suggestions['resources'])
-                        suggestions.append(self._create_suggestion(
-                            session_id, emotion, 'resource', 
-                            resource['description'], resource['title'], resource['url']
-                        ))
+                        resource = self._next_item(session_id, emotion, 'resources', user_message)
+                        suggestions.append(self._create_suggestion(session_id, emotion, 'resource', resource['description']))
             
             # Limit number of suggestions
-            return suggestions[:limit]
+            suggestions = suggestions[:limit]
+            suggestion_rotation.mark(session_id, suggestions)
+            return suggestions
             
         except Exception as e:
             logging.error(f"Error getting suggestions: {e}")
             return []
     
-    def _create_suggestion(self, session_id, emotion, suggestion_type, content, title=None, url=None):
-        """Create and save a suggestion to the database"""
-        suggestion = Suggestion(
+    def _next_item(self, session_id, emotion, pool, user_message):
+        """Most relevant item of a pool that the session has not been shown in this rotation"""
+        items = self.suggestions_db[emotion][pool]
+        return items[suggestion_rotation.choose(session_id, emotion, pool, items, user_message)]
+    
+    def _create_suggestion(self, session_id, emotion, suggestion_type, content):
+        """Create a suggestion pointing at its catalog entry; the caller persists it together with its conversation turn"""
+        return Suggestion(
             session_id=session_id,
-            emotion=emotion,
-            suggestion_type=suggestion_type,
-            content=content,
-            title=title,
-            url=url
+            entry=suggestion_catalog.entry_for(emotion, suggestion_type, content)
         )
-        
-        try:
-            db.session.add(suggestion)
-            db.session.commit()
-        except Exception as e:
-            logging.error(f"Error saving suggestion: {e}")
-            db.session.rollback()
-        
-        return suggestion
     
     def get_recent_suggestions(self, session_id, limit=5):
-        """Get recent suggestions for a session"""
+        """Get recent suggestions for a session; their texts come from the cached catalog"""
         try:
-            return Suggestion.query.filter_by(
-                session_id=session_id
-            ).order_by(Suggestion.timestamp.desc()).limit(limit).all()
+            recent, queued, _ = write_behind.read_with_pending(
+                lambda: Suggestion.query.filter_by(
+                    session_id=session_id
+                ).order_by(Suggestion.timestamp.desc()).limit(limit).all(),
+                Suggestion,
+                session_id
+            )
+            # Still-queued suggestions are the newest; skip any committed during the read
+            saved = {(suggestion.timestamp, suggestion.catalog_id) for suggestion in recent}
+            queued = [suggestion for suggestion in reversed(queued) if (suggestion.timestamp, suggestion.catalog_id) not in saved]
+            return (queued + recent)[:limit]
         except Exception as e:
             logging.error(f"Error getting recent suggestions: {e}")
             return []
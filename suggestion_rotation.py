@@ -0,0 +1,210 @@
+import hashlib
+import logging
+import os
+
+from sqlalchemy import insert, select, update
+
+from cache import LRUCache
+from extensions import db, upsert_insert
+from models import Suggestion, UserSession
+from retrieval import retrieval_index
+from suggestion_catalog import SUGGESTION_TYPES, suggestion_catalog
+
+
+def _content(item):
+    # Resources are saved with their description as the content
+    return item['description'] if isinstance(item, dict) else item
+
+
+class SuggestionRotation:
+    """Shows every suggestion of a pool once before any of them repeats.
+
+    Each (emotion, pool) of suggestions_db owns a contiguous range of bits
+    in one integer per session; a set bit means the item was shown in the
+    current rotation. Picking masks out the shown items, and once the last
+    unseen item of a pool is shown the pool starts over (keeping only that
+    item marked, so it is not picked again straight away).
+
+    Bitsets are cached per session and persisted on the session's
+    UserSession row in the same transaction that saves its suggestions.
+    """
+
+    def __init__(self, app=None, pools=None):
+        self.pools = {}
+        self.size = 0
+        self.layout = None
+        self._bits = {}
+        self._pool_masks = []
+        self.cache = LRUCache(
+            max_size=int(os.environ.get('SUGGESTION_ROTATION_CACHE_SIZE', 1024)),
+            ttl=float(os.environ.get('SUGGESTION_ROTATION_CACHE_TTL', 900))
+        )
+        if app is not None:
+            self.init_app(app, pools)
+
+    def init_app(self, app, pools=None):
+        from write_behind import write_behind
+
+        if pools is not None:
+            self.index(pools)
+        write_behind.on_insert(Suggestion, self.record)
+        app.extensions['suggestion_rotation'] = self
+
+    def index(self, suggestions_db):
+        """Assign bit ranges to every pool of suggestions_db"""
+        pools = {}
+        bits = {}
+        pool_masks = []
+        digest = hashlib.sha256()
+        for emotion, kinds in suggestions_db.items():
+            for pool, items in kinds.items():
+                offset = len(pool_masks)
+                pools[(emotion, pool)] = (offset, len(items))
+                pool_mask = ((1 << len(items)) - 1) << offset
+                for i, item in enumerate(items):
+                    content = _content(item)
+                    bits[(emotion, SUGGESTION_TYPES.get(pool, pool), content)] = offset + i
+                    pool_masks.append(pool_mask)
+                    digest.update(f'{emotion}\0{pool}\0{content}\0'.encode('utf-8'))
+        self.pools = pools
+        self._bits = bits
+        self._pool_masks = pool_masks
+        self.size = len(pool_masks)
+        self.layout = digest.hexdigest()[:16]
+        self.cache.clear()
+
+    def choose(self, session_id, emotion, pool, options, text=None):
+        """Position in options of the next suggestion: the most relevant item not shown yet"""
+        group = f'{emotion}:{pool}'
+        span = self.pools.get((emotion, pool))
+        if span is None or span[1] != len(options):
+            return retrieval_index.choose_position(text, 'suggestion', group, len(options))
+
+        offset, size = span
+        shown = self.shown(session_id) >> offset
+        unseen = [i for i in range(size) if not (shown >> i) & 1]
+        return retrieval_index.choose_position(text, 'suggestion', group, size, unseen or None)
+
+    def shown(self, session_id):
+        """Bitset of the suggestions shown to a session in the current rotation"""
+        cached = self.cache.get(session_id)
+        if cached is not None:
+            return cached
+
+        from write_behind import write_behind
+
+        try:
+            # Suggestions still queued for write-behind are marked too, without waiting for the writer
+            row, queued, exact = write_behind.read_with_pending(
+                lambda: db.session.execute(
+                    select(UserSession.shown_suggestions, UserSession.suggestion_layout)
+                    .where(UserSession.session_id == session_id)
+                ).first(),
+                Suggestion,
+                session_id
+            )
+            shown = self._decode(*row) if row is not None else 0
+            shown = self._advance(shown, [
+                (suggestion.emotion, suggestion.suggestion_type, suggestion.content) for suggestion in queued
+            ])
+        except Exception as e:
+            logging.error(f"Error loading shown suggestions: {e}")
+            return 0
+        if exact:
+            # Otherwise a suggestion committed during the read may be applied twice
+            self.cache.set(session_id, shown)
+        return shown
+
+    def mark(self, session_id, suggestions):
+        """Write suggestions just handed to a session through to its cached bitset"""
+        cached = self.cache.peek(session_id)
+        if cached is None:
+            # Nothing cached; the next read loads the committed bitset
+            return
+        self.cache.set(session_id, self._advance(cached, [
+            (suggestion.emotion, suggestion.suggestion_type, suggestion.content) for suggestion in suggestions
+        ]))
+
+    def forget(self, session_id):
+        self.cache.delete(session_id)
+
+    def record(self, session, rows):
+        """Persist the bitsets of the sessions of newly inserted suggestion rows"""
+        if not self.size:
+            return
+        rows_by_session = {}
+        for row in rows:
+            entry = suggestion_catalog.get(row['catalog_id'])
+            if entry is not None:
+                rows_by_session.setdefault(row['session_id'], []).append(
+                    (entry.emotion, entry.suggestion_type, entry.content)
+                )
+
+        stored = {
+            session_id: self._decode(shown, layout)
+            for session_id, shown, layout in session.execute(
+                select(UserSession.session_id, UserSession.shown_suggestions, UserSession.suggestion_layout)
+                .where(UserSession.session_id.in_(list(rows_by_session)))
+            )
+        }
+        values = [
+            {
+                'session_id': session_id,
+                'shown_suggestions': self._encode(self._advance(stored.get(session_id, 0), keys)),
+                'suggestion_layout': self.layout
+            }
+            for session_id, keys in rows_by_session.items()
+        ]
+        self._apply(session, values)
+
+    def _advance(self, shown, keys):
+        for key in keys:
+            bit = self._bits.get(key)
+            if bit is None:
+                continue
+            shown |= 1 << bit
+            pool_mask = self._pool_masks[bit]
+            if shown & pool_mask == pool_mask:
+                # Every item of the pool has been shown: start a new rotation
+                shown = (shown & ~pool_mask) | (1 << bit)
+        return shown
+
+    def _encode(self, shown):
+        return shown.to_bytes((self.size + 7) // 8, 'little')
+
+    def _decode(self, blob, layout):
+        # Bitsets written for another layout (suggestions_db changed) start over
+        if not blob or layout != self.layout:
+            return 0
+        return int.from_bytes(blob, 'little')
+
+    def _apply(self, session, values):
+        if not values:
+            return
+
+        dialect_insert = upsert_insert(session.get_bind().dialect.name)
+        if dialect_insert is not None:
+            statement = dialect_insert(UserSession)
+            statement = statement.on_conflict_do_update(
+                index_elements=['session_id'],
+                set_={
+                    'shown_suggestions': statement.excluded.shown_suggestions,
+                    'suggestion_layout': statement.excluded.suggestion_layout
+                }
+            )
+            session.execute(statement, values)
+            return
+
+        # Portable fallback: update existing sessions, insert the rest
+        for value in values:
+            result = session.execute(
+                update(UserSession)
+                .where(UserSession.session_id == value['session_id'])
+                .values(shown_suggestions=value['shown_suggestions'], suggestion_layout=value['suggestion_layout'])
+            )
+            if result.rowcount == 0:
+                session.execute(insert(UserSession), value)
+
+
+# Global instance
+suggestion_rotation = SuggestionRotation()
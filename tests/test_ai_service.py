@@ -0,0 +1,60 @@
+import pytest
+
+from ai_service import LocalAIService
+
+MESSAGES = [
+    "hi",
+    "I'm so angry and sad.",
+    "Burned out",
+    "feeling anxious and I can't sleep",
+    "I feel so lonely since I moved here",
+    "Thank you, I feel a bit calmer now :)",
+    "not happy at all",
+    "I'm stressed about work, really stressed",
+    "I want to die",
+    "so excited :D",
+]
+
+
+def variants(message):
+    yield message
+    yield message.upper()
+    yield message.lower()
+    yield f"  {message}  "
+    yield message.replace(' ', '   ')
+    yield message.replace(' ', '\n')
+    yield message + '.'
+    yield message + '!!!'
+    yield message + ' ...'
+
+
+CORPUS = [variant for message in MESSAGES for variant in variants(message)]
+
+
+@pytest.fixture(scope='module')
+def service():
+    return LocalAIService()
+
+
+def as_dict(analysis):
+    emotions, primary_emotion, sentiment_score, is_crisis = analysis
+    return {'emotions': emotions, 'primary_emotion': primary_emotion, 'sentiment_score': sentiment_score, 'crisis': is_crisis}
+
+
+@pytest.mark.parametrize('message', CORPUS)
+def test_analyze_batch_matches_single_analysis(service, message):
+    service.analysis_cache.clear()
+    emotions, primary_emotion, sentiment_score, is_crisis, _ = service._analyze(message)
+    assert service.analyze_batch([message])[0] == as_dict((list(emotions), primary_emotion, sentiment_score, is_crisis))
+
+
+def test_analyze_batch_matches_memoized_analysis(service):
+    service.analysis_cache.clear()
+    expected = [as_dict(service.analyze_message(message)) for message in CORPUS]
+    # Second pass answers from the memo
+    assert [as_dict(service.analyze_message(message)) for message in CORPUS] == expected
+    assert service.analyze_batch(CORPUS) == expected
+
+
+def test_detect_emotions_batch_matches_detect_emotions(service):
+    assert service.detect_emotions_batch(CORPUS) == [service.detect_emotions(message) for message in CORPUS]
@@ -0,0 +1,40 @@
+from cache import LRUCache
+from session_state import MoodState, SessionStates
+
+
+def test_lru_cache_counts_hits_misses_and_evictions():
+    cache = LRUCache(max_size=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)  # evicts b, the least recently used
+
+    assert cache.get('b') is None
+    assert cache.peek('c') == 3
+    assert cache.stats() == {'size': 2, 'max_size': 2, 'hits': 1, 'misses': 1, 'evictions': 1, 'hit_rate': 0.5}
+
+
+def test_lru_cache_expires_entries(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('cache.time.monotonic', lambda: now[0])
+    cache = LRUCache(ttl=10)
+    cache.set('a', 1)
+    now[0] += 11
+
+    assert cache.peek('a') is None
+    assert cache.get('a') is None
+
+
+def test_session_state_cache_writes_turns_through():
+    states = SessionStates()
+    states.cache.set('s1', MoodState())
+
+    states.remember('s1', ['anxiety', 'stress'], 'anxiety', frozenset(['work']))
+    state = states.get('s1')
+    assert state.turns == 1
+    assert state.recurring_emotion('anxiety') and state.recurring_theme('work')
+    assert states.cache.stats()['hits'] == 1
+
+    # Nothing cached: the next read loads the committed state instead
+    states.remember('s2', ['anxiety'], 'anxiety', frozenset())
+    assert states.cache.peek('s2') is None
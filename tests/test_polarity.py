@@ -0,0 +1,41 @@
+import pytest
+
+textblob = pytest.importorskip('textblob')
+
+from benchmarks.polarity_equivalence import (
+    ABS_TOLERANCE, CHAT_MESSAGES, MIN_EXACT_SHARE, app_texts, bucket, generated_texts
+)
+from polarity import polarity_scorer
+
+TEXTS = app_texts() + CHAT_MESSAGES + generated_texts(1000)
+CORPUS = TEXTS + [text.lower() for text in TEXTS]
+
+
+@pytest.fixture(scope='module')
+def expected():
+    return {text: textblob.TextBlob(text).sentiment.polarity for text in CORPUS}
+
+
+@pytest.mark.parametrize('text', CHAT_MESSAGES + [text.lower() for text in CHAT_MESSAGES])
+def test_chat_messages_match_textblob(text, expected):
+    assert polarity_scorer.score(text) == pytest.approx(expected[text], abs=ABS_TOLERANCE)
+
+
+def test_corpus_within_documented_tolerance(expected):
+    mismatches = [
+        text for text in CORPUS
+        if abs(polarity_scorer.score(text) - expected[text]) > ABS_TOLERANCE
+    ]
+    assert 1 - len(mismatches) / len(CORPUS) >= MIN_EXACT_SHARE, mismatches[:10]
+
+
+def test_corpus_keeps_backup_emotion(expected):
+    mismatches = [
+        text for text in CORPUS
+        if bucket(polarity_scorer.score(text)) != bucket(expected[text])
+    ]
+    assert mismatches == []
+
+
+def test_batch_matches_single():
+    assert polarity_scorer.score_batch(CORPUS) == [polarity_scorer.score(text) for text in CORPUS]
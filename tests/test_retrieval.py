@@ -0,0 +1,49 @@
+from collections import Counter
+
+import pytest
+
+pytest.importorskip('sklearn')
+
+from retrieval import RetrievalIndex
+
+DOCUMENTS = [
+    ('response', 'anxiety', 'anxious about work today'),
+    ('response', 'anxiety', 'anxious about work deadlines'),
+    ('response', 'anxiety', 'anxious'),
+    ('response', 'anxiety', 'birthday cake'),
+]
+
+
+@pytest.fixture
+def index():
+    return RetrievalIndex(documents=lambda: DOCUMENTS)
+
+
+def picks(index, text, candidates=None, times=200):
+    return Counter(
+        index.choose_position(text, 'response', 'anxiety', len(DOCUMENTS), candidates) for _ in range(times)
+    )
+
+
+def test_indptr_stays_an_array(index):
+    index.load()
+    assert hasattr(index.indptr, 'dtype')
+
+
+def test_clear_best_always_wins(index):
+    assert set(picks(index, 'anxious about work today')) == {0}
+
+
+def test_near_ties_are_picked_at_random(index):
+    # Scores 0.71, 0.71, 0.63: the third is outside the default 10% margin
+    assert set(picks(index, 'anxious about work')) == {0, 1}
+    index.tie_margin = 0.2
+    assert set(picks(index, 'anxious about work')) == {0, 1, 2}
+
+
+def test_only_candidates_are_picked(index):
+    assert set(picks(index, 'anxious about work', [2, 3])) == {2}
+
+
+def test_no_match_is_random(index):
+    assert set(picks(index, 'sleepless night')) == {0, 1, 2, 3}
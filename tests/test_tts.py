@@ -0,0 +1,92 @@
+import os
+
+import pytest
+from flask import Flask
+
+from tts import SilentSynthesizer, TTSService
+
+
+def make_service(cache_dir, **config):
+    app = Flask(__name__)
+    app.config.update(TTS_SYNTHESIZER='silent', TTS_CACHE_DIR=str(cache_dir), **config)
+    return TTSService(app)
+
+
+@pytest.fixture
+def service(tmp_path):
+    return make_service(tmp_path)
+
+
+def audio_size(directory, text):
+    """Size of the silent audio for text, rendered outside any cache"""
+    path = str(directory / 'size.wav')
+    SilentSynthesizer().synthesize(text, path)
+    return os.path.getsize(path)
+
+
+def test_miss_then_hit(service):
+    key, future = service.request("Take a slow breath")
+    assert future is not None
+    assert future.result() == service.path_for(key)
+    assert service.is_cached(key)
+    assert not service.is_pending(key)
+
+    assert service.request("Take a slow breath") == (key, None)
+
+
+def test_hit_marks_audio_recently_used(service):
+    key, future = service.request("Take a slow breath")
+    future.result()
+    os.utime(service.path_for(key), (0, 0))
+
+    service.request("Take a slow breath")
+    assert os.path.getmtime(service.path_for(key)) > 0
+
+
+def test_key_depends_on_voice_and_rate(service):
+    key = service.audio_key("Take a slow breath")
+    assert service.audio_key("Take a slow breath", rate=150) == key
+    assert service.audio_key("Take a slow breath", rate=200) != key
+    assert service.audio_key("Take a slow breath", voice='other') != key
+
+
+def test_evicts_least_recently_used_at_cap(tmp_path):
+    texts = [f"message number {i} " + "word " * 40 for i in range(4)]
+    size = audio_size(tmp_path, texts[0])
+    service = make_service(tmp_path / 'cache', TTS_CACHE_MAX_BYTES=size * 3)
+
+    keys = []
+    for i, text in enumerate(texts[:3]):
+        key, future = service.request(text)
+        future.result()
+        os.utime(service.path_for(key), (i + 1, i + 1))
+        keys.append(key)
+    # A hit makes the oldest entry the most recently used
+    assert service.request(texts[0]) == (keys[0], None)
+
+    key, future = service.request(texts[3])
+    future.result()
+
+    assert service.is_cached(key)
+    assert service.is_cached(keys[0])
+    assert not service.is_cached(keys[1])
+    total = sum(entry[1] for entry in service._cache_entries())
+    assert total <= size * 3
+
+
+def test_unbounded_cache_never_evicts(tmp_path):
+    service = make_service(tmp_path, TTS_CACHE_MAX_BYTES=0)
+    paths = [service.render(f"message number {i}") for i in range(5)]
+    assert all(os.path.exists(path) for path in paths)
+
+
+@pytest.mark.parametrize('voice', ['unknown', '', None, 1, ['default']])
+def test_rejects_unknown_voice(service, voice):
+    assert not service.is_known_voice(voice)
+
+
+def test_accepts_synthesizer_voice(service):
+    assert service.is_known_voice('default')
+    key, future = service.request("Take a slow breath", voice='default')
+    future.result()
+    assert service.is_cached(key)
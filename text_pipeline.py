@@ -0,0 +1,170 @@
+import threading
+import time
+
+from emotion_matcher import EmotionMatcher
+from polarity import polarity_scorer, tokenize
+
+CRISIS = 'crisis'
+THEME_PREFIX = 'theme:'
+
+
+def analysis_key(text):
+    """Memo key of a message; messages with the same key analyze identically.
+
+    Only spaces around the message are dropped: keyword matches treat the
+    ends of the text like a space and polarity tokens split on whitespace.
+    Folding case, inner whitespace or punctuation would not be safe, as it
+    changes keyword weights ("sad." vs "sad"), multi-word keywords
+    ("burned  out") and emoticon tokens (":D" vs ":d").
+    """
+    return text.strip(' ')
+
+
+class AnalyzedText:
+    """One message, shared by every analysis stage.
+
+    keywords holds the result of the single lexicon scan of the lowercased
+    text ({keyword: weight}, see EmotionMatcher.find_keywords) and is all
+    the crisis, emotion and theme stages read. tokens are split on first
+    use, the way the polarity lexicon expects (see polarity.tokenize), and
+    only polarity reads them: keywords also match inside words (weight 1)
+    and span several words ("burned out"), which token lookups would not
+    reproduce.
+    """
+
+    __slots__ = ('text', 'keywords', '_tokens')
+
+    def __init__(self, text, keywords):
+        self.text = text
+        self.keywords = keywords
+        self._tokens = None
+
+    @property
+    def tokens(self):
+        """Lowercased tokens of the text"""
+        if self._tokens is None:
+            self._tokens = [token.lower() for token, _, _ in tokenize(self.text)]
+        return self._tokens
+
+
+class StageTimings:
+    """Cumulative wall time and call counts per pipeline stage"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {}
+
+    def record(self, stage, seconds, count=1):
+        with self._lock:
+            totals = self._totals.setdefault(stage, [0, 0.0])
+            totals[0] += count
+            totals[1] += seconds
+
+    def reset(self):
+        with self._lock:
+            self._totals = {}
+
+    def stats(self):
+        with self._lock:
+            totals = {stage: list(values) for stage, values in self._totals.items()}
+        return {
+            stage: {
+                'calls': calls,
+                'total_ms': round(seconds * 1000, 3),
+                'mean_us': round(seconds / calls * 1e6, 2) if calls else 0.0
+            }
+            for stage, (calls, seconds) in totals.items()
+        }
+
+
+class TextPipeline:
+    """Scans each message once for all keyword-based stages.
+
+    Emotion, crisis and theme keywords are compiled into one EmotionMatcher,
+    so a single left-to-right scan of the lowercased text yields every hit;
+    the crisis, emotion and theme stages only look up the keywords found
+    and never rescan the text.
+    The polarity stage scores the document's tokens against the compiled
+    polarity lexicon.
+    """
+
+    def __init__(self, emotion_keywords, crisis_keywords, theme_keywords):
+        # Emotions come first so their columns (and tie order) match a plain emotion matcher
+        lexicon = dict(emotion_keywords)
+        lexicon[CRISIS] = list(crisis_keywords)
+        for theme, keywords in theme_keywords.items():
+            lexicon[THEME_PREFIX + theme] = list(keywords)
+        self.matcher = EmotionMatcher(lexicon)
+        self.emotion_names = list(emotion_keywords)
+        self.crisis_column = self.matcher._emotion_order[CRISIS]
+        self.timings = StageTimings()
+
+        # keyword -> (counts towards crisis, emotions, themes)
+        self._roles = {}
+        for keyword, categories in self.matcher.keyword_emotions.items():
+            self._roles[keyword] = (
+                CRISIS in categories,
+                [category for category in categories if category in emotion_keywords],
+                [category[len(THEME_PREFIX):] for category in categories if category.startswith(THEME_PREFIX)]
+            )
+
+    def analyze(self, text):
+        """Scan a message once"""
+        started = time.perf_counter()
+        keywords = self.matcher.find_keywords(text.lower())
+        self.timings.record('scan', time.perf_counter() - started)
+        return AnalyzedText(text, keywords)
+
+    def is_crisis(self, doc):
+        started = time.perf_counter()
+        crisis = any(self._roles[keyword][0] for keyword in doc.keywords)
+        self.timings.record('crisis', time.perf_counter() - started)
+        return crisis
+
+    def emotions(self, doc):
+        """Emotions found in the message, highest score first"""
+        started = time.perf_counter()
+        scores = {}
+        for keyword, weight in doc.keywords.items():
+            for emotion in self._roles[keyword][1]:
+                scores[emotion] = scores.get(emotion, 0) + weight
+        ranked = self.matcher.rank(scores)
+        self.timings.record('emotions', time.perf_counter() - started)
+        return ranked
+
+    def themes(self, doc):
+        """Recurring-concern themes ("work", "sleep") mentioned in the message"""
+        started = time.perf_counter()
+        themes = set()
+        for keyword in doc.keywords:
+            themes.update(self._roles[keyword][2])
+        self.timings.record('themes', time.perf_counter() - started)
+        return frozenset(themes)
+
+    def polarity(self, doc):
+        """Polarity in [-1, 1] of the message"""
+        started = time.perf_counter()
+        polarity = polarity_scorer.score_tokens(doc.tokens)
+        self.timings.record('polarity', time.perf_counter() - started)
+        return polarity
+
+    def polarity_batch(self, texts):
+        """Polarities of many messages, each as polarity() scores it"""
+        started = time.perf_counter()
+        polarities = polarity_scorer.score_batch(texts)
+        self.timings.record('polarity', time.perf_counter() - started, count=len(texts))
+        return polarities
+
+    def score_batch(self, texts):
+        """One scan over a whole batch: (crisis flags, n_texts x n_emotions scores).
+
+        Texts are lowercased and matched exactly as analyze() matches one
+        message, so batch and single results agree.
+        """
+        started = time.perf_counter()
+        scores = self.matcher.score_batch(texts)
+        self.timings.record('scan', time.perf_counter() - started, count=len(texts))
+        return scores[:, self.crisis_column] > 0, scores[:, :len(self.emotion_names)]
+
+    def rank_batch(self, emotion_scores):
+        return self.matcher.rank_batch(emotion_scores)
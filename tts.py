@@ -0,0 +1,244 @@
+import hashlib
+import logging
+import os
+import threading
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Pyttsx3Synthesizer:
+    """Offline speech synthesis with pyttsx3, rendered to audio files"""
+
+    name = 'pyttsx3'
+    extension = 'wav'
+    mimetype = 'audio/wav'
+
+    def __init__(self):
+        # pyttsx3 shares one engine per driver and its loop is not re-entrant
+        self._lock = threading.Lock()
+        self._engine = None
+
+    def _get_engine(self):
+        if self._engine is None:
+            import pyttsx3
+            self._engine = pyttsx3.init()
+        return self._engine
+
+    def voices(self):
+        """Ids of the voices installed for the engine"""
+        with self._lock:
+            return [voice.id for voice in self._get_engine().getProperty('voices')]
+
+    def synthesize(self, text, path, voice=None, rate=150):
+        with self._lock:
+            engine = self._get_engine()
+            engine.setProperty('rate', rate)  # Speed
+            engine.setProperty('volume', 1)  # Volume (0.0 to 1.0)
+            voices = engine.getProperty('voices')
+            if voice:
+                engine.setProperty('voice', voice)
+            elif len(voices) > 1:
+                engine.setProperty('voice', voices[1].id)  # Usually female at index 1
+            engine.save_to_file(text, path)
+            engine.runAndWait()
+
+
+class SilentSynthesizer:
+    """Stand-in synthesizer that writes silent WAV audio sized to the text.
+
+    Used on machines without speech/audio support (tests, CI) so the cache
+    and endpoints can run without pyttsx3 drivers.
+    """
+
+    name = 'silent'
+    extension = 'wav'
+    mimetype = 'audio/wav'
+
+    def voices(self):
+        return ['default']
+
+    def synthesize(self, text, path, voice=None, rate=150):
+        frame_rate = 8000
+        seconds = max(len(text.split()) / max(rate, 1) * 60, 0.1)
+        with wave.open(path, 'wb') as audio:
+            audio.setnchannels(1)
+            audio.setsampwidth(1)
+            audio.setframerate(frame_rate)
+            audio.writeframes(b'\x80' * int(frame_rate * seconds))
+
+
+SYNTHESIZERS = {
+    'pyttsx3': Pyttsx3Synthesizer,
+    'silent': SilentSynthesizer
+}
+
+
+class TTSService:
+    """Renders speech off the request thread into a content-addressed audio cache"""
+
+    def __init__(self, app=None):
+        self.synthesizer = None
+        self.cache_dir = None
+        self.default_rate = 150
+        self._executor = None
+        self._executor_pid = None
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._voices = None
+        self.max_cache_bytes = None
+        self._cache_bytes = None
+        self._evict_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        synthesizer = app.config.setdefault('TTS_SYNTHESIZER', os.environ.get('TTS_SYNTHESIZER', 'pyttsx3'))
+        if synthesizer not in SYNTHESIZERS:
+            raise ValueError(f"TTS_SYNTHESIZER must be one of {sorted(SYNTHESIZERS)}, not {synthesizer!r}")
+        self.synthesizer = SYNTHESIZERS[synthesizer]()
+        self.cache_dir = app.config.setdefault(
+            'TTS_CACHE_DIR', os.environ.get('TTS_CACHE_DIR', os.path.join(app.instance_path, 'tts_cache'))
+        )
+        self.default_rate = app.config.setdefault('TTS_RATE', int(os.environ.get('TTS_RATE', 150)))
+        self.workers = app.config.setdefault('TTS_WORKERS', int(os.environ.get('TTS_WORKERS', 1)))
+        # 0 leaves the audio cache unbounded
+        self.max_cache_bytes = app.config.setdefault(
+            'TTS_CACHE_MAX_BYTES', int(os.environ.get('TTS_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+        )
+        app.extensions['tts'] = self
+
+    def audio_key(self, text, voice=None, rate=None):
+        """Content hash identifying the audio for (text, voice, rate)"""
+        rate = rate or self.default_rate
+        source = f"{self.synthesizer.name}\0{voice or 'default'}\0{rate}\0{text}"
+        return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.{self.synthesizer.extension}")
+
+    def is_cached(self, key):
+        return os.path.exists(self.path_for(key))
+
+    def voices(self):
+        """Voice ids the synthesizer accepts, read once per process"""
+        if self._voices is None:
+            self._voices = frozenset(self.synthesizer.voices())
+        return self._voices
+
+    def is_known_voice(self, voice):
+        return isinstance(voice, str) and voice in self.voices()
+
+    def is_pending(self, key):
+        with self._lock:
+            return key in self._pending
+
+    def request(self, text, voice=None, rate=None):
+        """Return (key, future) for the audio, queueing synthesis on a cache miss.
+
+        future is None when the audio is already cached.
+        """
+        rate = rate or self.default_rate
+        key = self.audio_key(text, voice, rate)
+        if self._touch(key):
+            return key, None
+
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None:
+                future = self._get_executor().submit(self._render, key, text, voice, rate)
+                self._pending[key] = future
+        return key, future
+
+    def render(self, text, voice=None, rate=None):
+        """Synthesize (if needed) and wait; returns the cached file path"""
+        key, future = self.request(text, voice, rate)
+        if future is not None:
+            future.result()
+        return self.path_for(key)
+
+    def _get_executor(self):
+        # Worker threads do not survive fork, so each process builds its own pool
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='tts')
+            self._executor_pid = os.getpid()
+        return self._executor
+
+    def _render(self, key, text, voice, rate):
+        path = self.path_for(key)
+        # Keep the extension on the temp file; some pyttsx3 drivers pick the format from it
+        tmp_path = f"{path[:-len(self.synthesizer.extension) - 1]}.{os.getpid()}.{threading.get_ident()}.tmp.{self.synthesizer.extension}"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.synthesizer.synthesize(text, tmp_path, voice=voice, rate=rate)
+            os.replace(tmp_path, path)
+            self._track(os.path.getsize(path))
+            return path
+        except Exception as e:
+            logging.error(f"Error synthesizing speech: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def _touch(self, key):
+        """Mark cached audio as just used (its mtime orders eviction); False if it is not cached"""
+        try:
+            os.utime(self.path_for(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _cache_entries(self):
+        """(mtime, size, path) of every cached audio file"""
+        entries = []
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if '.tmp.' in name:
+                    # Still being rendered
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _track(self, size):
+        """Count newly rendered audio; once over TTS_CACHE_MAX_BYTES evict the least recently used files.
+
+        The running total only counts this process's renders, so the
+        directory is rescanned (picking up other workers' files) before
+        evicting down to 90% of the limit.
+        """
+        if not self.max_cache_bytes:
+            return
+        with self._evict_lock:
+            if self._cache_bytes is None:
+                self._cache_bytes = sum(entry[1] for entry in self._cache_entries())
+            else:
+                self._cache_bytes += size
+            if self._cache_bytes <= self.max_cache_bytes:
+                return
+
+            entries = sorted(self._cache_entries())
+            total = sum(entry[1] for entry in entries)
+            target = self.max_cache_bytes * 0.9
+            evicted = 0
+            for _, entry_size, path in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= entry_size
+                evicted += 1
+            self._cache_bytes = total
+            logging.info(f"Evicted {evicted} cached audio files")
+
+
+# Global instance
+tts_service = TTSService()
@@ -45,13 +45,47 @@ document.addEventListener('DOMContentLoaded', () => {
         voiceBtn.classList.remove('active');
         console.log('Voice recognition stopped.');
         
-        // If there is a final transcript, submit the form
+        // If there is a final transcript, send it
         if (final_transcript.trim()) {
-            messageInput.value = final_transcript; // Ensure the final text is in the input
-            chatForm.submit(); // Automatically send the message
+            if (window.MindfulChat && window.ReadableStream) {
+                sendStreamedVoiceMessage(final_transcript.trim());
+            } else {
+                messageInput.value = final_transcript; // Ensure the final text is in the input
+                chatForm.submit(); // Automatically send the message
+            }
         }
     };
 
+    // Stream the reply so speech starts as soon as the base response arrives;
+    // fall back to a normal form submission if streaming fails
+    const sendStreamedVoiceMessage = (message) => {
+        const chat = window.MindfulChat;
+        let aiBubble = null;
+
+        messageInput.value = '';
+        chat.appendMessageBubble('user', message);
+
+        chat.streamVoiceMessage(message, {
+            response: (data) => {
+                aiBubble = chat.appendMessageBubble('ai', data.ai_response);
+                chat.speakQueued(data.ai_response);
+            },
+            follow_up: (data) => {
+                if (aiBubble) aiBubble.textContent += `\n\n${data.text}`;
+                chat.speakQueued(data.text);
+            },
+            error: (data) => chat.showNotification(data.error, 'danger')
+        }).catch((error) => {
+            console.error('Streaming voice message failed:', error);
+            if (aiBubble) {
+                chat.showNotification('Connection interrupted while saving your message', 'warning');
+            } else {
+                messageInput.value = message;
+                chatForm.submit();
+            }
+        });
+    };
+
     // When an error occurs
     recognition.onerror = (event) => {
         if (event.error === 'no-speech') {
@@ -0,0 +1,269 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from sqlalchemy import insert
+
+from extensions import db
+
+_STOP = object()
+
+
+def _row(obj):
+    """Column values of a model instance, without its autoincrement primary key"""
+    return {
+        column.key: getattr(obj, column.key)
+        for column in obj.__table__.columns
+        if not column.primary_key
+    }
+
+
+class WriteBehindWriter:
+    """Persists Conversation/Suggestion inserts either inline or in batches.
+
+    In ``sync`` mode ``save`` inserts and commits before returning, one
+    transaction per request. In ``batched`` mode it only enqueues the rows;
+    a background thread groups everything queued by many requests into one
+    bulk INSERT transaction, trading a short durability window for far
+    fewer commits (each of which is an fsync on SQLite).
+
+    Request threads never wait for that thread: read_with_pending() pairs a
+    database read with the instances still queued, so a page or a cached
+    state can include a turn saved a moment ago.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.mode = 'sync'
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._enqueued = 0
+        self._written = 0
+        # Instances saved but not yet committed, by unit number
+        self._pending = {}
+        self._committing = 0
+        self._commit_generation = 0
+        self.batches = 0
+        self.rows_written = 0
+        self.errors = 0
+        self._insert_hooks = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.mode = app.config.setdefault('PERSISTENCE_MODE', os.environ.get('PERSISTENCE_MODE', 'sync'))
+        if self.mode not in ('sync', 'batched'):
+            raise ValueError(f"PERSISTENCE_MODE must be 'sync' or 'batched', not {self.mode!r}")
+        self.max_queue = app.config.setdefault('WRITE_BEHIND_QUEUE_SIZE', int(os.environ.get('WRITE_BEHIND_QUEUE_SIZE', 10000)))
+        self.batch_size = app.config.setdefault('WRITE_BEHIND_BATCH_SIZE', int(os.environ.get('WRITE_BEHIND_BATCH_SIZE', 500)))
+        self.flush_interval = app.config.setdefault('WRITE_BEHIND_FLUSH_INTERVAL', float(os.environ.get('WRITE_BEHIND_FLUSH_INTERVAL', 0.05)))
+        app.extensions['write_behind'] = self
+        atexit.register(self.shutdown)
+
+    def save(self, objects):
+        """Persist new model instances as one unit (all or nothing)"""
+        rows = [(type(obj), _row(obj)) for obj in objects]
+        if not rows:
+            return
+
+        if self.mode == 'sync':
+            self._commit(rows)
+            return
+
+        self._ensure_thread()
+        with self._cond:
+            self._enqueued += 1
+            number = self._enqueued
+            self._pending[number] = list(objects)
+        try:
+            self._queue.put((number, rows), timeout=1.0)
+        except queue.Full:
+            # Backpressure: the writer is behind, so this request pays for its own commit
+            logging.warning("Write-behind queue full; writing synchronously")
+            self._begin_commit()
+            try:
+                self._commit(rows)
+            finally:
+                self._end_commit([number])
+
+    def on_insert(self, model, callback):
+        """Call callback(session, rows) in the same transaction as inserts of model.
+
+        rows are the inserted column-value dicts; used to keep derived tables
+        (such as rollups) consistent with the rows they summarize.
+        """
+        self._insert_hooks.setdefault(model, []).append(callback)
+
+    def read_with_pending(self, read, model, session_id, attempts=3):
+        """Run read() against the database; never waits for the writer.
+
+        Returns (read() result, instances of model for session_id saved but
+        not yet committed, oldest first, exact). exact is False when a batch
+        was committed while read() ran: an instance may then be both in the
+        result and in the pending list, so callers should not cache it.
+        """
+        if self.mode == 'sync':
+            return read(), [], True
+
+        for _ in range(attempts):
+            with self._cond:
+                generation = self._commit_generation
+                idle = not self._committing
+                pending = self._pending_instances(model, session_id)
+            result = read()
+            with self._cond:
+                if idle and generation == self._commit_generation:
+                    return result, pending, True
+        return result, pending, False
+
+    def _pending_instances(self, model, session_id):
+        if self._pid != os.getpid():
+            # Forked worker: the parent's queue is not ours to report
+            return []
+        return [
+            obj
+            for objects in self._pending.values()
+            for obj in objects
+            if type(obj) is model and obj.session_id == session_id
+        ]
+
+    def sync(self, timeout=2.0):
+        """Wait until everything enqueued so far has been written (maintenance jobs; requests use read_with_pending)"""
+        if self.mode == 'sync':
+            return True
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            target = self._enqueued
+            while self._written < target:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def shutdown(self, timeout=10.0):
+        """Flush the queue and stop the writer thread"""
+        thread = self._thread
+        if thread is None or not thread.is_alive() or self._pid != os.getpid():
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+        if thread.is_alive():
+            logging.error(f"Write-behind writer did not finish within {timeout}s; {self._queue.qsize()} batches unwritten")
+
+    def stats(self):
+        return {
+            'mode': self.mode,
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+            'batches': self.batches,
+            'rows_written': self.rows_written,
+            'errors': self.errors
+        }
+
+    def _ensure_thread(self):
+        # Started lazily, and restarted in a forked worker (threads do not survive fork)
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.max_queue)
+            self._pending = {}
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            unit = self._queue.get()
+            if unit is _STOP:
+                break
+
+            # Group commit: gather whatever else arrives within the flush interval
+            batch = [unit]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    unit = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if unit is _STOP:
+                    stopping = True
+                    break
+                batch.append(unit)
+
+            self._write_batch(batch)
+
+        # Drain anything enqueued after the stop marker
+        remaining = []
+        while True:
+            try:
+                unit = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if unit is not _STOP:
+                remaining.append(unit)
+        if remaining:
+            self._write_batch(remaining)
+
+    def _write_batch(self, batch):
+        self._begin_commit()
+        try:
+            with self.app.app_context():
+                try:
+                    self._commit([row for _, rows in batch for row in rows])
+                    self.batches += 1
+                except Exception as e:
+                    logging.error(f"Write-behind batch of {len(batch)} failed, retrying individually: {e}")
+                    for _, rows in batch:
+                        try:
+                            self._commit(rows)
+                        except Exception as e:
+                            self.errors += 1
+                            logging.error(f"Dropping unwritable write-behind unit: {e}")
+                finally:
+                    db.session.remove()
+        finally:
+            self._end_commit([number for number, _ in batch])
+
+    def _commit(self, rows):
+        """Bulk insert (model, values) rows in one transaction, one executemany per model"""
+        by_model = {}
+        for model, values in rows:
+            by_model.setdefault(model, []).append(values)
+        try:
+            for model, values in by_model.items():
+                db.session.execute(insert(model), values)
+                for callback in self._insert_hooks.get(model, ()):
+                    callback(db.session, values)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        self.rows_written += len(rows)
+
+    def _begin_commit(self):
+        with self._cond:
+            self._committing += 1
+            self._commit_generation += 1
+
+    def _end_commit(self, numbers):
+        with self._cond:
+            for number in numbers:
+                self._pending.pop(number, None)
+            self._committing -= 1
+            self._commit_generation += 1
+            self._written += len(numbers)
+            self._cond.notify_all()
+
+
+# Global instance
+write_behind = WriteBehindWriter()